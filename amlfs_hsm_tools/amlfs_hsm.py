@@ -1,22 +1,93 @@
+import collections
 import os
 import logging
-import time
+import zlib
 
-from .lustreapi_hsm import get_hsm_state, set_hsm_state
-from .lfs_blob_client import LFSBlobClient
+from .lustreapi_hsm import get_hsm_flags_and_archive_id, get_hsm_state, set_hsm_state
 from .lustre_hsm_constants import HSM_ARCHIVED_STATE, HSM_DIRTY_STATE, HSM_LOST_STATE, HSM_RELEASED_STATE, \
-                                HUA_ARCHIVE, HUA_REMOVE, HUA_RELEASE, HUA_RESTORE
-from .utilities import get_relative_path
-from .lustreapi_hsm import hsm_request
+                                HUA_ARCHIVE, HUA_REMOVE, HUA_RELEASE, HUA_RESTORE, HSM_STATE_FLAGS
+from .blob_index import BlobIndex, blob_record, DEFAULT_MTIME_METADATA_KEY
+from .hsm_state_cache import FIDCache, HSMStateCache, DEFAULT_STATE_CACHE_TTL
+from .hsm_completion import CompletionTracker, DEFAULT_MAX_INTERVAL
+from .backends import BackendRouter
+from .pipeline import ordered_map
+from .utilities import get_relative_path, loadConfiguration, file_md5, DEFAULT_CONFIGURATION_FILE
+from .lustreapi_hsm import hsm_request, hsm_request_batch, hsm_request_fids, DEFAULT_HSM_BATCH_SIZE
+from .lustreapi import path2fid, format_fid
+from .throttle import RateController, hsm_congested
 
-from azure.core.exceptions import ResourceNotFoundError
+
+MTIME_TOLERANCE = 1.0
+# States set with a single call on the files found missing or different on the HSM backend
+DIRTY_AND_LOST_STATES = [HSM_DIRTY_STATE, HSM_LOST_STATE]
+DEFAULT_HSM_MAX_IN_FLIGHT = 8
 
 
 class AzureManagedLustreHSM:
-    """This class contains the basic functionality to wrap liblustreapi for safe AMLFS HSM operations
+    """This class contains the basic functionality to wrap liblustreapi for safe AMLFS HSM operations.
+    It is meant to be instantiated once per process: configuration, credentials and the blob connection
+    pools of the HSM backends are shared by all the actions run through it. Blob operations and archive
+    requests are routed to the backend of the archive ID of each file. The blob clients, and with them
+    the Azure SDK, are loaded only when an action first needs a blob backend.
     """
-    def __init__(self) -> None:
-        self.client = LFSBlobClient()
+    def __init__(self, configurationFile=DEFAULT_CONFIGURATION_FILE, client=None, stateCacheTTL=DEFAULT_STATE_CACHE_TTL, clients=None) -> None:
+        self.configuration = loadConfiguration(configurationFile)
+        self.backends = BackendRouter(self.configuration, client, clients)
+        self.stateCache = HSMStateCache(path2fid, stateCacheTTL)
+        self.fidCache = FIDCache()
+        self.journal = None
+        self.mtimeMetadataKey = self.configuration.get('mtimeMetadataKey', DEFAULT_MTIME_METADATA_KEY)
+        self.verifySample = 0.0
+        self.hsmController = RateController('hsm_request', hsm_congested,
+                                            self.configuration.get('hsmMaxInFlight', DEFAULT_HSM_MAX_IN_FLIGHT))
+
+    @property
+    def client(self):
+        """Blob client of the default HSM backend, built on first use
+
+        Returns:
+            (LFSBlobClient): the blob client
+        """
+        return self.backends.default.client
+
+    def getHSMBackend(self, filePath, archiveId=None):
+        """Returns the HSM backend of a file: the one of its archive ID if it was archived, the one its blob
+        name is routed to by prefix otherwise. With a single backend, the HSM state is not read.
+
+        Args:
+            filePath (str): absolute file path on the file system
+            archiveId (int, optional): archive ID already read for the file with getHSMStatus. Defaults to reading it.
+
+        Raises:
+            IOError: if the HSM state of the file cannot be read
+            KeyError: if no backend serves the archive ID of the file
+
+        Returns:
+            (HSMBackend): the backend of the file
+        """
+        if len(self.backends) == 1:
+            return self.backends.default
+        if archiveId is None:
+            _, archiveId = self.getHSMStatus(filePath)
+        if archiveId:
+            return self.backends.get(archiveId)
+        return self.backends.forBlob(get_relative_path(filePath))
+
+    def requestArchiveId(self, action, filePath):
+        """Returns the archive ID of an HSM request on a file. Only archive requests carry one, the coordinator
+        serves the other actions from the archive the file is in. With a single backend, files are archived
+        in the coordinator default archive.
+
+        Args:
+            action (str): action name from HSM constants
+            filePath (str): absolute file path on the file system
+
+        Returns:
+            int: archive ID of the request, 0 for the coordinator default
+        """
+        if action != HUA_ARCHIVE or len(self.backends) == 1:
+            return 0
+        return self.getHSMBackend(filePath).archiveId
 
     @staticmethod
     def getHSMState(filePath):
@@ -38,8 +109,54 @@ class AzureManagedLustreHSM:
             logging.error('Failed in getting hsm_state correctly. Please check the file status.')
             raise error  
 
+    def getHSMStatus(self, filePath, cached=True):
+        """Returns the HSM state bitmask and the archive ID of a file, fetched with a single call and decoded
+        as a single snapshot. If the state cache is enabled, a recent snapshot of the same FID is reused.
+
+        Args:
+            filePath (str): file path to check.
+            cached (bool, optional): if the state cache may be used. Defaults to True.
+
+        Raises:
+            error: if the get state fails, it raises the related error
+
+        Returns:
+            tuple[int, int]: The Lustre HSM state bitmask of the filePath and its archive ID, 0 if never archived
+        """
+        try:
+            if cached:
+                return self.stateCache.get(filePath, get_hsm_flags_and_archive_id)
+            return get_hsm_flags_and_archive_id(filePath)
+        except Exception as error:
+            logging.error('Failed in getting hsm_state correctly. Please check the file status.')
+            raise error
+
+    def getHSMFlags(self, filePath, cached=True):
+        """Returns the HSM state bitmask of a file, as getHSMStatus
+
+        Args:
+            filePath (str): file path to check.
+            cached (bool, optional): if the state cache may be used. Defaults to True.
+
+        Returns:
+            int: The Lustre HSM state bitmask of the filePath
+        """
+        return self.getHSMStatus(filePath, cached)[0]
+
     @staticmethod
-    def runHSMAction(action, filePath):
+    def hasHSMState(flags, state):
+        """Checks if a state is set in an HSM state bitmask
+
+        Args:
+            flags (int): HSM state bitmask
+            state (str): state from HSM constants
+
+        Returns:
+            bool: True if the state is set
+        """
+        return bool(flags & HSM_STATE_FLAGS[state])
+
+    def runHSMAction(self, action, filePath):
         """Runs a specified HSM action on a file
 
         Args:
@@ -50,138 +167,414 @@ class AzureManagedLustreHSM:
             bool: True if action is successful, False if it fails
         """
         try:
-            hsm_request(filePath, action)
+            archiveId = self.requestArchiveId(action, filePath)
+            fid = self.fidCache.pop(filePath)
+            self.hsmController.call(lambda: hsm_request(filePath, action, archiveId, fid))
             return True
         except Exception as error:
             logging.error('LFS command failed with error {}. '.format(str(error)))
             return False
-        
-    
-    def getBlobClient(self, filePath):
-        """Returns a blob client pointing to the filepath in the Blob backend.
+        finally:
+            self.stateCache.invalidate(filePath)
+
+    def runHSMActionBatch(self, action, filePaths, batchSize=DEFAULT_HSM_BATCH_SIZE, fids=None):
+        """Runs a specified HSM action on many files, grouping them in multi-file HSM requests. Files archived
+        to different backends are requested separately, with the requests of each archive ID run in parallel.
+
+        Args:
+            action (str): Name describing the action according to HSM defined constants
+            filePaths (iterable[str]): file paths of the files on which the action should be triggered
+            batchSize (int, optional): maximum number of files per HSM request. Defaults to 1000.
+            fids (list[lu_fid], optional): FIDs of the files, if already known, in the same order.
+                Defaults to the ones kept in the FID cache, the other files are looked up.
+
+        Returns:
+            list[str]: the file paths for which the action failed
+        """
+        filePaths = list(filePaths)
+        failures = {}
+        groups = collections.defaultdict(list)
+        for filePath, fid in zip(filePaths, fids if fids is not None else map(self.fidCache.pop, filePaths)):
+            try:
+                groups[self.requestArchiveId(action, filePath)].append((filePath, fid))
+            except (IOError, KeyError) as error:
+                failures[filePath] = error
+
+        def submit(group):
+            archiveId, items = group
+            known = [(filePath, fid) for filePath, fid in items if fid is not None]
+            unknown = [filePath for filePath, fid in items if fid is None]
+            groupFailures = hsm_request_fids(known, action, batchSize, archiveId, self.hsmController) if known else {}
+            if unknown:
+                groupFailures.update(hsm_request_batch(unknown, action, batchSize, archiveId, self.hsmController))
+            return groupFailures
+
+        if len(groups) > 1:
+            for _, groupFailures in ordered_map(submit, groups.items(), len(groups)):
+                failures.update(groupFailures)
+        else:
+            for group in groups.items():
+                failures.update(submit(group))
+        for filePath in filePaths:
+            self.stateCache.invalidate(filePath)
+        for filePath, error in failures.items():
+            logging.error('LFS command failed on file {} with error {}. '.format(filePath, str(error)))
+        return list(failures)
+
+    def getBlobClient(self, blobName, backend=None):
+        """Returns a blob client pointing to a blob in an HSM backend.
 
         Args:
-            filePath (str): filePath for which the blob client is requested.
+            blobName (str): blob name for which the blob client is requested.
+            backend (HSMBackend, optional): backend of the blob. Defaults to the default backend.
 
         Returns:
-            (LustreBlobClient): Lustre blob client pointing to the target file path
+            (LustreBlobClient): Lustre blob client pointing to the target blob
         """
-        return self.client.get_blob_client(container=self.client.containerName, blob=filePath)
+        return (backend or self.backends.default).getBlobClient(blobName)
     
+    def getBlobProperties(self, blobName, backend=None):
+        """Returns the properties of a blob in an HSM container
+
+        Args:
+            blobName (str): blob name in the container
+            backend (HSMBackend, optional): backend of the blob. Defaults to the default backend.
+
+        Returns:
+            (BlobProperties): the blob properties, None if the blob does not exist
+        """
+        from azure.core.exceptions import ResourceNotFoundError
+
+        backend = backend or self.backends.default
+        try:
+            return backend.controller.call(backend.getBlobClient(blobName).get_blob_properties)
+        except ResourceNotFoundError:
+            return None
+
+    def loadBlobIndex(self, prefix='', records=False):
+        """Lists the HSM containers once, in parallel, and keeps an index of the blob names of each
+        backend, so that isFileOnHSM can answer without one request per file.
+
+        Args:
+            prefix (str, optional): blob name prefix to be listed. Defaults to the whole containers.
+            records (bool, optional): if size, times and MD5 of the blobs are kept for verify. Defaults to False.
+
+        Returns:
+            dict[int, BlobIndex]: the loaded blob indexes, by archive ID
+        """
+        def load(backend):
+            backend.blobIndex = BlobIndex.from_container(backend.getContainerClient(), prefix, records, self.mtimeMetadataKey,
+                                                        backend.controller)
+            return backend.blobIndex
+
+        return {backend.archiveId: blobIndex for backend, blobIndex in ordered_map(load, list(self.backends), len(self.backends))}
+
+    def loadBlobInventory(self, path, prefix='', records=False, reportTime=None, archiveId=None):
+        """Builds the blob index of an HSM backend from an Azure Blob Inventory report of its container instead
+        of listing it. Files changed after the report time are checked against the container.
+
+        Args:
+            path (str): inventory report file, or directory with the report files and manifest
+            prefix (str, optional): only blobs under this prefix are indexed. Defaults to ''.
+            records (bool, optional): if size, last modified time and MD5 of the blobs are kept for verify. Defaults to False.
+            reportTime (float | str, optional): time the report reflects. Defaults to the manifest time or the last blob modification.
+            archiveId (int, optional): archive ID of the backend the report is of. Defaults to the default backend.
+
+        Returns:
+            (BlobIndex): the loaded blob index
+        """
+        from .inventory import BlobInventory
+
+        backend = self.backends.default if archiveId is None else self.backends.get(archiveId)
+        inventory = BlobInventory(path, backend.client.containerName, reportTime)
+        backend.blobIndex = BlobIndex.from_inventory(inventory, prefix, records)
+        return backend.blobIndex
+
+    def isIndexed(self, filePath, blobName, backend=None):
+        """Checks if the blob index of the backend of a file can answer for it: its blob was indexed and,
+        if the index is as of an inventory report, the file did not change after the report
+
+        Args:
+            filePath (str): file path on the file system
+            blobName (str): blob name of the file
+            backend (HSMBackend, optional): backend of the file. Defaults to the one it is routed to.
+
+        Returns:
+            bool: True if the blob of the file is in the index and can be trusted
+        """
+        blobIndex = (backend or self.getHSMBackend(filePath)).blobIndex
+        if blobIndex is None or blobName not in blobIndex:
+            return False
+        if blobIndex.asOf is None:
+            return True
+        try:
+            return blobIndex.isCurrent(os.stat(filePath))
+        except OSError:
+            return False
+
+    def getBlobRecord(self, blobName, filePath, backend=None):
+        """Returns size, times and MD5 of a blob, from the blob index if it holds them and can answer
+        for the file, from the HSM container otherwise
+
+        Args:
+            blobName (str): blob name in the container
+            filePath (str): file path of the blob on the file system
+            backend (HSMBackend, optional): backend of the file. Defaults to the one it is routed to.
+
+        Returns:
+            (BlobRecord): the blob record, None if the blob does not exist
+        """
+        backend = backend or self.getHSMBackend(filePath)
+        if backend.blobIndex is not None and backend.blobIndex.hasRecords() and self.isIndexed(filePath, blobName, backend):
+            return backend.blobIndex.record(blobName)
+        properties = self.getBlobProperties(blobName, backend)
+        return blob_record(properties, self.mtimeMetadataKey) if properties is not None else None
+
+    def enableAsyncBlobs(self, concurrency=None):
+        """Routes blob existence checks of batched actions through an asyncio blob engine per backend.
+        It requires the aiohttp package.
+
+        Args:
+            concurrency (int, optional): maximum number of concurrent blob requests per backend. Defaults to
+                the asyncConcurrency configuration value of each backend or 64.
+
+        Returns:
+            dict[int, AsyncBlobEngine]: the asyncio blob engines, by archive ID
+        """
+        from .async_blob_engine import AsyncBlobEngine, DEFAULT_ASYNC_CONCURRENCY
+
+        for backend in self.backends:
+            if backend.asyncEngine is None:
+                backend.asyncEngine = AsyncBlobEngine(backend.client.accountURL, backend.client.containerName,
+                                                      concurrency or backend.configuration.get('asyncConcurrency', DEFAULT_ASYNC_CONCURRENCY),
+                                                      credential=backend.credential)
+        return {backend.archiveId: backend.asyncEngine for backend in self.backends}
+
+    def close(self):
+        self.backends.close()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
     def callActionAndWaitStatus(self, action, filePath, targetAddStates, targetRemoveStates, interval=1):
         if self.runHSMAction(action, filePath):
-            while (targetRemoveStates and any(state in self.getHSMState(filePath) for state in targetRemoveStates)) \
-                  or (targetAddStates and not all(state in self.getHSMState(filePath) for state in targetAddStates)):
-                time.sleep(interval)
+            tracker = self.completionTracker(minInterval=interval, maxInterval=max(interval, DEFAULT_MAX_INTERVAL))
+            tracker.watch(filePath, targetAddStates, targetRemoveStates)
+            tracker.wait()
+
+    def completionTracker(self, **kwargs):
+        """Returns a tracker waiting for the completion of HSM actions on many files, reading states
+        without the state cache
 
-    def fileNeedsArchive(self, filePath):
+        Returns:
+            (CompletionTracker): the completion tracker
+        """
+        return CompletionTracker(**kwargs)
+
+    def fileNeedsArchive(self, filePath, flags=None):
         """Returns if a file needs archival. This may be for two reasons:
         - File is not archived
         - File is marked as distry and lost
 
         Args:
             filePath (str): File path of the file on which to perform the HSM action 
+            flags (int, optional): HSM state bitmask already read for the file. Defaults to reading it.
 
         Returns:
             bool: True if ile needs archive, False if file doesn't need archive.
         """
-        return (self.isFileDirty(filePath) and self.isFileLost(filePath)) or not self.isFileArchived(filePath)
+        if flags is None:
+            flags = self.getHSMFlags(filePath)
+        return (self.hasHSMState(flags, HSM_DIRTY_STATE) and self.hasHSMState(flags, HSM_LOST_STATE)) \
+               or not self.hasHSMState(flags, HSM_ARCHIVED_STATE)
     
-    def isFileOnHSM(self, filePath):
+    def isFileOnHSM(self, filePath, backend=None):
         """Checks on the blob backend if there is a file in the correct position on HSM.
 
         Args:
             filePath (str): file path on the file system
+            backend (HSMBackend, optional): backend of the file. Defaults to the one it is routed to.
 
         Returns:
             bool: describing if file is on the backend
         """
-        isFileOnHSM = self.getBlobClient(get_relative_path(filePath)).exists()
+        blobName = get_relative_path(filePath)
+        backend = backend or self.getHSMBackend(filePath)
+        if self.isIndexed(filePath, blobName, backend):
+            isFileOnHSM = True
+        else:
+            # Blobs missing from the index are confirmed live, they may have been archived after the listing,
+            # as well as the ones of files changed after the inventory report the index was built from
+            properties = self.getBlobProperties(blobName, backend)
+            isFileOnHSM = properties is not None
+            if self.journal is not None and isFileOnHSM:
+                self.journal.record(filePath, blob_size=properties.size, blob_etag=properties.etag)
         if isFileOnHSM:
             logging.info('File {} seems to be present on HSM location.'.format(filePath))
         else:
             logging.info('File {} is not on HSM in the expected position.'.format(filePath))
         return isFileOnHSM
 
-    def isFileReleased(self, filePath):
+    def areFilesOnHSM(self, filePaths, backends=None):
+        """Checks on the blob backends if many files are in the correct position on HSM. Files not found in the
+        blob index of their backend are checked concurrently through the asyncio engine if enabled, one by one
+        otherwise, with the backends checked in parallel.
+
+        Args:
+            filePaths (list[str]): file paths on the file system
+            backends (dict[str, HSMBackend], optional): filled with the backend of each file
+
+        Returns:
+            dict[str, bool]: if each file is on the backend, None if the check failed
+        """
+        blobNames = {filePath: get_relative_path(filePath) for filePath in filePaths}
+        presence = {}
+        missing = collections.defaultdict(list)
+        for filePath, blobName in blobNames.items():
+            try:
+                backend = self.getHSMBackend(filePath)
+            except (IOError, KeyError) as error:
+                logging.error('Failed in finding the HSM backend of file {}: {}'.format(filePath, str(error)))
+                presence[filePath] = None
+                continue
+            if backends is not None:
+                backends[filePath] = backend
+            if self.isIndexed(filePath, blobName, backend):
+                presence[filePath] = True
+            else:
+                missing[backend].append(filePath)
+
+        def check(backend):
+            if backend.asyncEngine is not None:
+                exists = backend.asyncEngine.exists_many(blobNames[filePath] for filePath in missing[backend])
+                return {filePath: exists[blobNames[filePath]] for filePath in missing[backend]}
+            return {filePath: backend.controller.call(backend.getBlobClient(blobNames[filePath]).exists) for filePath in missing[backend]}
+
+        for _, backendPresence in ordered_map(check, list(missing), max(1, len(missing))):
+            presence.update(backendPresence)
+        return presence
+
+    def journalFile(self, absolutePath, isFileOnHSM):
+        """Records in the journal, if any, the FID, the HSM state and the blob presence of a checked file
+
+        Args:
+            absolutePath (str): absolute file path on the file system
+            isFileOnHSM (bool): if the file was found on the HSM backend
+        """
+        if self.journal is None:
+            return
+        try:
+            self.journal.record(absolutePath, fid=format_fid(path2fid(absolutePath)),
+                                hsm_flags=self.getHSMFlags(absolutePath), blob_present=isFileOnHSM)
+        except IOError as error:
+            logging.error('Failed in journaling file {}: {}'.format(absolutePath, str(error)))
+            self.journal.record(absolutePath, blob_present=isFileOnHSM)
+
+    def isFileReleased(self, filePath, flags=None):
         """Checks if file is releaed
 
         Args:
             filePath (str): file path on the file system
+            flags (int, optional): HSM state bitmask already read for the file. Defaults to reading it.
 
         Returns:
             bool: describing if the state is released
         """
-        fileStatus = self.getHSMState(filePath)
-        return HSM_RELEASED_STATE in fileStatus
+        if flags is None:
+            flags = self.getHSMFlags(filePath)
+        return self.hasHSMState(flags, HSM_RELEASED_STATE)
     
-    def isFileArchived(self, filePath):
+    def isFileArchived(self, filePath, flags=None):
         """Checks if file is archived
 
         Args:
             filePath (str): file path on the file system
+            flags (int, optional): HSM state bitmask already read for the file. Defaults to reading it.
 
         Returns:
             bool: describing if the state is archived
         """
-        fileStatus = self.getHSMState(filePath)
-        return HSM_ARCHIVED_STATE in fileStatus
+        if flags is None:
+            flags = self.getHSMFlags(filePath)
+        return self.hasHSMState(flags, HSM_ARCHIVED_STATE)
     
-    def isFileDirty(self, filePath):
+    def isFileDirty(self, filePath, flags=None):
         """Checks if file is dirty
 
         Args:
             filePath (str): file path on the file system
+            flags (int, optional): HSM state bitmask already read for the file. Defaults to reading it.
 
         Returns:
             bool: describing if the state is dirty
         """
-        fileStatus = self.getHSMState(filePath)
-        return HSM_DIRTY_STATE in fileStatus
+        if flags is None:
+            flags = self.getHSMFlags(filePath)
+        return self.hasHSMState(flags, HSM_DIRTY_STATE)
     
-    def isFileLost(self, filePath):
+    def isFileLost(self, filePath, flags=None):
         """Checks if file is lost
 
         Args:
             filePath (str): file path on the file system
+            flags (int, optional): HSM state bitmask already read for the file. Defaults to reading it.
 
         Returns:
             bool: describing if the state is lost
         """
-        fileStatus = self.getHSMState(filePath)
-        return HSM_LOST_STATE in fileStatus
+        if flags is None:
+            flags = self.getHSMFlags(filePath)
+        return self.hasHSMState(flags, HSM_LOST_STATE)
     
-    def markHSMState(self, state, filePath):
+    def markHSMState(self, state, filePath, backend=None):
         """Marks a file with a desired HSM state
 
         Args:
             state (str): String describing a state from HSM constants
             filePath (str): file path on the AMLFS
+            backend (HSMBackend, optional): backend of the file. Defaults to the one it is routed to.
+
+        Raises:
+            error: Raises an error if the state set fails
+        """
+        self.markHSMStates([state], filePath, backend)
+
+    def markHSMStates(self, states, filePath, backend=None):
+        """Marks a file with several HSM states in a single call
+
+        Args:
+            states (list[str]): states from HSM constants
+            filePath (str): file path on the AMLFS
+            backend (HSMBackend, optional): backend of the file. Defaults to the one it is routed to.
 
         Raises:
             error: Raises an error if the state set fails
         """
         try:
-            set_hsm_state(filePath, [state], [], 1)
+            set_hsm_state(filePath, states, [], (backend or self.getHSMBackend(filePath)).archiveId)
         except Exception as error:
             logging.error('Failed in setting hsm_state correctly. Please check the file status.')
             raise error
+        finally:
+            self.stateCache.invalidate(filePath)
 
-    def markLost(self, filePath):
+    def markLost(self, filePath, backend=None):
         """Mark file as lost
 
         Args:
             filePath (str): file path on the file system
+            backend (HSMBackend, optional): backend of the file. Defaults to the one it is routed to.
         """
-        self.markHSMState(HSM_LOST_STATE, filePath)
+        self.markHSMState(HSM_LOST_STATE, filePath, backend)
 
-    def markDirty(self, filePath):
+    def markDirty(self, filePath, backend=None):
         """Mark file as dirty
 
         Args:
             filePath (str): file path on the file system
+            backend (HSMBackend, optional): backend of the file. Defaults to the one it is routed to.
         """
-        self.markHSMState(HSM_DIRTY_STATE, filePath)
+        self.markHSMState(HSM_DIRTY_STATE, filePath, backend)
 
     def remove(self, filePath, force=False):
         """Removes a file from the HSM backend. 
@@ -196,38 +589,55 @@ class AzureManagedLustreHSM:
 
         Raises:
             error: raises error in case file is not in healthy state
+
+        Returns:
+            bool: False if the file could not be removed from the HSM backend
         """
         absolutePath = os.path.abspath(filePath)
+        flags, backend = None, None
         try:
-            self.check(absolutePath)
+            # The state is read once: check changes it only for the files it finds unhealthy, marked dirty and lost
+            flags, archiveId = self.getHSMStatus(absolutePath)
+            backend = self.getHSMBackend(absolutePath, archiveId)
+            if not self.check(absolutePath, backend=backend):
+                flags |= HSM_STATE_FLAGS[HSM_DIRTY_STATE] | HSM_STATE_FLAGS[HSM_LOST_STATE]
         except Exception as error:
             if force:
                 logging.warn('File {} seems not to be anymore on Lustre, continuning since forcing.'.format(absolutePath))
             else:
                 raise error
         
-        if os.path.exists(absolutePath) and not self.fileNeedsArchive(absolutePath):
-            if not self.isFileReleased(absolutePath):
-                if self.runHSMAction(HUA_REMOVE, absolutePath):
+        if os.path.exists(absolutePath) and not self.fileNeedsArchive(absolutePath, flags):
+            if not self.isFileReleased(absolutePath, flags):
+                removed = self.runHSMAction(HUA_REMOVE, absolutePath)
+                if removed:
                     logging.info('File {} successfully removed from HSM backend.'.format(absolutePath))
                 else:
                     logging.error('File {} failed to remove from HSM backend.'.format(absolutePath))
-                self.markDirty(absolutePath)
-                self.markLost(absolutePath)
+                self.markHSMStates(DIRTY_AND_LOST_STATES, absolutePath, backend)
+                return removed
         elif force:
-            try:
-                blobClient = self.getBlobClient(get_relative_path(absolutePath))
-                blobClient.delete_blob()
-            except ResourceNotFoundError as error:
-                if force:
-                    logging.error('File {} seems not to be anymore on the HSM backend.'.format(absolutePath))
-                else:
-                    logging.error('File {} seems not to be anymore on the HSM backend even if hsm_state expects it to be there.'.format(absolutePath))
+            from azure.core.exceptions import ResourceNotFoundError
+
+            blobName = get_relative_path(absolutePath)
+            # The archive ID of a file removed from Lustre is unknown, so its blob is looked for in every backend
+            backends = [backend or self.getHSMBackend(absolutePath)] if os.path.exists(absolutePath) else list(self.backends)
+            deleted = False
+            for candidate in backends:
+                try:
+                    candidate.controller.call(self.getBlobClient(blobName, candidate).delete_blob)
+                    deleted = True
+                except ResourceNotFoundError:
+                    pass
+            if not deleted:
+                logging.error('File {} seems not to be anymore on the HSM backend.'.format(absolutePath))
             if os.path.exists(absolutePath):
-                    self.markDirty(absolutePath)
-                    self.markLost(absolutePath)
+                self.markHSMStates(DIRTY_AND_LOST_STATES, absolutePath, backend)
+            return deleted
         else:
             logging.error('Failed in setting hsm_state correctly. Please check the file {} status.'.format(absolutePath))
+            return False
+        return True
 
     def restore(self, filePath, force=False):
         self.runHSMAction(HUA_RESTORE, os.path.abspath(filePath))
@@ -235,6 +645,52 @@ class AzureManagedLustreHSM:
     def archive(self, filePath, force=False):
         self.runHSMAction(HUA_ARCHIVE, os.path.abspath(filePath))
 
+    def restoreFiles(self, filePaths, force=False):
+        """Restores many files with batched HSM requests
+
+        Args:
+            filePaths (list[str]): file paths on the file system
+            force (bool, optional): Restore is not forced, just keeping for common signature. Defaults to False.
+
+        Returns:
+            list[str]: the file paths for which the restore failed
+        """
+        return self.runHSMActionBatch(HUA_RESTORE, [os.path.abspath(filePath) for filePath in filePaths])
+
+    def archiveFiles(self, filePaths, force=False):
+        """Archives many files with batched HSM requests
+
+        Args:
+            filePaths (list[str]): file paths on the file system
+            force (bool, optional): Archive is not forced, just keeping for common signature. Defaults to False.
+
+        Returns:
+            list[str]: the file paths for which the archive failed
+        """
+        return self.runHSMActionBatch(HUA_ARCHIVE, [os.path.abspath(filePath) for filePath in filePaths])
+
+    def isFileReleasable(self, absolutePath, flags=None):
+        """Checks if a file can be released: it must be healthy on the HSM backend, not in need of
+        archive and not already released.
+
+        Args:
+            absolutePath (str): absolute file path on the file system
+            flags (int, optional): HSM state bitmask already read for the file. Defaults to reading it.
+
+        Returns:
+            bool: True if the file can be released
+        """
+        if flags is None:
+            flags = self.getHSMFlags(absolutePath)
+        if self.check(absolutePath) and not self.fileNeedsArchive(absolutePath, flags):
+            if self.isFileReleased(absolutePath, flags):
+                logging.info('File {} already released.'.format(absolutePath))
+                return False
+            return True
+        else:
+            logging.error('File {} cannot be released since it doesn''t exist anymore on HSM.'.format(absolutePath))
+            return False
+
     def release(self, filePath, force=False):
         """Releases a file to the HSM backend. 
         - It checks the status of the file in terms of health, if not healthy it exits
@@ -247,17 +703,34 @@ class AzureManagedLustreHSM:
         """
         absolutePath = os.path.abspath(filePath)
 
-        if self.check(absolutePath) and not self.fileNeedsArchive(absolutePath):
-            if self.isFileReleased(absolutePath):
-                logging.info('File {} already released.'.format(absolutePath))
-            elif self.runHSMAction(HUA_RELEASE, absolutePath):
+        if self.isFileReleasable(absolutePath):
+            if self.runHSMAction(HUA_RELEASE, absolutePath):
                 logging.info('File {} successfully released.'.format(absolutePath))
             else:
                 logging.error('File {} failed to release.'.format(absolutePath))
-        else:
-            logging.error('File {} cannot be released since it doesn''t exist anymore on HSM.'.format(absolutePath))
+
+    def releaseFiles(self, filePaths, force=False):
+        """Releases many files to the HSM backend, checking each of them as release does and
+        grouping the releasable ones in batched HSM requests
+
+        Args:
+            filePaths (list[str]): file paths on the file system
+            force (bool, optional): Release is not forced, just keeping for common signature. Defaults to False.
+
+        Returns:
+            list[str]: the file paths which could not be released
+        """
+        absolutePaths, failed = [], []
+        for absolutePath in map(os.path.abspath, filePaths):
+            # The state is read once: check does not change it for the files it finds healthy
+            flags = self.getHSMFlags(absolutePath)
+            if self.isFileReleasable(absolutePath, flags):
+                absolutePaths.append(absolutePath)
+            elif not self.isFileReleased(absolutePath, flags):
+                failed.append(absolutePath)
+        return failed + self.runHSMActionBatch(HUA_RELEASE, absolutePaths)
     
-    def check(self, filePath, force=False):
+    def check(self, filePath, force=False, backend=None):
         """Checks a file state on the HSM backend. 
         - It checks the status of the file in terms of health
         - It marks it as dirty and lost if needed
@@ -265,16 +738,121 @@ class AzureManagedLustreHSM:
         Args:
             filePath (str): file path on the file system
             force (bool, optional): Release is not forced, just keeping for common signature. Defaults to False.
+            backend (HSMBackend, optional): backend of the file. Defaults to the one it is routed to.
 
         Return:
             bool: if the file is healthy
         """
         absolutePath = os.path.abspath(filePath)
-        if not self.isFileOnHSM(absolutePath):
+        backend = backend or self.getHSMBackend(absolutePath)
+        isFileOnHSM = self.isFileOnHSM(absolutePath, backend)
+        self.journalFile(absolutePath, isFileOnHSM)
+        if not isFileOnHSM:
             logging.error('File {} seems not to be anymore on the HSM backend. Marking as dirty and lost.'.format(absolutePath))
-            self.markDirty(absolutePath)
-            self.markLost(absolutePath)
+            self.markHSMStates(DIRTY_AND_LOST_STATES, absolutePath, backend)
             return False
         else:
             return True
-        
\ No newline at end of file
+
+    def checkFiles(self, filePaths, force=False):
+        """Checks the state of many files on the HSM backend as check does, running the blob
+        existence checks together.
+
+        Args:
+            filePaths (list[str]): file paths on the file system
+            force (bool, optional): Check is not forced, just keeping for common signature. Defaults to False.
+
+        Returns:
+            list[str]: the file paths which are not healthy or could not be checked
+        """
+        absolutePaths = [os.path.abspath(filePath) for filePath in filePaths]
+        unhealthy = []
+        backends = {}
+        for absolutePath, isFileOnHSM in self.areFilesOnHSM(absolutePaths, backends).items():
+            if isFileOnHSM is not None:
+                self.journalFile(absolutePath, isFileOnHSM)
+            if isFileOnHSM is None:
+                logging.error('File {} could not be checked on the HSM backend.'.format(absolutePath))
+                unhealthy.append(absolutePath)
+            elif not isFileOnHSM:
+                logging.error('File {} seems not to be anymore on the HSM backend. Marking as dirty and lost.'.format(absolutePath))
+                self.markHSMStates(DIRTY_AND_LOST_STATES, absolutePath, backends[absolutePath])
+                unhealthy.append(absolutePath)
+        return unhealthy
+
+    def isSampled(self, blobName):
+        return zlib.crc32(blobName.encode('utf8')) < self.verifySample * 0x100000000
+
+    def blobMismatch(self, absolutePath, blobName, record, flags):
+        """Compares a file with its blob: size, mtime (from the blob metadata if the copytool stored it,
+        otherwise the file must not be newer than the blob) and, for the sampled files which are not released
+        and whose blob has an MD5, the checksum.
+
+        Args:
+            absolutePath (str): absolute file path on the file system
+            blobName (str): blob name of the file
+            record (BlobRecord): the blob record, None if the blob does not exist
+            flags (int): HSM state bitmask of the file
+
+        Returns:
+            str: the reason of the mismatch, None if the file matches its blob
+        """
+        if record is None:
+            return 'blob not found'
+        stat = os.stat(absolutePath)
+        if stat.st_size != record.size:
+            return 'size {} differs from blob size {}'.format(stat.st_size, record.size)
+        if record.mtime is not None:
+            if abs(stat.st_mtime - record.mtime) > MTIME_TOLERANCE:
+                return 'mtime {} differs from blob mtime {}'.format(stat.st_mtime, record.mtime)
+        elif record.last_modified is not None and stat.st_mtime > record.last_modified + MTIME_TOLERANCE:
+            return 'file modified after the blob was written'
+        if record.content_md5 and not self.isFileReleased(absolutePath, flags) and self.isSampled(blobName):
+            if file_md5(absolutePath) != record.content_md5:
+                return 'MD5 differs from blob MD5'
+        return None
+
+    def verify(self, filePath, force=False):
+        """Verifies that an archived file matches its blob, as blobMismatch does. Files which do not match
+        are marked as dirty and lost. Files not archived or dirty are skipped.
+
+        Args:
+            filePath (str): file path on the file system
+            force (bool, optional): Verify is not forced, just keeping for common signature. Defaults to False.
+
+        Returns:
+            bool: False if the file does not match its blob
+        """
+        absolutePath = os.path.abspath(filePath)
+        flags, archiveId = self.getHSMStatus(absolutePath)
+        if self.fileNeedsArchive(absolutePath, flags) or self.isFileDirty(absolutePath, flags):
+            logging.info('File {} is not archived, skipping verification.'.format(absolutePath))
+            return True
+        blobName = get_relative_path(absolutePath)
+        backend = self.getHSMBackend(absolutePath, archiveId)
+        mismatch = self.blobMismatch(absolutePath, blobName, self.getBlobRecord(blobName, absolutePath, backend), flags)
+        if mismatch is not None:
+            logging.error('File {} does not match its blob ({}). Marking as dirty and lost.'.format(absolutePath, mismatch))
+            self.markHSMStates(DIRTY_AND_LOST_STATES, absolutePath, backend)
+            return False
+        return True
+
+    def verifyFiles(self, filePaths, force=False):
+        """Verifies many files as verify does
+
+        Args:
+            filePaths (list[str]): file paths on the file system
+            force (bool, optional): Verify is not forced, just keeping for common signature. Defaults to False.
+
+        Returns:
+            list[str]: the file paths which do not match their blob or could not be verified
+        """
+        failed = []
+        for absolutePath in map(os.path.abspath, filePaths):
+            try:
+                if not self.verify(absolutePath):
+                    failed.append(absolutePath)
+            except (IOError, OSError) as error:
+                logging.error('Failed in verifying file {}: {}'.format(absolutePath, str(error)))
+                failed.append(absolutePath)
+        return failed
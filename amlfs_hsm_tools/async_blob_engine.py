@@ -0,0 +1,172 @@
+import asyncio
+import functools
+import logging
+import random
+import threading
+
+import aiohttp
+
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError
+from azure.core.pipeline.transport import AioHttpTransport
+from azure.storage.blob.aio import BlobServiceClient
+
+from .metrics import blob_metrics_hooks
+from .throttle import BLOB_CONGESTION_STATUS_CODES
+
+
+DEFAULT_ASYNC_CONCURRENCY = 64
+DEFAULT_MAX_RETRIES = 8
+MIN_BACKOFF = 0.05
+MAX_BACKOFF = 30.0
+
+
+class AdaptiveBackoff:
+    """Backoff delay shared by all the requests of the engine. It doubles every time the
+    storage account answers ServerBusy and halves on every successful request.
+    """
+    def __init__(self, minDelay=MIN_BACKOFF, maxDelay=MAX_BACKOFF) -> None:
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+        self.delay = 0.0
+
+    def busy(self):
+        self.delay = min(self.maxDelay, max(self.minDelay, 2 * self.delay))
+
+    def success(self):
+        self.delay = self.delay / 2 if self.delay > self.minDelay else 0.0
+
+    async def wait(self):
+        if self.delay:
+            await asyncio.sleep(self.delay * random.uniform(0.5, 1.5))
+
+
+class AsyncTokenCredential:
+    """Exposes a synchronous token credential to the asyncio Azure SDK. Tokens are fetched in a worker
+    thread, so that the token cache is shared with the synchronous blob client of the same account.
+    """
+    def __init__(self, credential) -> None:
+        self.credential = credential
+
+    async def get_token(self, *scopes, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(self.credential.get_token, *scopes, **kwargs))
+
+    async def close(self):
+        # The synchronous credential is owned by the backend and closed with it
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class AsyncBlobEngine:
+    """Runs blob existence checks and deletes concurrently with the asyncio Azure SDK.
+    The event loop lives in a background thread, so the engine can be called from synchronous code
+    and from several threads while keeping a single connection pool.
+
+    Args:
+        accountURL (str): storage account URL
+        containerName (str): HSM container
+        concurrency (int, optional): maximum number of concurrent requests. Defaults to 64.
+        maxRetries (int, optional): retries of a throttled request. Defaults to 8.
+        credential (str | CachedTokenCredential, optional): account key or token credential of the account.
+            Defaults to the one built from the account key or the managed identity, as for the blob client.
+    """
+    def __init__(self, accountURL, containerName, concurrency=DEFAULT_ASYNC_CONCURRENCY, maxRetries=DEFAULT_MAX_RETRIES,
+                 credential=None) -> None:
+        if credential is None:
+            from .lfs_blob_client import build_credential
+            credential = build_credential({})
+        self.accountURL = accountURL
+        self.containerName = containerName
+        self.credential = credential
+        self.concurrency = concurrency
+        self.maxRetries = maxRetries
+        self.backoff = AdaptiveBackoff()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self._run(self._open())
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _open(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        credential = self.credential if isinstance(self.credential, str) else AsyncTokenCredential(self.credential)
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency))
+        # ServerBusy retries are handled by the adaptive backoff, connection and timeout ones by the SDK retry policy
+        self.serviceClient = BlobServiceClient(self.accountURL, credential=credential,
+                                               transport=AioHttpTransport(session=session, session_owner=True),
+                                               retry_status=0, **blob_metrics_hooks())
+        self.containerClient = self.serviceClient.get_container_client(self.containerName)
+
+    async def _close(self):
+        await self.serviceClient.close()
+
+    async def _call(self, operation):
+        for attempt in range(self.maxRetries + 1):
+            await self.backoff.wait()
+            async with self.semaphore:
+                try:
+                    result = await operation()
+                except HttpResponseError as error:
+                    if error.status_code not in BLOB_CONGESTION_STATUS_CODES or attempt == self.maxRetries:
+                        raise
+                    logging.debug('Storage account busy (HTTP {}), backing off.'.format(error.status_code))
+                    self.backoff.busy()
+                    continue
+            self.backoff.success()
+            return result
+
+    async def _exists(self, blobName):
+        return await self._call(lambda: self.containerClient.get_blob_client(blobName).exists())
+
+    async def _delete(self, blobName):
+        try:
+            await self._call(lambda: self.containerClient.delete_blob(blobName))
+            return True
+        except ResourceNotFoundError:
+            return False
+
+    async def _gather(self, function, blobNames):
+        return await asyncio.gather(*(function(blobName) for blobName in blobNames), return_exceptions=True)
+
+    def _many(self, function, blobNames):
+        blobNames = list(blobNames)
+        results = {}
+        for blobName, result in zip(blobNames, self._run(self._gather(function, blobNames))):
+            if isinstance(result, Exception):
+                logging.error('Blob operation on {} failed with error {}.'.format(blobName, str(result)))
+                result = None
+            results[blobName] = result
+        return results
+
+    def exists_many(self, blobNames):
+        """Checks concurrently if the blobs exist in the container
+
+        Args:
+            blobNames (iterable[str]): blob names
+
+        Returns:
+            dict[str, bool]: existence of each blob, None if the check failed
+        """
+        return self._many(self._exists, blobNames)
+
+    def delete_many(self, blobNames):
+        """Deletes concurrently the blobs from the container
+
+        Args:
+            blobNames (iterable[str]): blob names
+
+        Returns:
+            dict[str, bool]: True if deleted, False if not found, None if the delete failed
+        """
+        return self._many(self._delete, blobNames)
+
+    def close(self):
+        self._run(self._close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
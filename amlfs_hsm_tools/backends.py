@@ -0,0 +1,156 @@
+import threading
+
+from .throttle import RateController, blob_congested
+
+
+DEFAULT_ARCHIVE_ID = 1
+DEFAULT_BLOB_MAX_IN_FLIGHT = 32
+# Keys of a backend entry which are not inherited from the top level of the configuration
+BACKEND_KEYS = ('archiveId', 'prefixes', 'backends')
+
+
+class HSMBackend:
+    """Blob container serving a Lustre HSM archive ID, with its own blob client, connection pool,
+    rate controller, blob index and asyncio engine. The blob client, and with it the Azure SDK, is
+    loaded only when an action first needs it.
+
+    Args:
+        archiveId (int): Lustre HSM archive ID served by the container
+        configuration (dict): accountURL, containerName and the optional settings of the backend
+        client (LFSBlobClient, optional): blob client to be used. Defaults to one built from the configuration.
+    """
+    def __init__(self, archiveId, configuration, client=None) -> None:
+        self.archiveId = archiveId
+        self.configuration = configuration
+        self.accountURL = configuration.get('accountURL')
+        self.containerName = configuration.get('containerName')
+        self.prefixes = [prefix.strip('/') + '/' for prefix in configuration.get('prefixes', [])]
+        self._client = client
+        self._credential = None
+        self._clientLock = threading.Lock()
+        self.controller = RateController('blob_{}'.format(archiveId), blob_congested,
+                                         configuration.get('blobMaxInFlight', DEFAULT_BLOB_MAX_IN_FLIGHT))
+        self.blobIndex = None
+        self.asyncEngine = None
+
+    @property
+    def credential(self):
+        """Credential of the storage account of the backend, shared by its blob client and asyncio engine
+
+        Returns:
+            (str | CachedTokenCredential): the account key or the token credential
+        """
+        if self._credential is None:
+            with self._clientLock:
+                if self._credential is None:
+                    from .lfs_blob_client import build_credential
+                    self._credential = build_credential(self.configuration)
+        return self._credential
+
+    @property
+    def client(self):
+        """Blob client of the backend, built on first use
+
+        Returns:
+            (LFSBlobClient): the blob client
+        """
+        if self._client is None:
+            credential = self.credential
+            with self._clientLock:
+                if self._client is None:
+                    from .lfs_blob_client import LFSBlobClient
+                    self._client = LFSBlobClient(configuration=self.configuration, credential=credential)
+        return self._client
+
+    def getBlobClient(self, blobName):
+        return self.client.get_blob_client(container=self.client.containerName, blob=blobName)
+
+    def getContainerClient(self):
+        return self.client.get_container_client(self.client.containerName)
+
+    def matchLength(self, blobName):
+        """Returns the length of the longest prefix of the backend matching a blob name
+
+        Args:
+            blobName (str): blob name
+
+        Returns:
+            int: length of the matching prefix, -1 if none matches
+        """
+        return max((len(prefix) for prefix in self.prefixes if blobName.startswith(prefix)), default=-1)
+
+    def close(self):
+        if self.asyncEngine is not None:
+            self.asyncEngine.close()
+            self.asyncEngine = None
+        if self._credential is not None and not isinstance(self._credential, str):
+            self._credential.close()
+            self._credential = None
+
+
+class BackendRouter:
+    """Maps Lustre HSM archive IDs to their blob backends. The top level of the configuration is the
+    default backend, whose archive ID is archiveId (default 1). Each entry of backends adds the container
+    of another archive ID, optionally on another storage account: settings missing from the entry are taken
+    from the top level, except the account key if the entry names its own account. Files already archived
+    are routed by their archive ID, the other ones by the longest matching entry of prefixes (blob name
+    prefixes), and to the default backend if none matches.
+
+    Args:
+        configuration (dict): tools configuration
+        client (LFSBlobClient, optional): blob client of the default backend
+        clients (dict[int, LFSBlobClient], optional): blob clients of the other backends, by archive ID
+    """
+    def __init__(self, configuration, client=None, clients=None) -> None:
+        clients = clients or {}
+        shared = {key: value for key, value in configuration.items() if key not in BACKEND_KEYS}
+        self.default = HSMBackend(configuration.get('archiveId', DEFAULT_ARCHIVE_ID), configuration, client)
+        self.backends = {self.default.archiveId: self.default}
+        for entry in configuration.get('backends', []):
+            backendConfiguration = dict(shared)
+            if 'accountURL' in entry:
+                backendConfiguration.pop('accountKey', None)
+            backendConfiguration.update(entry)
+            archiveId = backendConfiguration['archiveId']
+            if archiveId in self.backends:
+                raise ValueError('Archive ID {} is configured more than once.'.format(archiveId))
+            self.backends[archiveId] = HSMBackend(archiveId, backendConfiguration, clients.get(archiveId))
+
+    def __len__(self):
+        return len(self.backends)
+
+    def __iter__(self):
+        return iter(self.backends.values())
+
+    def get(self, archiveId):
+        """Returns the backend of an archive ID
+
+        Args:
+            archiveId (int): Lustre HSM archive ID
+
+        Raises:
+            KeyError: if no backend serves the archive ID
+
+        Returns:
+            (HSMBackend): the backend
+        """
+        try:
+            return self.backends[archiveId]
+        except KeyError:
+            raise KeyError('No HSM backend is configured for archive ID {}.'.format(archiveId))
+
+    def forBlob(self, blobName):
+        """Returns the backend a file not archived yet is routed to, by the prefixes of the backends
+
+        Args:
+            blobName (str): blob name of the file
+
+        Returns:
+            (HSMBackend): the backend with the longest prefix matching the blob name, the default one if none matches
+        """
+        backend = max(self.backends.values(), key=lambda backend: backend.matchLength(blobName))
+        return backend if backend.matchLength(blobName) >= 0 else self.default
+
+    def close(self):
+        for backend in self:
+            backend.close()
@@ -0,0 +1,157 @@
+import datetime
+import logging
+
+from collections import namedtuple
+
+from .throttle import throttled_items
+
+
+DEFAULT_MTIME_METADATA_KEY = 'modtime'
+
+BlobRecord = namedtuple('BlobRecord', ['size', 'last_modified', 'mtime', 'content_md5'])
+
+
+def _parse_mtime(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def blob_record(blob, mtimeKey=DEFAULT_MTIME_METADATA_KEY):
+    """Extracts from the properties of a blob what is needed to verify it against its file
+
+    Args:
+        blob (BlobProperties): blob properties from a listing or a get_blob_properties
+        mtimeKey (str, optional): metadata key holding the file mtime set by the copytool. Defaults to modtime.
+
+    Returns:
+        (BlobRecord): size, last modified timestamp, file mtime (None if not in the metadata) and MD5 of the blob
+    """
+    contentSettings = getattr(blob, 'content_settings', None)
+    contentMD5 = getattr(contentSettings, 'content_md5', None)
+    return BlobRecord(blob.size, blob.last_modified.timestamp(), _parse_mtime((blob.metadata or {}).get(mtimeKey)),
+                      bytes(contentMD5) if contentMD5 else None)
+
+
+class BlobIndex:
+    """In-memory index of the blob names present in the HSM container, built from a single listing.
+    Names are stored relative to the listing prefix to keep the index compact. If built with records,
+    the size, times and MD5 of every blob are kept as well. An index built from an inventory report
+    is as of the report time: files changed after it must be checked against the container.
+    """
+    def __init__(self, prefix='', records=False, asOf=None) -> None:
+        self.prefix = prefix
+        self.asOf = asOf
+        self._names = set()
+        self._records = {} if records else None
+
+    def add(self, name, record=None):
+        """Adds a blob name to the index
+
+        Args:
+            name (str): full blob name in the container
+            record (BlobRecord, optional): properties of the blob, kept if the index holds records
+        """
+        name = name[len(self.prefix):] if name.startswith(self.prefix) else name
+        if self._records is not None:
+            self._records[name] = record
+        else:
+            self._names.add(name)
+
+    def covers(self, name):
+        """Checks if a blob name falls under the prefix that was listed
+
+        Args:
+            name (str): full blob name in the container
+
+        Returns:
+            bool: True if the index can answer for the name
+        """
+        return name.startswith(self.prefix)
+
+    def isCurrent(self, stat):
+        """Checks if the index can answer for a file, which must not have changed after the index time
+
+        Args:
+            stat (os.stat_result): stat of the file
+
+        Returns:
+            bool: True if the file did not change since the index was built
+        """
+        return self.asOf is None or max(stat.st_mtime, stat.st_ctime) <= self.asOf
+
+    def hasRecords(self):
+        return self._records is not None
+
+    def record(self, name):
+        """Returns the properties of an indexed blob
+
+        Args:
+            name (str): full blob name in the container
+
+        Returns:
+            (BlobRecord): the blob properties, None if the blob is not indexed or the index holds no records
+        """
+        if self._records is None or not self.covers(name):
+            return None
+        return self._records.get(name[len(self.prefix):])
+
+    def __contains__(self, name):
+        names = self._records if self._records is not None else self._names
+        return self.covers(name) and name[len(self.prefix):] in names
+
+    def __len__(self):
+        return len(self._records if self._records is not None else self._names)
+
+    @classmethod
+    def from_container(cls, containerClient, prefix='', records=False, mtimeKey=DEFAULT_MTIME_METADATA_KEY, controller=None):
+        """Builds the index streaming a single list_blobs over the container
+
+        Args:
+            containerClient (ContainerClient): client of the HSM container
+            prefix (str, optional): only blobs under this prefix are indexed. Defaults to ''.
+            records (bool, optional): if the blob properties and metadata are kept. Defaults to False.
+            mtimeKey (str, optional): metadata key holding the file mtime. Defaults to modtime.
+            controller (RateController, optional): rate controller retrying the throttled listing pages
+
+        Returns:
+            (BlobIndex): the populated index
+        """
+        index = cls(prefix, records)
+        blobs = containerClient.list_blobs(name_starts_with=prefix or None, include=['metadata'] if records else None)
+        if controller is not None:
+            blobs = throttled_items(blobs, controller)
+        for blob in blobs:
+            index.add(blob.name, blob_record(blob, mtimeKey) if records else None)
+        logging.info('Indexed {} blobs under prefix "{}".'.format(len(index), prefix))
+        return index
+
+    @classmethod
+    def from_inventory(cls, inventory, prefix='', records=False):
+        """Builds the index streaming a Blob Inventory report instead of listing the container. The index is
+        as of the report time or, if unknown, of the last blob modification in the report.
+
+        Args:
+            inventory (BlobInventory): inventory report of the HSM container
+            prefix (str, optional): only blobs under this prefix are indexed. Defaults to ''.
+            records (bool, optional): if size, last modified time and MD5 of the blobs are kept. Defaults to False.
+
+        Returns:
+            (BlobIndex): the populated index
+        """
+        index = cls(prefix, records)
+        lastModified = 0.0
+        for blob in inventory.blobs(prefix):
+            if blob.last_modified is not None:
+                lastModified = max(lastModified, blob.last_modified)
+            index.add(blob.name, BlobRecord(blob.size, blob.last_modified, None, blob.content_md5) if records else None)
+        index.asOf = inventory.reportTime if inventory.reportTime is not None else lastModified
+        logging.info('Indexed {} blobs under prefix "{}" from inventory {}.'.format(len(index), prefix, inventory.path))
+        return index
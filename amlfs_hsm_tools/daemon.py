@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+from concurrent.futures import Future
+
+from .lustre_hsm_constants import DEFAULT_HSM_BATCH_SIZE
+from .metrics import metrics
+from .pipeline import chunked
+
+
+DEFAULT_SOCKET_PATH = '/run/amlfs_hsm_tools.sock'
+DAEMON_ACTIONS = ('archive', 'release', 'restore', 'remove', 'check')
+DEFAULT_COALESCE_WINDOW = 0.05
+CLIENT_REQUEST_SIZE = 10000
+
+
+class RequestCoalescer:
+    """Collects the files of concurrent requests for the same action and runs them together in
+    batches of up to batchSize files, waiting at most window seconds for a batch to fill up.
+
+    Args:
+        azureManagedLustreHSM (AzureManagedLustreHSM): the engine of the daemon
+        action (str): action name
+        batchSize (int, optional): maximum number of files per batch. Defaults to 1000.
+        window (float, optional): seconds a batch waits for more files. Defaults to 0.05.
+    """
+    def __init__(self, azureManagedLustreHSM, action, batchSize=DEFAULT_HSM_BATCH_SIZE, window=DEFAULT_COALESCE_WINDOW) -> None:
+        self.azureManagedLustreHSM = azureManagedLustreHSM
+        self.action = action
+        self.batchSize = batchSize
+        self.window = window
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, filePaths, force=False):
+        """Queues files for the action
+
+        Args:
+            filePaths (list[str]): absolute file paths
+            force (bool, optional): force flag of the action. Defaults to False.
+
+        Returns:
+            list[Future]: futures resolved with True if the action succeeded on each file
+        """
+        futures = []
+        for filePath in filePaths:
+            future = Future()
+            self._queue.put((filePath, force, future))
+            futures.append(future)
+        return futures
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.batchSize:
+            try:
+                batch.append(self._queue.get(timeout=self.window))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        batchAction = getattr(self.azureManagedLustreHSM, '{}Files'.format(self.action), None)
+        action = getattr(self.azureManagedLustreHSM, self.action)
+        while True:
+            batch = self._collect()
+            for force in set(force for _, force, _ in batch):
+                items = [(filePath, future) for filePath, itemForce, future in batch if itemForce == force]
+                start = time.perf_counter()
+                try:
+                    if batchAction is not None:
+                        failed = set(batchAction([filePath for filePath, _ in items], force))
+                    else:
+                        failed = set()
+                        for filePath, _ in items:
+                            try:
+                                # Single-file actions report some failures with a False return rather than an error
+                                if action(filePath, force) is False:
+                                    failed.add(filePath)
+                            except Exception as error:
+                                logging.error('Failed in processing {}: {}'.format(filePath, str(error)))
+                                failed.add(filePath)
+                except Exception as error:
+                    logging.error('Failed in processing a batch of {} files: {}'.format(len(items), str(error)))
+                    failed = set(filePath for filePath, _ in items)
+                metrics.observe('action', self.action, time.perf_counter() - start, bool(failed), len(items))
+                for filePath, future in items:
+                    future.set_result(filePath not in failed)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                coalescer = self.server.coalescers[request['action']]
+                futures = coalescer.submit(request['files'], request.get('force', False))
+                failed = [filePath for filePath, future in zip(request['files'], futures) if not future.result()]
+                response = {'failed': failed}
+            except Exception as error:
+                response = {'error': str(error)}
+            self.wfile.write(json.dumps(response).encode('utf8') + b'\n')
+            self.wfile.flush()
+
+
+class HSMDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server keeping an AzureManagedLustreHSM engine warm and coalescing the files of
+    concurrent requests into batched actions. Requests and responses are JSON lines:
+    {"action": "archive", "files": [...], "force": false} -> {"failed": [...]}
+
+    Args:
+        azureManagedLustreHSM (AzureManagedLustreHSM): the engine of the daemon
+        socketPath (str, optional): path of the Unix socket. Defaults to /run/amlfs_hsm_tools.sock.
+        batchSize (int, optional): maximum number of files per batch. Defaults to 1000.
+    """
+    daemon_threads = True
+
+    def __init__(self, azureManagedLustreHSM, socketPath=DEFAULT_SOCKET_PATH, batchSize=DEFAULT_HSM_BATCH_SIZE) -> None:
+        if os.path.exists(socketPath):
+            os.unlink(socketPath)
+        self.coalescers = {action: RequestCoalescer(azureManagedLustreHSM, action, batchSize) for action in DAEMON_ACTIONS}
+        super().__init__(socketPath, _RequestHandler)
+        os.chmod(socketPath, 0o600)
+        self.socketPath = socketPath
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socketPath):
+            os.unlink(self.socketPath)
+
+
+def is_daemon_running(socketPath=DEFAULT_SOCKET_PATH):
+    """Checks if a daemon is accepting connections on the socket
+
+    Args:
+        socketPath (str, optional): path of the Unix socket. Defaults to /run/amlfs_hsm_tools.sock.
+
+    Returns:
+        bool: True if the daemon is running
+    """
+    if not os.path.exists(socketPath):
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socketPath)
+            return True
+        except OSError:
+            return False
+
+
+def forward(action, filePaths, force=False, socketPath=DEFAULT_SOCKET_PATH):
+    """Forwards an action on a stream of files to the daemon
+
+    Args:
+        action (str): action name
+        filePaths (iterable[str]): file paths, sent as absolute paths
+        force (bool, optional): force flag of the action. Defaults to False.
+        socketPath (str, optional): path of the Unix socket. Defaults to /run/amlfs_hsm_tools.sock.
+
+    Raises:
+        RuntimeError: if the daemon fails in handling a request
+
+    Returns:
+        list[str]: the file paths for which the action failed
+    """
+    failed = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socketPath)
+        with client.makefile('rwb') as stream:
+            for chunk in chunked((os.path.abspath(filePath) for filePath in filePaths), CLIENT_REQUEST_SIZE):
+                stream.write(json.dumps({'action': action, 'files': chunk, 'force': force}).encode('utf8') + b'\n')
+                stream.flush()
+                response = json.loads(stream.readline())
+                if 'error' in response:
+                    raise RuntimeError(response['error'])
+                failed.extend(response['failed'])
+    return failed
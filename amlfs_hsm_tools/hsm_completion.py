@@ -0,0 +1,151 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from concurrent.futures import Future
+
+from .lustre_hsm_constants import HSM_ARCHIVED_STATE, HSM_DIRTY_STATE, HSM_RELEASED_STATE, HSM_STATE_FLAGS, \
+                                HUA_ARCHIVE, HUA_RELEASE, HUA_RESTORE, HPS_WAITING, HPS_RUNNING
+from .lustreapi_hsm import get_hsm_progress
+
+
+DEFAULT_MIN_INTERVAL = 0.1
+DEFAULT_MAX_INTERVAL = 10.0
+PROGRESS_LOG_INTERVAL = 1000
+# Checks finding no action in progress and the target states not reached before a file is failed,
+# the second one covering a request not yet visible in the state progress
+MAX_IDLE_CHECKS = 2
+
+ACTION_TARGET_STATES = {
+    HUA_ARCHIVE: ([HSM_ARCHIVED_STATE], [HSM_DIRTY_STATE]),
+    HUA_RESTORE: ([], [HSM_RELEASED_STATE]),
+    HUA_RELEASE: ([HSM_RELEASED_STATE], []),
+}
+
+
+def _flags(states):
+    return sum(HSM_STATE_FLAGS[state] for state in states)
+
+
+class CompletionTracker:
+    """Waits for the completion of HSM actions on many files in a single loop. Each check reads the state
+    and the progress of the running action of a file with a single llapi_hsm_state_get. A file whose action
+    is over without reaching the target states, or whose check fails, is failed. Every file backs off
+    independently between minInterval and maxInterval.
+
+    Args:
+        minInterval (float, optional): first interval between two checks of a file. Defaults to 0.1.
+        maxInterval (float, optional): maximum interval between two checks of a file. Defaults to 10.
+        getProgress (callable, optional): function returning the HSM state bitmask of a file, the progress
+            state and the action running on it
+    """
+    def __init__(self, minInterval=DEFAULT_MIN_INTERVAL, maxInterval=DEFAULT_MAX_INTERVAL,
+                 getProgress=get_hsm_progress) -> None:
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.getProgress = getProgress
+        self._pending = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def watch(self, filePath, targetAddStates, targetRemoveStates):
+        """Starts watching a file until the target states are set and removed
+
+        Args:
+            filePath (str): file path on the file system
+            targetAddStates (list[str]): states which must be set
+            targetRemoveStates (list[str]): states which must be cleared
+
+        Returns:
+            (Future): resolved with the file path when the file reaches the target states
+        """
+        future = Future()
+        entry = (filePath, _flags(targetAddStates), _flags(targetRemoveStates), future)
+        with self._lock:
+            heapq.heappush(self._pending, (time.monotonic(), next(self._sequence), self.minInterval, 0, entry))
+        return future
+
+    def watchAction(self, filePath, action):
+        """Starts watching a file until the HSM action is completed
+
+        Args:
+            filePath (str): file path on the file system
+            action (str): action name from HSM constants (archive, restore or release)
+
+        Returns:
+            (Future): resolved with the file path when the action is completed
+        """
+        targetAddStates, targetRemoveStates = ACTION_TARGET_STATES[action]
+        return self.watch(filePath, targetAddStates, targetRemoveStates)
+
+    def _isComplete(self, filePath, addFlags, removeFlags):
+        """Checks the progress of the action on a file
+
+        Returns:
+            bool: True if the target states are reached, False if the action is in progress,
+                None if no action is in progress and the target states are not reached
+        """
+        flags, state, _ = self.getProgress(filePath)
+        if state in (HPS_WAITING, HPS_RUNNING):
+            return False
+        return True if flags & addFlags == addFlags and not flags & removeFlags else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def wait(self, timeout=None):
+        """Runs the completion loop until all the watched files are completed or the timeout expires.
+        Files still pending at the timeout have their future failed with TimeoutError.
+
+        Args:
+            timeout (float, optional): overall timeout in seconds. Defaults to no timeout.
+
+        Returns:
+            int: number of files which did not complete, failed or timed out
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        completed, failed = 0, 0
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return failed
+                nextCheck, sequence, interval, idleChecks, entry = heapq.heappop(self._pending)
+
+            now = time.monotonic()
+            if deadline is not None and nextCheck > deadline:
+                with self._lock:
+                    expired = [entry] + [item[4] for item in self._pending]
+                    self._pending = []
+                for filePath, _, _, future in expired:
+                    future.set_exception(TimeoutError('HSM action on {} did not complete in time.'.format(filePath)))
+                logging.error('{} files did not complete the HSM action in time.'.format(len(expired)))
+                return failed + len(expired)
+            if nextCheck > now:
+                time.sleep(nextCheck - now)
+
+            filePath, addFlags, removeFlags, future = entry
+            try:
+                isComplete = self._isComplete(filePath, addFlags, removeFlags)
+            except Exception as error:
+                logging.error('Failed in checking the HSM action on {}: {}'.format(filePath, str(error)))
+                future.set_exception(error)
+                failed += 1
+                continue
+
+            if isComplete:
+                future.set_result(filePath)
+                completed += 1
+                if completed % PROGRESS_LOG_INTERVAL == 0:
+                    logging.info('{} files completed, {} pending.'.format(completed, len(self)))
+            elif isComplete is None and idleChecks + 1 >= MAX_IDLE_CHECKS:
+                logging.error('HSM action on {} is over without reaching the target state.'.format(filePath))
+                future.set_exception(RuntimeError('HSM action on {} is over without reaching the target state.'.format(filePath)))
+                failed += 1
+            else:
+                idleChecks = idleChecks + 1 if isComplete is None else 0
+                interval = min(2 * interval, self.maxInterval)
+                with self._lock:
+                    heapq.heappush(self._pending, (time.monotonic() + interval, sequence, interval, idleChecks, entry))
@@ -0,0 +1,62 @@
+import logging
+
+from collections import namedtuple
+
+from .lustreapi_hsm import get_fid_and_hsm_flags
+from .pipeline import chunked, ordered_map, DEFAULT_QUEUE_SIZE
+
+
+DEFAULT_QUERY_WORKERS = 16
+DEFAULT_QUERY_CHUNK_SIZE = 16
+
+HSMQueryResult = namedtuple('HSMQueryResult', ['path', 'fid', 'flags', 'stat', 'error'])
+
+
+class HSMQueryEngine:
+    """Fetches the FID and HSM state of many files in parallel. Each file is opened once and queried
+    with the fd-based LustreAPI calls on per-thread buffers. The calls release the GIL, so that the
+    MDS round trips of the workers overlap. Files are handed to the workers in small chunks to keep
+    the scheduling cost below the cost of a query.
+
+    Args:
+        workers (int, optional): number of parallel queries. Defaults to 16.
+        withStat (bool, optional): if the files are also stat-ed on the same descriptor. Defaults to False.
+        chunkSize (int, optional): number of files queried in a row by a worker. Defaults to 16.
+        maxPending (int, optional): maximum number of queries in flight or not yet consumed.
+    """
+    def __init__(self, workers=DEFAULT_QUERY_WORKERS, withStat=False, chunkSize=DEFAULT_QUERY_CHUNK_SIZE,
+                 maxPending=DEFAULT_QUEUE_SIZE) -> None:
+        self.workers = workers
+        self.withStat = withStat
+        self.chunkSize = chunkSize
+        self.maxPending = maxPending
+
+    def query(self, filePath):
+        """Fetches the FID and HSM state of a file
+
+        Args:
+            filePath (str): file path on the file system
+
+        Returns:
+            (HSMQueryResult): FID, HSM state bitmask and stat of the file, or the error of the query
+        """
+        try:
+            fid, flags, stat = get_fid_and_hsm_flags(filePath, self.withStat)
+        except (IOError, OSError) as error:
+            logging.error('Failed in querying file {}: {}'.format(filePath, str(error)))
+            return HSMQueryResult(filePath, None, None, None, error)
+        return HSMQueryResult(filePath, fid, flags, stat, None)
+
+    def queryMany(self, filePaths):
+        """Fetches the FID and HSM state of a stream of files
+
+        Args:
+            filePaths (iterable[str]): stream of file paths
+
+        Yields:
+            (HSMQueryResult): the result of each file, in the input order
+        """
+        queryChunk = lambda chunk: [self.query(filePath) for filePath in chunk]
+        for _, results in ordered_map(queryChunk, chunked(filePaths, self.chunkSize), self.workers,
+                                      max(1, self.maxPending // self.chunkSize)):
+            yield from results
@@ -0,0 +1,142 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+DEFAULT_STATE_CACHE_TTL = 0
+DEFAULT_STATE_CACHE_SIZE = 100000
+DEFAULT_FID_CACHE_SIZE = 100000
+
+
+def fid_key(lufid):
+    """Returns a hashable key for a lu_fid
+
+    Args:
+        lufid (lu_fid): Lustre FID
+
+    Returns:
+        tuple: (sequence, object id, version) of the FID
+    """
+    return (lufid.f_seq, lufid.f_oid, lufid.f_ver)
+
+
+class HSMStateCache:
+    """Short-lived cache of HSM state bitmasks keyed by FID. Entries expire after ttl seconds
+    and must be invalidated after any state change or HSM request on the file.
+
+    Args:
+        path2fid (callable): function returning the lu_fid of a file path
+        ttl (float, optional): seconds a state is reused. Defaults to 0, disabling the cache.
+        maxSize (int, optional): maximum number of cached files. Defaults to 100000.
+    """
+    def __init__(self, path2fid, ttl=DEFAULT_STATE_CACHE_TTL, maxSize=DEFAULT_STATE_CACHE_SIZE) -> None:
+        self.path2fid = path2fid
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self._fids = OrderedDict()
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _fid(self, filePath):
+        with self._lock:
+            fid = self._fids.get(filePath)
+        if fid is None:
+            fid = fid_key(self.path2fid(filePath))
+            with self._lock:
+                self._fids[filePath] = fid
+                if len(self._fids) > self.maxSize:
+                    _, evicted = self._fids.popitem(last=False)
+                    self._states.pop(evicted, None)
+        return fid
+
+    def get(self, filePath, fetch):
+        """Returns the HSM state bitmask of a file, calling fetch only if the cached one is missing or expired
+
+        Args:
+            filePath (str): file path on the file system
+            fetch (callable): function returning the state bitmask of a file path
+
+        Returns:
+            int: HSM state bitmask
+        """
+        if not self.enabled:
+            return fetch(filePath)
+
+        fid = self._fid(filePath)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._states.get(fid)
+        if entry is not None and now - entry[1] < self.ttl:
+            return entry[0]
+
+        flags = fetch(filePath)
+        with self._lock:
+            self._states[fid] = (flags, now)
+            self._states.move_to_end(fid)
+            if len(self._states) > self.maxSize:
+                self._states.popitem(last=False)
+        return flags
+
+    def invalidate(self, filePath):
+        """Drops the cached state of a file
+
+        Args:
+            filePath (str): file path on the file system
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            fid = self._fids.pop(filePath, None)
+            if fid is not None:
+                self._states.pop(fid, None)
+
+    def clear(self):
+        with self._lock:
+            self._fids.clear()
+            self._states.clear()
+
+
+class FIDCache:
+    """Bounded handoff of the FIDs already looked up for files about to be processed, e.g. by the shard
+    filter, so that the HSM request of a file does not look its FID up again. Every FID is used once.
+
+    Args:
+        maxSize (int, optional): maximum number of kept FIDs, the oldest ones are dropped. Defaults to 100000.
+    """
+    def __init__(self, maxSize=DEFAULT_FID_CACHE_SIZE) -> None:
+        self.maxSize = maxSize
+        self._fids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, filePath, lufid):
+        """Keeps the FID of a file
+
+        Args:
+            filePath (str): absolute file path
+            lufid (lu_fid): Lustre FID of the file
+        """
+        with self._lock:
+            self._fids[filePath] = lufid
+            if len(self._fids) > self.maxSize:
+                self._fids.popitem(last=False)
+
+    def pop(self, filePath):
+        """Returns and forgets the FID of a file
+
+        Args:
+            filePath (str): absolute file path
+
+        Returns:
+            (lu_fid): the FID of the file, None if it is not known
+        """
+        with self._lock:
+            return self._fids.pop(filePath, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._fids)
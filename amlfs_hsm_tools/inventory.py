@@ -0,0 +1,134 @@
+import base64
+import csv
+import datetime
+import email.utils
+import glob
+import json
+import logging
+import os
+
+from collections import namedtuple
+
+
+INVENTORY_FIELDS = ('Name', 'Content-Length', 'Last-Modified', 'Etag', 'Content-MD5')
+# Manifest fields giving the time the report reflects, the earliest one found is used
+MANIFEST_TIME_FIELDS = ('inventoryStartTime', 'inventoryCompletionTime')
+PARQUET_BATCH_SIZE = 65536
+
+InventoryBlob = namedtuple('InventoryBlob', ['name', 'size', 'last_modified', 'etag', 'content_md5'])
+
+
+def parse_time(value):
+    """Parses a timestamp of an inventory report or manifest
+
+    Args:
+        value (str | datetime | float): ISO 8601 or RFC 1123 string, datetime or POSIX timestamp
+
+    Returns:
+        float: POSIX timestamp, None if the value is empty or cannot be parsed
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=value.tzinfo or datetime.timezone.utc).timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            parsed = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    return parsed.replace(tzinfo=parsed.tzinfo or datetime.timezone.utc).timestamp()
+
+
+def _md5(value):
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        return value
+    try:
+        return base64.b64decode(value)
+    except ValueError:
+        return None
+
+
+class BlobInventory:
+    """Azure Blob Inventory report of the HSM container, read as a stream of blobs instead of listing
+    the container. The report is a CSV or Parquet file, or a directory with the files of a run and
+    its manifest, from which the report time is read. Names qualified with the container are made
+    relative to it. Parquet files require the pyarrow package.
+
+    Args:
+        path (str): report file or directory
+        containerName (str, optional): HSM container, stripped from the qualified names. Defaults to None.
+        reportTime (float | str, optional): time the report reflects, as a timestamp or an ISO 8601 string.
+            Defaults to the manifest time, if any.
+    """
+    def __init__(self, path, containerName=None, reportTime=None) -> None:
+        self.path = path
+        self.containerName = containerName
+        self.reportTime = parse_time(reportTime)
+        if reportTime is not None and self.reportTime is None:
+            raise ValueError('Invalid inventory report time {}.'.format(reportTime))
+        if os.path.isdir(path):
+            self.files = sorted(file for pattern in ('*.csv', '*.parquet')
+                                for file in glob.glob(os.path.join(path, '**', pattern), recursive=True))
+            if self.reportTime is None:
+                self.reportTime = self._manifestTime()
+        else:
+            self.files = [path]
+        if not self.files:
+            raise ValueError('No CSV or Parquet inventory files found in {}.'.format(path))
+
+    def _manifestTime(self):
+        times = []
+        for manifestFile in glob.glob(os.path.join(self.path, '**', '*manifest.json'), recursive=True):
+            with open(manifestFile, 'r') as fid:
+                manifest = json.load(fid)
+            times.extend(parse_time(manifest.get(field)) for field in MANIFEST_TIME_FIELDS)
+        times = [time for time in times if time is not None]
+        return min(times) if times else None
+
+    def _blob(self, row):
+        name = row['Name']
+        if self.containerName and name.startswith(self.containerName + '/'):
+            name = name[len(self.containerName) + 1:]
+        size = row.get('Content-Length')
+        return InventoryBlob(name, int(size) if size not in (None, '') else 0, parse_time(row.get('Last-Modified')),
+                             row.get('Etag') or None, _md5(row.get('Content-MD5')))
+
+    def _readCSV(self, file):
+        with open(file, 'r', newline='') as fid:
+            for row in csv.DictReader(fid):
+                yield self._blob(row)
+
+    def _readParquet(self, file):
+        import pyarrow.parquet
+
+        parquetFile = pyarrow.parquet.ParquetFile(file)
+        columns = [field for field in INVENTORY_FIELDS if field in parquetFile.schema_arrow.names]
+        for batch in parquetFile.iter_batches(batch_size=PARQUET_BATCH_SIZE, columns=columns):
+            for row in batch.to_pylist():
+                yield self._blob(row)
+
+    def blobs(self, prefix=''):
+        """Streams the blobs of the report
+
+        Args:
+            prefix (str, optional): only blobs under this prefix are returned. Defaults to ''.
+
+        Yields:
+            (InventoryBlob): name, size, last modified timestamp, ETag and MD5 of the blob
+        """
+        for file in self.files:
+            logging.info('Reading inventory file {}'.format(file))
+            rows = self._readParquet(file) if file.endswith('.parquet') else self._readCSV(file)
+            for blob in rows:
+                if blob.name.startswith(prefix):
+                    yield blob
@@ -0,0 +1,160 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_JOURNAL_BATCH_SIZE = 1000
+
+JOURNAL_FIELDS = ('fid', 'hsm_flags', 'blob_present', 'blob_size', 'blob_etag', 'action', 'file_size', 'file_mtime')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    fid TEXT,
+    hsm_flags INTEGER,
+    blob_present INTEGER,
+    blob_size INTEGER,
+    blob_etag TEXT,
+    action TEXT,
+    file_size INTEGER,
+    file_mtime REAL,
+    updated REAL
+)
+'''
+
+_UPSERT = '''
+INSERT INTO files (path, {fields}, updated) VALUES (?, {placeholders}, ?)
+ON CONFLICT(path) DO UPDATE SET {updates}, updated = excluded.updated
+'''.format(fields=', '.join(JOURNAL_FIELDS),
+           placeholders=', '.join('?' for _ in JOURNAL_FIELDS),
+           updates=', '.join('{0} = COALESCE(excluded.{0}, {0})'.format(field) for field in JOURNAL_FIELDS))
+
+
+class ScanJournal:
+    """SQLite journal of the files processed by a run. Records are buffered and written in
+    transactions of batchSize rows. Fields which are not known are left untouched.
+    """
+    def __init__(self, path, batchSize=DEFAULT_JOURNAL_BATCH_SIZE) -> None:
+        self.path = path
+        self.batchSize = batchSize
+        self._pending = []
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(_SCHEMA)
+        self._connection.commit()
+
+    def record(self, path, **fields):
+        """Records information about a file. Unknown keys raise a KeyError.
+
+        Args:
+            path (str): absolute file path on the file system
+            fields: values for the journal fields (fid, hsm_flags, blob_present, blob_size, blob_etag,
+                action, file_size, file_mtime)
+        """
+        for field in fields:
+            if field not in JOURNAL_FIELDS:
+                raise KeyError('Unknown journal field {}'.format(field))
+        row = (path,) + tuple(fields.get(field) for field in JOURNAL_FIELDS) + (time.time(),)
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batchSize:
+                self._flush()
+
+    def recordProcessed(self, path, action):
+        """Records that an action was completed on a file, with the file size and mtime at that time
+
+        Args:
+            path (str): absolute file path on the file system
+            action (str): action performed on the file
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.record(path, action=action)
+        else:
+            self.record(path, action=action, file_size=stat.st_size, file_mtime=stat.st_mtime)
+
+    def _flush(self):
+        if self._pending:
+            with self._connection:
+                self._connection.executemany(_UPSERT, self._pending)
+            self._pending = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def get(self, path):
+        """Returns the journal record of a file
+
+        Args:
+            path (str): absolute file path on the file system
+
+        Returns:
+            dict: the recorded fields, None if the file is not in the journal
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT {} FROM files WHERE path = ?'.format(', '.join(JOURNAL_FIELDS)), (path,)).fetchone()
+        return dict(zip(JOURNAL_FIELDS, row)) if row is not None else None
+
+    def isProcessed(self, path, action):
+        """Checks if an action was already completed on a file
+
+        Args:
+            path (str): absolute file path on the file system
+            action (str): action name
+
+        Returns:
+            bool: True if the journal records the action for the file
+        """
+        record = self.get(path)
+        return record is not None and record['action'] == action
+
+    def isUnchanged(self, path, action):
+        """Checks if a file was already processed by an action, was not found missing from the
+        HSM backend and did not change size or mtime since
+
+        Args:
+            path (str): absolute file path on the file system
+            action (str): action name
+
+        Returns:
+            bool: True if the file does not need to be queried again
+        """
+        record = self.get(path)
+        if record is None or record['action'] != action or record['blob_present'] == 0:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return record['file_size'] == stat.st_size and record['file_mtime'] == stat.st_mtime
+
+    def filter(self, paths, action, resume=False, incremental=False):
+        """Filters a stream of paths dropping the ones the journal says can be skipped
+
+        Args:
+            paths (iterable[str]): stream of file paths
+            action (str): action name
+            resume (bool, optional): skip files on which the action was already completed. Defaults to False.
+            incremental (bool, optional): skip files unchanged since they were found on the HSM backend. Defaults to False.
+
+        Yields:
+            str: file path to be processed
+        """
+        skipped = 0
+        for path in paths:
+            absolutePath = os.path.abspath(path)
+            if (resume and self.isProcessed(absolutePath, action)) or (incremental and self.isUnchanged(absolutePath, action)):
+                skipped += 1
+                continue
+            yield path
+        logging.info('Journal {}: skipped {} files already processed.'.format(self.path, skipped))
+
+    def close(self):
+        self.flush()
+        self._connection.close()
@@ -1,12 +1,96 @@
+import threading
+import time
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from azure.core.pipeline.transport import RequestsTransport
 from azure.identity import DefaultAzureCredential
 from azure.storage.blob import BlobServiceClient
 
-from .utilities import loadConfiguration
+from .metrics import blob_metrics_hooks
+from .utilities import loadConfiguration, DEFAULT_CONFIGURATION_FILE
+
+
+DEFAULT_CONNECTION_POOL_SIZE = 32
+TOKEN_REFRESH_MARGIN = 300
+
+
+class CachedTokenCredential:
+    """Wraps an Azure credential caching access tokens per scope until they are about to expire.
+    """
+    def __init__(self, credential, refreshMargin=TOKEN_REFRESH_MARGIN) -> None:
+        self.credential = credential
+        self.refreshMargin = refreshMargin
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes, **kwargs):
+        """Returns a cached token for the scopes, fetching a new one if close to expiry.
+
+        Args:
+            scopes (str): scopes the token is requested for
+
+        Returns:
+            (AccessToken): a valid access token
+        """
+        if kwargs.get('claims'):
+            return self.credential.get_token(*scopes, **kwargs)
+
+        with self._lock:
+            token = self._tokens.get(scopes)
+            if token is None or token.expires_on - self.refreshMargin <= time.time():
+                token = self.credential.get_token(*scopes, **kwargs)
+                self._tokens[scopes] = token
+            return token
+
+    def close(self):
+        self.credential.close()
+
+
+def build_credential(configuration):
+    """Builds the credential of a storage account: its account key if configured, a managed identity
+    credential caching its tokens otherwise
+
+    Args:
+        configuration (dict): backend configuration
+
+    Returns:
+        (str | CachedTokenCredential): the credential, to be shared by the clients of the account
+    """
+    if configuration.get('accountKey'):
+        return configuration['accountKey']
+    return CachedTokenCredential(DefaultAzureCredential(exclude_workload_identity_credential=True, exclude_environment_credential=True))
+
+
+def build_pooled_transport(poolSize=DEFAULT_CONNECTION_POOL_SIZE):
+    """Builds an HTTP transport keeping up to poolSize connections alive towards the storage account
+
+    Args:
+        poolSize (int): maximum number of pooled connections
+
+    Returns:
+        (RequestsTransport): transport to be shared by the blob clients
+    """
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return RequestsTransport(session=session, session_owner=True)
 
 
 class LFSBlobClient(BlobServiceClient):
-    def __init__(self, configurationFile='/etc/amlfs_hsm_tools.json', **kwargs) -> None:
-        configuration = loadConfiguration(configurationFile)
+    def __init__(self, configurationFile=DEFAULT_CONFIGURATION_FILE, configuration=None, credential=None, **kwargs) -> None:
+        if configuration is None:
+            configuration = loadConfiguration(configurationFile)
         self.accountURL = configuration.get('accountURL')
         self.containerName = configuration.get('containerName')
-        super().__init__(self.accountURL, credential=DefaultAzureCredential(exclude_workload_identity_credential=True, exclude_environment_credential=True), **kwargs)
+        if credential is None:
+            credential = build_credential(configuration)
+        if 'transport' not in kwargs:
+            kwargs['transport'] = build_pooled_transport(configuration.get('connectionPoolSize', DEFAULT_CONNECTION_POOL_SIZE))
+        for hook, callback in blob_metrics_hooks().items():
+            kwargs.setdefault(hook, callback)
+        # Throttling answers are retried by the backend rate controller, which also lowers the concurrency
+        kwargs.setdefault('retry_status', 0)
+        super().__init__(self.accountURL, credential=credential, **kwargs)
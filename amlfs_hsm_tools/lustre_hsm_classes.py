@@ -19,6 +19,13 @@ class hsm_state(ctypes.Structure):
         ("hus_extended_info", ctypes.c_char),
         ]
 
+class hsm_current_action(ctypes.Structure):
+    _fields_ = [
+        ("hca_state", ctypes.c_uint),
+        ("hca_action", ctypes.c_uint),
+        ("hca_location", hsm_extent),
+        ]
+
 class hsm_request(ctypes.Structure):
      _fields_ = [
          ("hr_action", ctypes.c_uint),
@@ -42,3 +49,25 @@ class hsm_user_request(ctypes.Structure):
          ("hur_user_item", hsm_user_item * 1)
      ]
 
+
+
+def hsm_user_request_type(itemcount):
+    """Returns an hsm_user_request structure type holding itemcount user items
+
+    Args:
+        itemcount (int): number of hsm_user_item in the request
+
+    Returns:
+        (type): ctypes structure type for the request
+    """
+    if itemcount not in _hsm_user_request_types:
+        _hsm_user_request_types[itemcount] = type('hsm_user_request_{}'.format(itemcount), (ctypes.Structure,), {
+            '_fields_': [
+                ("hur_request", hsm_request),
+                ("hur_user_item", hsm_user_item * itemcount)
+            ]
+        })
+    return _hsm_user_request_types[itemcount]
+
+
+_hsm_user_request_types = {1: hsm_user_request}
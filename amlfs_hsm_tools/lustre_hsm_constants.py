@@ -18,6 +18,13 @@ HUA_RELEASE = "HUA_RELEASE"
 HUA_REMOVE  = "HUA_REMOVE"
 HUA_CANCEL = "HUA_CANCEL"
 
+DEFAULT_HSM_BATCH_SIZE = 1000
+
+HPS_NONE = 0
+HPS_WAITING = 1
+HPS_RUNNING = 2
+HPS_DONE = 3
+
 
 HSM_STATE_MAP = {
     HSM_NONE_STATE: '0x00000000',
@@ -39,3 +46,5 @@ HSM_ACTION_MAP = {
 	HUA_CANCEL:  14 
 }
 
+
+HSM_STATE_FLAGS = {state: int(flag, 16) for state, flag in HSM_STATE_MAP.items()}
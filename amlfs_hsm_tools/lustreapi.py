@@ -3,9 +3,57 @@ import ctypes.util
 import os
 
 from .lustreapi_classes import lu_fid
+from .metrics import metrics
 
-liblocation = ctypes.util.find_library("lustreapi")
-lustre = ctypes.CDLL(liblocation, use_errno=True)
+LUSTREAPI_BACKEND_VARIABLE = 'AMLFS_HSM_LUSTREAPI'
+
+# fake loads the in-process stand-in, any other value the shared library at that path
+if os.environ.get(LUSTREAPI_BACKEND_VARIABLE) == 'fake':
+    from .lustreapi_fake import FakeLustreAPI
+    lustre = FakeLustreAPI()
+else:
+    liblocation = os.environ.get(LUSTREAPI_BACKEND_VARIABLE) or ctypes.util.find_library("lustreapi")
+    lustre = ctypes.CDLL(liblocation, use_errno=True)
+
+PATH_MAX = 4096
+
+
+def llapi_errcheck(result, function, arguments):
+    """errcheck of the liblustreapi symbols, which return a negated errno on failure
+
+    Raises:
+        IOError: the error returned by the call
+
+    Returns:
+        int: the result of the call
+    """
+    if result < 0:
+        raise IOError(-result, os.strerror(-result))
+    return result
+
+
+def declare(symbol, argtypes, timed=True):
+    """Declares the signature of a liblustreapi symbol returning an int status, so that ctypes
+    neither guesses the argument conversions nor leaves the status to be checked by the callers
+
+    Args:
+        symbol (callable): the symbol of the library
+        argtypes (list): ctypes types of the arguments
+        timed (bool, optional): if every call is recorded in the llapi metrics. Defaults to True.
+
+    Returns:
+        callable: the symbol
+    """
+    symbol.argtypes = argtypes
+    symbol.restype = ctypes.c_int
+    symbol.errcheck = llapi_errcheck
+    return metrics.timed('llapi', symbol.__name__, symbol) if timed else symbol
+
+
+llapi_path2fid = declare(lustre.llapi_path2fid, [ctypes.c_char_p, ctypes.POINTER(lu_fid)])
+llapi_fd2fid = declare(lustre.llapi_fd2fid, [ctypes.c_int, ctypes.POINTER(lu_fid)], timed=False)
+llapi_fid2path = declare(lustre.llapi_fid2path, [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int,
+                                                 ctypes.POINTER(ctypes.c_longlong), ctypes.POINTER(ctypes.c_int)])
 
 
 def path2fid(filename):
@@ -21,13 +69,45 @@ def path2fid(filename):
         lu_fid: lu_fid object for the file
     """
     lufid = lu_fid()
-    err = lustre.llapi_path2fid(
+    llapi_path2fid(
         filename.encode('utf8'),
         ctypes.byref(lufid))
-    if err < 0:
-        err = 0 - err
-        raise IOError(err, os.strerror(err))
     return lufid
-    
 
 
+def format_fid(lufid):
+    """Formats a FID as printed by lfs path2fid
+
+    Args:
+        lufid (lu_fid): lu_fid object
+
+    Returns:
+        str: the FID as [0xseq:0xoid:0xver]
+    """
+    return '[0x{:x}:0x{:x}:0x{:x}]'.format(lufid.f_seq, lufid.f_oid, lufid.f_ver)
+
+
+def fid2path(device, fid):
+    """Invokes LustreAPI to get the path of a FID, relative to the filesystem root
+
+    Args:
+        device (str): Lustre mount point or filesystem name
+        fid (str): FID formatted as [0xseq:0xoid:0xver]
+
+    Raises:
+        IOError: the error in case API call fails
+
+    Returns:
+        str: file path relative to the filesystem root
+    """
+    path = ctypes.create_string_buffer(PATH_MAX)
+    recno = ctypes.c_longlong(-1)
+    linkno = ctypes.c_int(0)
+    llapi_fid2path(
+        device.encode('utf8'),
+        fid.encode('utf8'),
+        path,
+        PATH_MAX,
+        ctypes.byref(recno),
+        ctypes.byref(linkno))
+    return path.value.decode('utf8')
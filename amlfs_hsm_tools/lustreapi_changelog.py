@@ -0,0 +1,185 @@
+import ctypes
+import json
+import logging
+import os
+
+from collections import namedtuple
+
+from .lustreapi import lustre, declare, fid2path, format_fid
+from .lustreapi_classes import lu_fid
+from .utilities import loadConfiguration
+
+
+CL_CREATE = 1
+CL_HARDLINK = 3
+CL_MKNOD = 5
+CL_UNLINK = 6
+CL_CLOSE = 11
+CL_LAYOUT = 12
+CL_TRUNC = 13
+CL_SETATTR = 14
+CL_HSM = 16
+CL_MTIME = 17
+
+CHANGELOG_CHANGED_TYPES = (CL_CREATE, CL_HARDLINK, CL_MKNOD, CL_CLOSE, CL_LAYOUT, CL_TRUNC, CL_SETATTR, CL_HSM, CL_MTIME)
+CHANGELOG_UNLINKED_TYPES = (CL_UNLINK,)
+
+CLF_UNLINK_LAST = 0x0001
+
+DEFAULT_CHANGELOG_STATE_FILE = '/var/tmp/amlfs_hsm_tools_changelog.json'
+
+
+class changelog_rec(ctypes.Structure):
+    _pack_ = 1
+    _fields_ = [
+        ("cr_namelen", ctypes.c_ushort),
+        ("cr_flags", ctypes.c_ushort),
+        ("cr_type", ctypes.c_uint),
+        ("cr_index", ctypes.c_ulonglong),
+        ("cr_prev", ctypes.c_ulonglong),
+        ("cr_time", ctypes.c_ulonglong),
+        ("cr_tfid", lu_fid),
+        ("cr_pfid", lu_fid),
+        ]
+
+
+llapi_changelog_start = declare(lustre.llapi_changelog_start, [ctypes.POINTER(ctypes.c_void_p), ctypes.c_int, ctypes.c_char_p, ctypes.c_longlong])
+llapi_changelog_recv = declare(lustre.llapi_changelog_recv, [ctypes.c_void_p, ctypes.POINTER(ctypes.POINTER(changelog_rec))])
+llapi_changelog_free = declare(lustre.llapi_changelog_free, [ctypes.POINTER(ctypes.POINTER(changelog_rec))], timed=False)
+llapi_changelog_fini = declare(lustre.llapi_changelog_fini, [ctypes.POINTER(ctypes.c_void_p)], timed=False)
+llapi_changelog_clear = declare(lustre.llapi_changelog_clear, [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_longlong])
+
+
+ChangelogRecord = namedtuple('ChangelogRecord', ['index', 'type', 'fid', 'flags'], defaults=(0,))
+
+
+class LustreChangelogSource:
+    """Iterates the changelog records of an MDT from a start record, until the end of the changelog
+
+    Args:
+        mdtName (str): MDT device name, e.g. lustrefs-MDT0000
+        startRecord (int): first changelog record to be read
+    """
+    def __init__(self, mdtName, startRecord=0) -> None:
+        self.mdtName = mdtName
+        self.startRecord = startRecord
+
+    def __iter__(self):
+        priv = ctypes.c_void_p()
+        llapi_changelog_start(ctypes.byref(priv), 0, self.mdtName.encode('utf8'), self.startRecord)
+        try:
+            record = ctypes.POINTER(changelog_rec)()
+            # recv returns 1 at the end of the changelog
+            while llapi_changelog_recv(priv, ctypes.byref(record)) == 0:
+                contents = record.contents
+                yield ChangelogRecord(contents.cr_index, contents.cr_type, format_fid(contents.cr_tfid), contents.cr_flags)
+                llapi_changelog_free(ctypes.byref(record))
+        finally:
+            llapi_changelog_fini(ctypes.byref(priv))
+
+
+class ChangelogChanges:
+    """FIDs collected from a range of changelog records, with the FIDs which failed in the previous runs
+    """
+    def __init__(self, pending=()) -> None:
+        self.changed = set(pending)
+        self.unlinked = set()
+        self.endRecord = None
+        self.fids = {}
+
+    def add(self, record):
+        if record.type in CHANGELOG_CHANGED_TYPES:
+            self.changed.add(record.fid)
+        elif record.type in CHANGELOG_UNLINKED_TYPES and record.flags & CLF_UNLINK_LAST:
+            self.changed.discard(record.fid)
+            self.unlinked.add(record.fid)
+        self.endRecord = record.index
+
+    def paths(self, mountPoint, resolve=fid2path):
+        """Resolves the changed FIDs to paths under the mount point, skipping the ones not existing anymore
+
+        Args:
+            mountPoint (str): Lustre mount point
+            resolve (callable, optional): function resolving a FID to a path relative to the filesystem root
+
+        Yields:
+            str: file path
+        """
+        for fid in self.changed:
+            try:
+                path = os.path.join(mountPoint, resolve(mountPoint, fid).lstrip('/'))
+            except IOError as error:
+                logging.info('FID {} cannot be resolved, skipping: {}'.format(fid, str(error)))
+                continue
+            self.fids[os.path.abspath(path)] = fid
+            yield path
+
+
+class ChangelogTracker:
+    """Reads the changelog of an MDT from the last record processed by a registered changelog user,
+    and clears it once the changes have been handled. The last record is kept in a JSON state file, with
+    the FIDs of the files which failed, collected again by the next run.
+
+    Args:
+        mdtName (str): MDT device name, e.g. lustrefs-MDT0000
+        user (str): changelog user registered with lctl changelog_register, e.g. cl1
+        stateFile (str, optional): JSON file storing the last processed record per MDT
+    """
+    def __init__(self, mdtName, user, stateFile=DEFAULT_CHANGELOG_STATE_FILE) -> None:
+        self.mdtName = mdtName
+        self.user = user
+        self.stateFile = stateFile
+
+    def _loadState(self):
+        return loadConfiguration(self.stateFile) if os.path.exists(self.stateFile) else {}
+
+    def _mdtState(self):
+        state = self._loadState().get(self.mdtName, {})
+        # State files written before the pending FIDs were kept hold the last record only
+        return {'record': state} if isinstance(state, int) else state
+
+    def lastRecord(self):
+        return self._mdtState().get('record', 0)
+
+    def pendingFids(self):
+        return self._mdtState().get('pending', [])
+
+    def collect(self, source=None):
+        """Collects the FIDs changed since the last processed record, and the ones which failed in the previous run
+
+        Args:
+            source (iterable[ChangelogRecord], optional): changelog records. Defaults to the MDT changelog.
+
+        Returns:
+            (ChangelogChanges): the collected changes
+        """
+        if source is None:
+            source = LustreChangelogSource(self.mdtName, self.lastRecord() + 1)
+        changes = ChangelogChanges(self.pendingFids())
+        for record in source:
+            changes.add(record)
+        logging.info('Changelog {}: {} changed and {} unlinked FIDs up to record {}.'.format(
+            self.mdtName, len(changes.changed), len(changes.unlinked), changes.endRecord))
+        return changes
+
+    def commit(self, changes, clear=True, failed=()):
+        """Stores the last processed record and clears the changelog up to it for the registered user.
+        The FIDs of the failed files are stored, so that the next run processes them again.
+
+        Args:
+            changes (ChangelogChanges): the handled changes
+            clear (bool, optional): if the MDT changelog should be cleared. Defaults to True.
+            failed (iterable[str], optional): paths of the files whose action failed. Defaults to none.
+        """
+        pending = sorted({changes.fids[os.path.abspath(path)] for path in failed if os.path.abspath(path) in changes.fids})
+        if changes.endRecord is None and pending == sorted(self.pendingFids()):
+            return
+        if clear and changes.endRecord is not None:
+            llapi_changelog_clear(self.mdtName.encode('utf8'), self.user.encode('utf8'), changes.endRecord)
+        if pending:
+            logging.info('Changelog {}: {} failed FIDs kept for the next run.'.format(self.mdtName, len(pending)))
+        state = self._loadState()
+        record = self.lastRecord() if changes.endRecord is None else changes.endRecord
+        state[self.mdtName] = {'record': record, 'pending': pending}
+        with open(self.stateFile, 'w') as fid:
+            json.dump(state, fid)
@@ -0,0 +1,223 @@
+import collections
+import errno
+import os
+import threading
+import time
+
+from .lustre_hsm_classes import hsm_user_request_type
+from .lustre_hsm_constants import HSM_ACTION_MAP, HSM_STATE_FLAGS, HSM_ARCHIVED_STATE, HSM_DIRTY_STATE, HSM_EXISTS_STATE, \
+                                  HSM_LOST_STATE, HSM_RELEASED_STATE, HUA_ARCHIVE, HUA_RELEASE, HUA_REMOVE, HUA_RESTORE, HPS_NONE
+
+
+HSM_ACTION_NAMES = {code: action for action, code in HSM_ACTION_MAP.items()}
+
+EXISTS = HSM_STATE_FLAGS[HSM_EXISTS_STATE]
+ARCHIVED = HSM_STATE_FLAGS[HSM_ARCHIVED_STATE]
+DIRTY = HSM_STATE_FLAGS[HSM_DIRTY_STATE]
+LOST = HSM_STATE_FLAGS[HSM_LOST_STATE]
+RELEASED = HSM_STATE_FLAGS[HSM_RELEASED_STATE]
+# Archive ID of the archive requests without one, as set by the coordinator
+DEFAULT_ARCHIVE_ID = 1
+
+
+def _apply_action(action, flags):
+    if action == HUA_ARCHIVE:
+        return (flags | EXISTS | ARCHIVED) & ~(DIRTY | LOST)
+    if action == HUA_RELEASE:
+        return flags | RELEASED if flags & ARCHIVED and not flags & DIRTY else flags
+    if action == HUA_RESTORE:
+        return flags & ~RELEASED
+    if action == HUA_REMOVE:
+        return flags & ~(EXISTS | ARCHIVED) if not flags & RELEASED else flags
+    return flags
+
+
+class FakeLustreAPI:
+    """In-process stand-in of liblustreapi, exposing the llapi_path2fid, llapi_fd2fid, llapi_fid2path,
+    llapi_hsm_state_get/get_fd/set, llapi_hsm_current_action, llapi_hsm_user_request_alloc and llapi_hsm_request
+    symbols with the same calling convention as the ctypes ones, errcheck included. Files are the ones of the local file system, with their FID derived from the
+    device and inode numbers, while HSM states and archive IDs are kept in memory. HSM requests are completed
+    immediately, as if served by a copytool, which can be hooked to blob backends. Other symbols fail with ENOSYS.
+    The lustreapi module loads it in place of the shared library when AMLFS_HSM_LUSTREAPI is set to fake.
+
+    Args:
+        latency (float, optional): seconds spent in every call. Defaults to 0.
+        copytool (callable, optional): called with the action name, the file path and the archive ID of each completed request item
+        maxRequests (int, optional): HSM requests in flight beyond which the coordinator answers EAGAIN. Defaults to no limit.
+    """
+    def __init__(self, latency=0.0, copytool=None, maxRequests=None) -> None:
+        self.latency = latency
+        self.copytool = copytool
+        self.maxRequests = maxRequests
+        self.requestsInFlight = 0
+        self.calls = collections.Counter()
+        self._flags = {}
+        self._archives = {}
+        self._paths = {}
+        self._lock = threading.Lock()
+        for name in ('llapi_path2fid', 'llapi_fd2fid', 'llapi_fid2path', 'llapi_hsm_state_get', 'llapi_hsm_state_get_fd',
+                     'llapi_hsm_state_set', 'llapi_hsm_current_action', 'llapi_hsm_user_request_alloc', 'llapi_hsm_request'):
+            self._bind(name, getattr(self, '_{}'.format(name)))
+
+    def _bind(self, name, implementation):
+        # Plain functions, so that argtypes and restype can be assigned as on ctypes symbols
+        def symbol(*args):
+            with self._lock:
+                self.calls[name] += 1
+            if self.latency:
+                time.sleep(self.latency)
+            result = implementation(*args)
+            errcheck = getattr(symbol, 'errcheck', None)
+            return errcheck(result, symbol, args) if errcheck is not None else result
+        symbol.__name__ = name
+        self.__dict__[name] = symbol
+        return symbol
+
+    def __getattr__(self, name):
+        if not name.startswith('llapi_'):
+            raise AttributeError(name)
+        return self._bind(name, lambda *args: -errno.ENOSYS)
+
+    def rpcs(self):
+        """Returns the total number of calls made to the API
+
+        Returns:
+            int: number of calls
+        """
+        with self._lock:
+            return sum(self.calls.values())
+
+    def getFlags(self, filePath):
+        """Returns the HSM state bitmask of a file, without counting it as an API call
+
+        Args:
+            filePath (str): file path on the file system
+
+        Returns:
+            int: HSM state bitmask
+        """
+        stat = os.stat(filePath)
+        with self._lock:
+            return self._flags.get((stat.st_dev, stat.st_ino), 0)
+
+    def _fid(self, path):
+        stat = os.stat(path)
+        key = (stat.st_dev, stat.st_ino)
+        with self._lock:
+            self._paths[key] = path
+        return key
+
+    def _fdKey(self, fd):
+        stat = os.fstat(fd)
+        key = (stat.st_dev, stat.st_ino)
+        with self._lock:
+            # The path is kept for fid2path and the copytool, as /proc resolves it from the descriptor
+            self._paths.setdefault(key, os.readlink('/proc/self/fd/{}'.format(fd)))
+        return key
+
+    def _llapi_path2fid(self, path, lufid):
+        try:
+            seq, oid = self._fid(path.decode('utf8'))
+        except OSError as error:
+            return -error.errno
+        lufid._obj.f_seq, lufid._obj.f_oid, lufid._obj.f_ver = seq, oid, 0
+        return 0
+
+    def _llapi_fd2fid(self, fd, lufid):
+        try:
+            seq, oid = self._fdKey(fd)
+        except OSError as error:
+            return -error.errno
+        lufid._obj.f_seq, lufid._obj.f_oid, lufid._obj.f_ver = seq, oid, 0
+        return 0
+
+    def _llapi_fid2path(self, device, fid, path, pathlen, recno, linkno):
+        seq, oid, _ = (int(field, 16) for field in fid.decode('utf8').strip('[]').split(':'))
+        with self._lock:
+            filePath = self._paths.get((seq, oid))
+        if filePath is None:
+            return -errno.ENOENT
+        path.value = os.path.relpath(filePath, device.decode('utf8')).encode('utf8')[:pathlen - 1]
+        return 0
+
+    def _llapi_hsm_state_get(self, path, state):
+        try:
+            key = self._fid(path.decode('utf8'))
+        except OSError as error:
+            return -error.errno
+        with self._lock:
+            state._obj.hus_states = self._flags.get(key, 0)
+            state._obj.hus_archive_id = self._archives.get(key, 0)
+            state._obj.hus_in_progress_state = HPS_NONE
+            state._obj.hus_in_progress_action = 0
+        return 0
+
+    def _llapi_hsm_state_get_fd(self, fd, state):
+        try:
+            key = self._fdKey(fd)
+        except OSError as error:
+            return -error.errno
+        with self._lock:
+            state._obj.hus_states = self._flags.get(key, 0)
+            state._obj.hus_archive_id = self._archives.get(key, 0)
+            state._obj.hus_in_progress_state = HPS_NONE
+            state._obj.hus_in_progress_action = 0
+        return 0
+
+    def _llapi_hsm_state_set(self, path, setmask, clearmask, archive_id):
+        try:
+            key = self._fid(path.decode('utf8'))
+        except OSError as error:
+            return -error.errno
+        with self._lock:
+            self._flags[key] = (self._flags.get(key, 0) | setmask) & ~clearmask
+            if archive_id:
+                self._archives[key] = archive_id
+        return 0
+
+    def _llapi_hsm_current_action(self, path, action):
+        try:
+            self._fid(path.decode('utf8'))
+        except OSError as error:
+            return -error.errno
+        action._obj.hca_state = HPS_NONE
+        action._obj.hca_action = 0
+        return 0
+
+    def _llapi_hsm_user_request_alloc(self, itemcount, data_len):
+        return hsm_user_request_type(itemcount)()
+
+    def _llapi_hsm_request(self, path, request):
+        with self._lock:
+            if self.maxRequests is not None and self.requestsInFlight >= self.maxRequests:
+                return -errno.EAGAIN
+            self.requestsInFlight += 1
+        try:
+            # The coordinator holds the request while the latency elapses again
+            if self.latency:
+                time.sleep(self.latency)
+            return self._queueRequest(request._obj)
+        finally:
+            with self._lock:
+                self.requestsInFlight -= 1
+
+    def _queueRequest(self, request):
+        action = HSM_ACTION_NAMES.get(request.hur_request.hr_action)
+        if action is None:
+            return -errno.EINVAL
+        items = request.hur_user_item[:request.hur_request.hr_itemcount]
+        with self._lock:
+            paths = [self._paths.get((item.hui_fid.f_seq, item.hui_fid.f_oid)) for item in items]
+        # As the coordinator, the whole request is rejected if any of its files does not exist anymore
+        if any(filePath is None or not os.path.lexists(filePath) for filePath in paths):
+            return -errno.ENOENT
+        for item, filePath in zip(items, paths):
+            key = (item.hui_fid.f_seq, item.hui_fid.f_oid)
+            with self._lock:
+                self._flags[key] = _apply_action(action, self._flags.get(key, 0))
+                if action == HUA_ARCHIVE:
+                    self._archives[key] = request.hur_request.hr_archive_id or self._archives.get(key) or DEFAULT_ARCHIVE_ID
+                archiveId = self._archives.get(key, DEFAULT_ARCHIVE_ID)
+            if self.copytool is not None:
+                self.copytool(action, filePath, archiveId)
+        return 0
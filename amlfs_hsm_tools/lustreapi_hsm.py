@@ -1,23 +1,43 @@
 import ctypes
 import os
+import threading
 
-from .lustre_hsm_constants import HSM_STATE_MAP, HSM_ACTION_MAP
+from .lustre_hsm_constants import HSM_STATE_MAP, HSM_ACTION_MAP, DEFAULT_HSM_BATCH_SIZE
 
-from .lustreapi import lustre, path2fid
-from .lustre_hsm_classes import hsm_state, hsm_user_request
+from .lustreapi import lustre, path2fid, declare, llapi_fd2fid
+from .metrics import metrics
+from .throttle import hsm_congested
+from .lustreapi_classes import lu_fid
+from .lustre_hsm_classes import hsm_state, hsm_current_action, hsm_user_request, hsm_user_request_type
 
 
-lustre.llapi_hsm_state_get.argtypes = [ctypes.c_char_p, ctypes.POINTER(hsm_state)]
-lustre.llapi_hsm_state_set.argtypes = [ctypes.c_char_p, ctypes.c_uint,
-                                       ctypes.c_uint, ctypes.c_uint]
 lustre.llapi_hsm_user_request_alloc.restype = hsm_user_request
-lustre.llapi_hsm_request.argtypes = [ctypes.c_char_p, ctypes.POINTER(hsm_user_request)]
 
-
-llapi_hsm_state_get = lustre.llapi_hsm_state_get
-llapi_hsm_state_set = lustre.llapi_hsm_state_set
+llapi_hsm_state_get = declare(lustre.llapi_hsm_state_get, [ctypes.c_char_p, ctypes.POINTER(hsm_state)])
+llapi_hsm_state_get_fd = declare(lustre.llapi_hsm_state_get_fd, [ctypes.c_int, ctypes.POINTER(hsm_state)], timed=False)
+llapi_hsm_state_set = declare(lustre.llapi_hsm_state_set, [ctypes.c_char_p, ctypes.c_ulonglong, ctypes.c_ulonglong, ctypes.c_uint])
 llapi_hsm_user_request_alloc = lustre.llapi_hsm_user_request_alloc
-llapi_hsm_request = lustre.llapi_hsm_request
+llapi_hsm_request = declare(lustre.llapi_hsm_request, [ctypes.c_char_p, ctypes.c_void_p])
+llapi_hsm_current_action = declare(lustre.llapi_hsm_current_action, [ctypes.c_char_p, ctypes.POINTER(hsm_current_action)])
+
+HSM_EXTENT_WHOLE_FILE = 0xFFFFFFFFFFFFFFFF
+# The file is opened only to be queried: no atime update, and no blocking on FIFOs
+QUERY_OPEN_FLAGS = os.O_RDONLY | os.O_NONBLOCK | getattr(os, 'O_NOATIME', 0)
+
+
+class ThreadBuffers(threading.local):
+    """ctypes structures reused by all the calls of a thread, with their pointers built once
+    """
+    def __init__(self) -> None:
+        self.fid = lu_fid()
+        self.fidPointer = ctypes.byref(self.fid)
+        self.state = hsm_state()
+        self.statePointer = ctypes.byref(self.state)
+        self.action = hsm_current_action()
+        self.actionPointer = ctypes.byref(self.action)
+
+
+_buffers = ThreadBuffers()
 
 
 def hsm_states_list_from_status_flag(status_flag):
@@ -44,6 +64,87 @@ def hsm_flags_from_states_list(status_list):
     return sum(int(HSM_STATE_MAP[state], 16) for state in HSM_STATE_MAP if state in status_list)
 
 
+def get_hsm_flags(filename):
+    """Gets the HSM state bitmask of a file from LustreAPI
+
+    Args:
+        filename (str): filen path on the file system
+
+    Raises:
+        IOError: the error in case API call fails
+
+    Returns:
+        int: HSM state bitmask
+    """
+    llapi_hsm_state_get(filename.encode('utf8'), _buffers.statePointer)
+    return int(_buffers.state.hus_states)
+
+
+def get_hsm_flags_and_archive_id(filename):
+    """Gets the HSM state bitmask and the HSM archive ID of a file from a single LustreAPI call
+
+    Args:
+        filename (str): file path on the file system
+
+    Raises:
+        IOError: the error in case API call fails
+
+    Returns:
+        tuple[int, int]: HSM state bitmask, and archive ID the file is archived in (0 if it was never archived)
+    """
+    llapi_hsm_state_get(filename.encode('utf8'), _buffers.statePointer)
+    return int(_buffers.state.hus_states), int(_buffers.state.hus_archive_id)
+
+
+def get_hsm_progress(filename):
+    """Gets the HSM state bitmask of a file and the progress of the action running on it from a single
+    LustreAPI call
+
+    Args:
+        filename (str): file path on the file system
+
+    Raises:
+        IOError: the error in case API call fails
+
+    Returns:
+        tuple[int, int, int]: HSM state bitmask, the action progress state (HPS constants) and the copytool action code
+    """
+    llapi_hsm_state_get(filename.encode('utf8'), _buffers.statePointer)
+    state = _buffers.state
+    return int(state.hus_states), int(state.hus_in_progress_state), int(state.hus_in_progress_action)
+
+
+def _get_fid_and_hsm_flags(filename, withStat=False):
+    """Gets the FID and the HSM state bitmask of a file opening it once, with the fd-based LustreAPI calls.
+    The query is recorded as a whole in the llapi metrics, as fd_query.
+
+    Args:
+        filename (str): file path on the file system
+        withStat (bool, optional): if the file is also stat-ed on the same descriptor. Defaults to False.
+
+    Raises:
+        IOError: the error in case the open or an API call fails
+
+    Returns:
+        tuple[lu_fid, int, os.stat_result]: FID, HSM state bitmask and stat of the file (None if not requested)
+    """
+    try:
+        fd = os.open(filename, QUERY_OPEN_FLAGS)
+    except PermissionError:
+        # O_NOATIME is allowed only to the owner of the file
+        fd = os.open(filename, QUERY_OPEN_FLAGS & ~getattr(os, 'O_NOATIME', 0))
+    try:
+        llapi_fd2fid(fd, _buffers.fidPointer)
+        llapi_hsm_state_get_fd(fd, _buffers.statePointer)
+        stat = os.fstat(fd) if withStat else None
+    finally:
+        os.close(fd)
+    return lu_fid.from_buffer_copy(_buffers.fid), int(_buffers.state.hus_states), stat
+
+
+get_fid_and_hsm_flags = metrics.timed('llapi', 'fd_query', _get_fid_and_hsm_flags)
+
+
 def get_hsm_state(filename):
     """Gets the HSM state of a file from LustreAPI
 
@@ -56,13 +157,23 @@ def get_hsm_state(filename):
     Returns:
         str: HSM State from HSM constants
     """
-    state = hsm_state()
-    err = llapi_hsm_state_get(
-        filename.encode(), ctypes.byref(state))
-    if err < 0:
-        err = 0 - err
-        raise IOError(err, os.strerror(err))
-    return hsm_states_list_from_status_flag(int(state.hus_states))
+    return hsm_states_list_from_status_flag(get_hsm_flags(filename))
+
+
+def get_hsm_current_action(filename):
+    """Gets the HSM action currently running on a file from LustreAPI
+
+    Args:
+        filename (str): filen path on the file system
+
+    Raises:
+        IOError: the error in case API call fails
+
+    Returns:
+        tuple[int, int]: the action progress state (HPS constants) and the copytool action code
+    """
+    llapi_hsm_current_action(filename.encode('utf8'), _buffers.actionPointer)
+    return int(_buffers.action.hca_state), int(_buffers.action.hca_action)
 
 
 def set_hsm_state(filename, setmask, clearmask, archive_id):
@@ -72,46 +183,125 @@ def set_hsm_state(filename, setmask, clearmask, archive_id):
         filename (str): filen path on the file system
         setmask (list[str]): list of states to be set from HSM constants
         clearmask (list[str]): list of states to be removed from HSM constants
-        archive_id (int): archive id (default to 1)
+        archive_id (int): archive id to be set, 0 keeps the current one
 
     Raises:
         IOError: the error in case API call fails
     """
-    err = llapi_hsm_state_set(
+    llapi_hsm_state_set(
         filename.encode('utf8'),
         hsm_flags_from_states_list(setmask),
         hsm_flags_from_states_list(clearmask),
         archive_id)
-    if err < 0:
-        err = 0 - err
-        raise IOError(err, os.strerror(err))
     
 
-def hsm_request(filePath, action):
+def hsm_request(filePath, action, archive_id=0, fid=None):
     """Performs an HSM request using Lustre API
 
     Args:
         filePath (str): file path on the file system
         action (str): action name from HSM constants
+        archive_id (int, optional): archive id of the request. Defaults to 0, the coordinator default.
+        fid (lu_fid, optional): FID of the file, if already known. Defaults to looking it up.
 
     Raises:
         IOError: the error in case API call fails
     """
     hsm_user_request = llapi_hsm_user_request_alloc(1, 1)
     hsm_user_request.hur_request.hr_action = HSM_ACTION_MAP[action]
-    hsm_user_request.hur_request.hr_archive_id = 0
-    hsm_user_request.hur_request.hr_archive_id = 0
+    hsm_user_request.hur_request.hr_archive_id = archive_id
 
-    hsm_user_request.hur_user_item[0].hui_fid = path2fid(filePath)
+    hsm_user_request.hur_user_item[0].hui_fid = fid if fid is not None else path2fid(filePath)
     hsm_user_request.hur_user_item[0].hui_extent.offset = 0
     #hsm_user_request.hur_user_item[0].hui_extent.length = ctypes.-1LL;
 
     hsm_user_request.hur_request.hr_itemcount = 1
     hsm_user_request.hur_request.hr_data_len = 1
 
-    err = llapi_hsm_request(filePath.encode('utf-8'), ctypes.byref(hsm_user_request))
+    llapi_hsm_request(filePath.encode('utf-8'), ctypes.byref(hsm_user_request))
 
-    if err < 0:
-        err = 0 - err
-        raise IOError(err, os.strerror(err))
-    
+
+def _submit_hsm_batch(action, batch, archive_id):
+    request = hsm_user_request_type(len(batch))()
+    request.hur_request.hr_action = HSM_ACTION_MAP[action]
+    request.hur_request.hr_archive_id = archive_id
+    request.hur_request.hr_itemcount = len(batch)
+    request.hur_request.hr_data_len = 0
+
+    for item, (_, fid) in zip(request.hur_user_item, batch):
+        item.hui_fid = fid
+        item.hui_extent.offset = 0
+        item.hui_extent.length = HSM_EXTENT_WHOLE_FILE
+
+    llapi_hsm_request(batch[0][0].encode('utf-8'), ctypes.byref(request))
+
+
+def hsm_request_fids(items, action, batchSize=DEFAULT_HSM_BATCH_SIZE, archive_id=0, controller=None):
+    """Performs HSM requests on many files whose FID is already known, grouping up to batchSize FIDs per request.
+    All the files are expected to be on the same Lustre filesystem. A request rejected by the coordinator for
+    any other reason than congestion is split in halves and submitted again, down to single files, so that
+    only the files the coordinator refuses are reported as failed.
+
+    Args:
+        items (iterable[tuple[str, lu_fid]]): file paths on the file system with their FID
+        action (str): action name from HSM constants
+        batchSize (int, optional): maximum number of files per request. Defaults to 1000.
+        archive_id (int, optional): archive id of the request. Defaults to 0.
+        controller (RateController, optional): limits and retries the requests rejected by the coordinator
+
+    Returns:
+        dict[str, Exception]: the files that failed, with the related error
+    """
+    failures = {}
+    batch = []
+
+    def _submit(batch):
+        try:
+            if controller is not None:
+                controller.call(lambda: _submit_hsm_batch(action, batch, archive_id))
+            else:
+                _submit_hsm_batch(action, batch, archive_id)
+        except IOError as error:
+            # A single incompatible or unlinked file makes the coordinator reject the whole request
+            if len(batch) == 1 or hsm_congested(error):
+                failures.update((path, error) for path, _ in batch)
+            else:
+                _submit(batch[:len(batch) // 2])
+                _submit(batch[len(batch) // 2:])
+
+    for item in items:
+        batch.append(item)
+        if len(batch) == batchSize:
+            _submit(batch)
+            batch = []
+
+    if batch:
+        _submit(batch)
+    return failures
+
+
+def hsm_request_batch(filePaths, action, batchSize=DEFAULT_HSM_BATCH_SIZE, archive_id=0, controller=None):
+    """Performs HSM requests on many files using Lustre API, grouping up to batchSize FIDs per request.
+    All the files are expected to be on the same Lustre filesystem.
+
+    Args:
+        filePaths (iterable[str]): file paths on the file system
+        action (str): action name from HSM constants
+        batchSize (int, optional): maximum number of files per request. Defaults to 1000.
+        archive_id (int, optional): archive id of the request. Defaults to 0.
+        controller (RateController, optional): limits and retries the requests rejected by the coordinator
+
+    Returns:
+        dict[str, Exception]: the files that failed, with the related error
+    """
+    failures = {}
+
+    def _resolve():
+        for filePath in filePaths:
+            try:
+                yield filePath, path2fid(filePath)
+            except IOError as error:
+                failures[filePath] = error
+
+    failures.update(hsm_request_fids(_resolve(), action, batchSize, archive_id, controller))
+    return failures
@@ -1,18 +1,215 @@
 import os
+import sys
 import logging
 import argparse
+import json
+import time
+
+from .daemon import HSMDaemon, DAEMON_ACTIONS, DEFAULT_SOCKET_PATH, forward, is_daemon_running
+from .hsm_state_cache import DEFAULT_STATE_CACHE_TTL
+from .journal import ScanJournal
+from .metrics import metrics, MetricsExporter, DEFAULT_EXPORT_INTERVAL
+from .lustre_hsm_constants import HUA_ARCHIVE, HUA_RELEASE, HUA_RESTORE, DEFAULT_HSM_BATCH_SIZE
+from .reconcile import OrphanReconciler, DEFAULT_STAT_WORKERS
+from .shard import Shard, merge_reports, write_report
+from .release_policy import ReleasePolicy, DEFAULT_MAX_CANDIDATES
+from .stage import STAGE_ORDERS, ORDER_SIZE
+from .utilities import parse_size
+from .pipeline import ParallelWalker, ordered_map, process_stream, process_batches, read_paths, DEFAULT_WALK_WORKERS, DEFAULT_ACTION_WORKERS
+
+
+def iterate_files(fileNames, recursive=False, walker=None):
+    """Yields the files to be processed from the input paths, walking directories if recursive
+
+    Args:
+        fileNames (iterable[str]): input paths
+        recursive (bool, optional): if directories should be walked. Defaults to False.
+        walker (ParallelWalker, optional): walker used for directories
+
+    Yields:
+        str: file path
+    """
+    for file in fileNames:
+        logging.info('Processing file {}'.format(file))
+        if os.path.isdir(file):
+            if recursive:
+                yield from walker.walk([file])
+            else:
+                logging.warn('HSM operates on files, not on folders. The input path refers to a folder. {} will be skipped.'.format(file))
+        elif os.path.exists(file):
+            yield file
+        else:
+            logging.warn('The file provided does not exist on the system. {} will be skipped.'.format(file))
+
+
+WAIT_ACTIONS = {'archive': HUA_ARCHIVE, 'restore': HUA_RESTORE, 'release': HUA_RELEASE}
+# Actions sending HSM requests, which take the FIDs looked up by the shard filter
+FID_ACTIONS = ('archive', 'restore', 'release', 'remove')
+
+
+def input_paths(args):
+    """Chains the input paths from the command line, the list file and stdin, read lazily
+
+    Args:
+        args (Namespace): parsed command line arguments
+
+    Yields:
+        str: input path
+    """
+    yield from args.filenames
+    if args.from_file:
+        with open(args.from_file, 'rb') as fid:
+            yield from read_paths(fid, args.null)
+    if args.stdin:
+        yield from read_paths(sys.stdin.buffer, args.null)
+
+
+def parse_inventory(value):
+    """Parses an --inventory value, a report path optionally preceded by the archive ID of its backend (e.g. 2=/reports/hsm2)
+
+    Args:
+        value (str): command line value
+
+    Returns:
+        tuple[int, str]: archive ID of the backend, None for the default backend, and report path
+    """
+    archiveId, separator, path = value.partition('=')
+    if separator and archiveId.isdigit():
+        return int(archiveId), path
+    return None, value
+
+
+def can_forward(args):
+    """Checks if the run can be forwarded to the daemon: only plain actions on files can,
+    options changing the engine setup or the run flow are handled locally
+
+    Args:
+        args (Namespace): parsed command line arguments
+
+    Returns:
+        bool: True if the run can be forwarded
+    """
+    return args.action in DAEMON_ACTIONS and not args.no_daemon \
+           and not (args.bulk or args.async_blobs or args.journal or args.changelog or args.wait or args.shard or args.report or args.inventory)
+
+
+def run_action(azureManagedLustreHSM, args, files, onFailure=None):
+    """Runs the requested action on a stream of files, in batches if the engine supports it,
+    skipping and recording files in the journal if one is enabled and waiting for the HSM
+    action completion if requested
+
+    Args:
+        azureManagedLustreHSM (AzureManagedLustreHSM): the engine of the run
+        args (Namespace): parsed command line arguments
+        files (iterable[str]): stream of file paths
+        onFailure (callable, optional): called with the list of the files for which the action failed
+
+    Returns:
+        (StageCounter): the action throughput counter
+    """
+    onProcessed = []
+    journal = azureManagedLustreHSM.journal
+    if journal is not None:
+        files = journal.filter(files, args.action, args.resume, args.incremental)
+        onProcessed.append(lambda absolutePath: journal.recordProcessed(absolutePath, args.action))
+
+    tracker = None
+    if args.wait and args.action in WAIT_ACTIONS:
+        tracker = azureManagedLustreHSM.completionTracker()
+        onProcessed.append(lambda absolutePath: tracker.watchAction(absolutePath, WAIT_ACTIONS[args.action]))
+
+    batchAction = getattr(azureManagedLustreHSM, '{}Files'.format(args.action), None)
+    if batchAction is not None and args.batch_size > 1:
+        def runBatch(batch):
+            start = time.perf_counter()
+            failed = batchAction(batch, args.force)
+            metrics.observe('action', args.action, time.perf_counter() - start, bool(failed), len(batch))
+            for absolutePath in set(map(os.path.abspath, batch)).difference(failed):
+                for callback in onProcessed:
+                    callback(absolutePath)
+            return failed
+        counter = process_batches(files, runBatch, args.batch_size, workers=args.jobs, name=args.action, onFailure=onFailure)
+    else:
+        action = getattr(azureManagedLustreHSM, args.action)
+        timedAction = metrics.timed('action', args.action, action)
+        def runFile(file):
+            timedAction(file, args.force)
+            for callback in onProcessed:
+                callback(os.path.abspath(file))
+        counter = process_stream(files, runFile, workers=args.jobs, name=args.action, onFailure=onFailure)
+
+    if tracker is not None:
+        logging.info('Waiting for {} files to complete {}.'.format(len(tracker), args.action))
+        counter.failed(tracker.wait(args.wait_timeout))
+    return counter
+
+
+def print_stage_progress(files, totalFiles, stagedBytes, totalBytes):
+    print('Staged {}/{} files, {}/{} bytes.'.format(files, totalFiles, stagedBytes, totalBytes), file=sys.stderr)
 
-from .amlfs_hsm import AzureManagedLustreHSM
 
 def main():
     parser = argparse.ArgumentParser(prog='Azure Managed Lustre HSM tools', \
                                      description='This utility helps managing Lustre HSM with Azure Blob Lustre HSM backend.')
 
-    parser.add_argument('action', choices=['release', 'archive', 'remove', 'check'])
+    parser.add_argument('action', choices=['release', 'archive', 'remove', 'check', 'verify', 'restore', 'release-policy', 'reconcile', 'stage', 'report', 'serve', 'merge'])
     parser.add_argument('-f', '--force', default=False, required=False, action='store_true', help='This forces removal from Blob Storage independently from the HSM status. Use carefully.')     
-    parser.add_argument('filenames', nargs='+', type=str)
+    parser.add_argument('-b', '--bulk', default=False, required=False, action='store_true', help='Check files against a single listing of the HSM container instead of one request per file.')
+    parser.add_argument('--prefix', default='', required=False, type=str, help='Blob name prefix to be listed in bulk mode. Defaults to the whole container.')
+    parser.add_argument('--inventory', default=[], required=False, type=parse_inventory, action='append', help='check, verify, reconcile: Blob Inventory report (CSV or Parquet file, or directory with the report files and manifest) used instead of listing the container. Prefix it with ARCHIVE_ID= for the container of another archive ID, and repeat it for each backend.')
+    parser.add_argument('--inventory-time', default=None, required=False, type=str, help='Time the inventory report reflects (ISO 8601 or POSIX timestamp). Defaults to the manifest time, or the last blob modification in the report.')
+    parser.add_argument('-r', '--recursive', default=False, required=False, action='store_true', help='Process all the files below the directories provided.')
+    parser.add_argument('--walk-workers', default=DEFAULT_WALK_WORKERS, required=False, type=int, help='Number of parallel directory scanners in recursive mode.')
+    parser.add_argument('-j', '--jobs', default=DEFAULT_ACTION_WORKERS, required=False, type=int, help='Number of files processed in parallel.')
+    parser.add_argument('--batch-size', default=DEFAULT_HSM_BATCH_SIZE, required=False, type=int, help='Number of files per HSM request for archive, release and restore. 1 disables batching.')
+    parser.add_argument('--state-cache-ttl', default=DEFAULT_STATE_CACHE_TTL, required=False, type=float, help='Seconds an HSM state read is reused for the same FID within the run. 0 disables the cache.')
+    parser.add_argument('--async-blobs', default=False, required=False, action='store_true', help='Run blob existence checks concurrently with the asyncio Azure SDK (requires aiohttp).')
+    parser.add_argument('--async-concurrency', default=None, required=False, type=int, help='Maximum number of concurrent blob requests with --async-blobs.')
+    parser.add_argument('--journal', default=None, required=False, type=str, help='SQLite journal recording the state of every processed file.')
+    parser.add_argument('--resume', default=False, required=False, action='store_true', help='Skip files on which the action is already recorded in the journal.')
+    parser.add_argument('--incremental', default=False, required=False, action='store_true', help='Skip files whose size and mtime did not change since the action was recorded in the journal.')
+    parser.add_argument('--changelog', default=None, required=False, type=str, help='Process only the files changed in the changelog of this MDT (e.g. lustrefs-MDT0000) since the last run. The file name is the Lustre mount point.')
+    parser.add_argument('--changelog-user', default=None, required=False, type=str, help='Changelog user registered on the MDT, cleared at the end of the run.')
+    parser.add_argument('--changelog-state', default=None, required=False, type=str, help='File storing the last changelog record processed. Defaults to a file in /var/tmp.')
+    parser.add_argument('--target', default=None, required=False, type=str, help='release-policy (required): bytes to be freed, with optional K, M, G, T suffix.')
+    parser.add_argument('--min-size', default='0', required=False, type=str, help='release-policy: minimum allocated size of the released files.')
+    parser.add_argument('--min-atime-days', default=0, required=False, type=float, help='release-policy: minimum days since the last access of the released files.')
+    parser.add_argument('--min-age-days', default=0, required=False, type=float, help='release-policy: minimum days since the last modification of the released files.')
+    parser.add_argument('--max-candidates', default=DEFAULT_MAX_CANDIDATES, required=False, type=int, help='release-policy: maximum number of candidates ranked in memory.')
+    parser.add_argument('--dry-run', default=False, required=False, action='store_true', help='release-policy, reconcile: only report what would be done.')
+    parser.add_argument('--order', default=ORDER_SIZE, required=False, choices=STAGE_ORDERS, help='stage: restore the largest files first (size) or in the order of the input (manifest).')
+    parser.add_argument('--depth', default=1, required=False, type=int, help='report: levels of subdirectories reported below each directory provided.')
+    parser.add_argument('--format', default=None, required=False, choices=['json', 'csv'], help='report: output format. Defaults to csv if --report ends with .csv, json otherwise.')
+    parser.add_argument('--processes', default=1, required=False, type=int, help='report: number of processes querying the files, each with --jobs threads.')
+    parser.add_argument('--stat-workers', default=DEFAULT_STAT_WORKERS, required=False, type=int, help='reconcile: number of parallel file existence checks.')
+    parser.add_argument('--verify-sample', default=0.0, required=False, type=float, help='verify: fraction of the files whose MD5 is compared with the blob one, when the blob has it.')
+    parser.add_argument('-w', '--wait', default=False, required=False, action='store_true', help='Wait until archive, release or restore is completed on all the files.')
+    parser.add_argument('--wait-timeout', default=None, required=False, type=float, help='Maximum seconds to wait with --wait, or for stage.')
+    parser.add_argument('--from-file', default=None, required=False, type=str, help='Read the file names from a list file, one per line.')
+    parser.add_argument('--stdin', default=False, required=False, action='store_true', help='Read the file names from the standard input, one per line.')
+    parser.add_argument('-0', '--null', default=False, required=False, action='store_true', help='File names in --from-file and --stdin are NUL-delimited (e.g. find -print0).')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, required=False, type=str, help='Unix socket of the daemon started with serve. Runs are forwarded to it when it is running.')
+    parser.add_argument('--no-daemon', default=False, required=False, action='store_true', help='Run locally even if the daemon is running.')
+    parser.add_argument('--shard', default=None, required=False, type=str, help='Process only the shard i of N (e.g. 0/4) of the files, assigned by FID, or of the blobs for reconcile.')
+    parser.add_argument('--shard-by', default='fid', required=False, choices=['fid', 'path'], help='Assign the files to the shards by FID, or by path relative to the mount point without FID lookups.')
+    parser.add_argument('--report', default=None, required=False, type=str, help='Write a JSON report of the run, or of the shard. For merge and report, the output file, defaults to the standard output.')
+    parser.add_argument('--stats', default=False, required=False, action='store_true', help='Print a summary of the liblustreapi calls, blob requests and actions at the end of the run.')
+    parser.add_argument('--metrics-file', default=None, required=False, type=str, help='Export the metrics periodically to this file: a Prometheus textfile, or JSON lines if it ends with .jsonl.')
+    parser.add_argument('--metrics-interval', default=DEFAULT_EXPORT_INTERVAL, required=False, type=float, help='Seconds between two exports to --metrics-file.')
+    parser.add_argument('filenames', nargs='*', type=str)
     parser.add_argument('-v', '--verbose', action='count', default=0)
-    args, _ = parser.parse_known_args()
+    args, _ = parser.parse_known_intermixed_args()
+    if args.action != 'serve' and not (args.filenames or args.from_file or args.stdin):
+        parser.error('no file names provided: pass them as arguments, with --from-file or with --stdin')
+    if args.shard and args.action in ('release-policy', 'report', 'serve', 'merge'):
+        parser.error('--shard is not supported by {}'.format(args.action))
+    if args.action == 'release-policy':
+        try:
+            target = parse_size(args.target) if args.target is not None else 0
+        except ValueError:
+            parser.error('invalid --target size: {}'.format(args.target))
+        if target <= 0:
+            parser.error('release-policy requires --target, the bytes to be freed, greater than 0')
     
     
     logging.basicConfig(format='%(filename)s: '    
@@ -27,22 +224,142 @@ def main():
     elif args.verbose == 1:
         logger.setLevel(logging.WARN)
     elif args.verbose == 2:
-        logger.setLevel(logging.DEBUG)
-    elif args.verbose == 3:
         logger.setLevel(logging.INFO)
+    else:
+        logger.setLevel(logging.DEBUG)
 
-    file_names = args.filenames
-   
-    for file in file_names:
-        logger.info('Processing file {}'.format(file))
-        if os.path.isdir(file):
-            logger.warn('HSM operates on files, not on folders. The input path refers to a folder. {} will be skipped.'.format(file))
-        elif os.path.exists(file):
-            azureManagedLustreHSM = AzureManagedLustreHSM()
-            getattr(azureManagedLustreHSM, args.action)(file, args.force)
+    exporter = MetricsExporter(args.metrics_file, interval=args.metrics_interval).start() if args.metrics_file else None
+    try:
+        run(args)
+    finally:
+        if exporter is not None:
+            exporter.stop()
+        if args.stats:
+            print(metrics.summary(), file=sys.stderr)
+
+
+def run(args):
+    """Runs the action of the command line, forwarding it to the daemon if possible
+
+    Args:
+        args (Namespace): parsed command line arguments
+    """
+    if args.action == 'merge':
+        reports = []
+        for reportFile in args.filenames:
+            with open(reportFile, 'r') as fid:
+                reports.append(json.load(fid))
+        merged = json.dumps(merge_reports(reports), indent=2)
+        if args.report:
+            with open(args.report, 'w') as fid:
+                fid.write(merged)
+        else:
+            print(merged)
+        return
+
+    if args.action == 'report':
+        # The space report reads HSM states only and does not need the engine and its configuration
+        from .space_report import SpaceReport
+
+        report = SpaceReport(args.filenames, args.depth, args.jobs, args.processes, args.walk_workers).run()
+        outputFormat = args.format or ('csv' if args.report and args.report.endswith('.csv') else 'json')
+        if args.report:
+            with open(args.report, 'w', newline='') as fid:
+                report.write(fid, outputFormat)
+        else:
+            report.write(sys.stdout, outputFormat)
+        return
+
+    started = time.time()
+    if can_forward(args) and is_daemon_running(args.socket):
+        files = iterate_files(input_paths(args), args.recursive, ParallelWalker(args.walk_workers))
+        for file in forward(args.action, files, args.force, args.socket):
+            logging.error('Failed in processing {} through the daemon.'.format(file))
+        return
+
+    # The engine loads liblustreapi and is not needed by runs forwarded to the daemon
+    from .amlfs_hsm import AzureManagedLustreHSM
+
+    azureManagedLustreHSM = AzureManagedLustreHSM(stateCacheTTL=args.state_cache_ttl)
+    if args.action == 'verify':
+        azureManagedLustreHSM.verifySample = args.verify_sample
+    if args.inventory and args.action in ('check', 'verify'):
+        for archiveId, inventory in args.inventory:
+            azureManagedLustreHSM.loadBlobInventory(inventory, args.prefix, args.action == 'verify', args.inventory_time, archiveId)
+    elif args.action == 'verify':
+        azureManagedLustreHSM.loadBlobIndex(args.prefix, records=True)
+    elif args.bulk:
+        azureManagedLustreHSM.loadBlobIndex(args.prefix)
+    if args.async_blobs:
+        azureManagedLustreHSM.enableAsyncBlobs(args.async_concurrency)
+    if args.journal:
+        azureManagedLustreHSM.journal = ScanJournal(args.journal)
+
+    shard = Shard.parse(args.shard, byPath=args.shard_by == 'path') if args.shard else None
+    if args.action == 'serve':
+        daemon = HSMDaemon(azureManagedLustreHSM, args.socket, args.batch_size)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            daemon.server_close()
+    elif args.action == 'release-policy':
+        releasePolicy = ReleasePolicy(azureManagedLustreHSM, parse_size(args.min_size), args.min_atime_days, args.min_age_days, args.max_candidates)
+        files = iterate_files(input_paths(args), True, ParallelWalker(args.walk_workers))
+        releasedFiles, releasedBytes = releasePolicy.run(files, target, args.dry_run, args.batch_size)
+        print('{} {} files, {} bytes.'.format('Would release' if args.dry_run else 'Released', releasedFiles, releasedBytes))
+    elif args.action == 'reconcile':
+        inventories = {}
+        if args.inventory:
+            from .inventory import BlobInventory
+
+            for archiveId, inventory in args.inventory:
+                backend = azureManagedLustreHSM.backends.default if archiveId is None else azureManagedLustreHSM.backends.get(archiveId)
+                inventories[backend.archiveId] = BlobInventory(inventory, backend.client.containerName, args.inventory_time)
+        # The containers of all the backends are reconciled in parallel
+        reconcilers = [OrphanReconciler(azureManagedLustreHSM, args.filenames[0], args.stat_workers, shard, inventories.get(backend.archiveId), backend)
+                       for backend in azureManagedLustreHSM.backends]
+        report = (lambda blob: print(blob.name)) if args.dry_run else None
+        results = [result for _, result in ordered_map(lambda reconciler: reconciler.run(args.prefix, args.dry_run, report), reconcilers, len(reconcilers))]
+        orphans, orphanBytes, deleted = (sum(counts) for counts in zip(*results))
+        print('{} orphan blobs, {} bytes, {} deleted.'.format(orphans, orphanBytes, deleted))
+        if args.report:
+            write_report(args.report, args.action, shard, {'orphans': orphans, 'orphan_bytes': orphanBytes, 'deleted': deleted}, started=started)
+    elif args.action == 'stage':
+        from .stage import Stager
+
+        stager = Stager(azureManagedLustreHSM, args.order, args.jobs)
+        files = iterate_files(input_paths(args), args.recursive, ParallelWalker(args.walk_workers))
+        if shard is not None:
+            files = shard.files(files, args.walk_workers)
+        stagedFiles, stagedBytes, failed = stager.run(files, args.batch_size, args.wait_timeout, print_stage_progress)
+        print('Staged {} files, {} bytes, {} failed.'.format(stagedFiles, stagedBytes, len(failed)))
+        if args.report:
+            write_report(args.report, args.action, shard, {'files': stagedFiles, 'bytes': stagedBytes, 'errors': len(failed)}, failed, started)
+    else:
+        if args.changelog:
+            from .lustreapi_changelog import ChangelogTracker, DEFAULT_CHANGELOG_STATE_FILE
+
+            tracker = ChangelogTracker(args.changelog, args.changelog_user, args.changelog_state or DEFAULT_CHANGELOG_STATE_FILE)
+            changes = tracker.collect()
+            files = iterate_files(changes.paths(args.filenames[0]))
         else:
-            logger.warn('The file provided does not exist on the system. {} will be skipped.'.format(file))
+            files = iterate_files(input_paths(args), args.recursive, ParallelWalker(args.walk_workers))
+        if shard is not None:
+            files = shard.files(files, args.walk_workers, azureManagedLustreHSM.fidCache if args.action in FID_ACTIONS else None)
+        failed = []
+        counter = run_action(azureManagedLustreHSM, args, files, failed.extend if args.report or args.changelog else None)
+        if args.changelog:
+            # Failed files are kept for the next run, failures not attributed to a file keep the whole range
+            if counter.errors > len(failed):
+                logging.error('Changelog {} not cleared: {} failures could not be attributed to files.'.format(args.changelog, counter.errors - len(failed)))
+            else:
+                tracker.commit(changes, clear=args.changelog_user is not None, failed=failed)
+        if args.report:
+            write_report(args.report, args.action, shard, {'files': counter.count, 'errors': counter.errors}, failed, started)
+    azureManagedLustreHSM.close()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
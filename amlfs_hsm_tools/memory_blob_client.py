@@ -0,0 +1,217 @@
+import collections
+import datetime
+import itertools
+import threading
+import time
+
+from .metrics import metrics
+from .throttle import ServerBusyError
+
+
+LIST_PAGE_SIZE = 5000
+
+MemoryBlobResponse = collections.namedtuple('MemoryBlobResponse', ['status_code'])
+MemoryContentSettings = collections.namedtuple('MemoryContentSettings', ['content_md5'])
+
+
+class MemoryBlobProperties:
+    """Properties of an in-memory blob, with the attributes of BlobProperties used by the tools
+    """
+    def __init__(self, name, size, etag, metadata=None, contentMD5=None) -> None:
+        self.name = name
+        self.size = size
+        self.etag = etag
+        self.metadata = metadata or {}
+        self.content_settings = MemoryContentSettings(contentMD5)
+        self.last_modified = datetime.datetime.now(datetime.timezone.utc)
+
+
+class MemoryPageIterator:
+    """Pages of a listing, one request per page, as the page iterator of the SDK: a failed page request
+    can be made again
+    """
+    def __init__(self, service, items) -> None:
+        self.service = service
+        self.items = items
+        self.start = 0
+        self._requested = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._requested and self.start >= len(self.items):
+            raise StopIteration
+        self.service._request('list_blobs_page')
+        self._requested = True
+        page = self.items[self.start:self.start + LIST_PAGE_SIZE]
+        self.start += LIST_PAGE_SIZE
+        return iter(page)
+
+
+class MemoryItemPaged:
+    """Result of list_blobs, iterated by item or by page as ItemPaged
+    """
+    def __init__(self, service, items) -> None:
+        self.service = service
+        self.items = items
+
+    def by_page(self):
+        return MemoryPageIterator(self.service, self.items)
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+
+class MemoryBlobServiceClient:
+    """In-memory stand-in of LFSBlobClient, implementing the subset of the BlobServiceClient, ContainerClient
+    and BlobClient API used by the tools. It allows running and benchmarking the actions without a storage
+    account: every request is counted and can be given a latency.
+
+    Args:
+        containerName (str, optional): name of the HSM container. Defaults to hsm.
+        latency (float, optional): seconds spent in every request. Defaults to 0.
+        maxInFlight (int, optional): requests in flight beyond which the account answers ServerBusy. Defaults to no limit.
+
+    Attributes:
+        throttled (Counter): number of the next requests of each operation answered with ServerBusy
+    """
+    def __init__(self, containerName='hsm', latency=0.0, maxInFlight=None) -> None:
+        self.accountURL = 'memory://'
+        self.containerName = containerName
+        self.latency = latency
+        self.maxInFlight = maxInFlight
+        self.inFlight = 0
+        self.calls = collections.Counter()
+        self.throttled = collections.Counter()
+        self.containers = collections.defaultdict(dict)
+        self._etags = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _request(self, operation):
+        # Operations are named as the HTTP requests they stand in for
+        start = time.perf_counter()
+        with self._lock:
+            self.calls[operation] += 1
+            busy = self.throttled[operation] > 0 or (self.maxInFlight is not None and self.inFlight >= self.maxInFlight)
+            if self.throttled[operation] > 0:
+                self.throttled[operation] -= 1
+            if not busy:
+                self.inFlight += 1
+        if busy:
+            metrics.observe('blob', operation, time.perf_counter() - start, True)
+            raise ServerBusyError('The server is busy.')
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.inFlight -= 1
+        metrics.observe('blob', operation, time.perf_counter() - start)
+
+    def rpcs(self):
+        """Returns the total number of requests made to the backend
+
+        Returns:
+            int: number of requests
+        """
+        with self._lock:
+            return sum(self.calls.values())
+
+    def get_container_client(self, container):
+        return MemoryContainerClient(self, container)
+
+    def get_blob_client(self, container, blob):
+        return MemoryBlobClient(self, container, blob)
+
+    def close(self):
+        pass
+
+
+class MemoryContainerClient:
+    def __init__(self, service, container) -> None:
+        self.service = service
+        self.container = container
+
+    def get_blob_client(self, blob):
+        return MemoryBlobClient(self.service, self.container, blob)
+
+    def list_blobs(self, name_starts_with=None, include=None):
+        with self.service._lock:
+            blobs = sorted(self.service.containers[self.container].items())
+        # One request per page of results, as the service does
+        return MemoryItemPaged(self.service, [properties for name, properties in blobs if name.startswith(name_starts_with or '')])
+
+    def upload_blob(self, name, data, length=None, overwrite=False, metadata=None):
+        return self.get_blob_client(name).upload_blob(data, length, overwrite, metadata)
+
+    def delete_blob(self, blob):
+        self.get_blob_client(blob).delete_blob()
+
+    def delete_blobs(self, *blobs, raise_on_any_failure=True):
+        """Deletes many blobs with a single request, honouring the etag of the ones given as dictionaries
+
+        Returns:
+            list[MemoryBlobResponse]: the status of each deletion
+        """
+        self.service._request('delete_blobs_batch')
+        responses = []
+        with self.service._lock:
+            container = self.service.containers[self.container]
+            for blob in blobs:
+                name, etag = (blob['name'], blob.get('etag')) if isinstance(blob, dict) else (blob, None)
+                if name not in container:
+                    responses.append(MemoryBlobResponse(404))
+                elif etag is not None and container[name].etag != etag:
+                    responses.append(MemoryBlobResponse(412))
+                else:
+                    del container[name]
+                    responses.append(MemoryBlobResponse(202))
+        if raise_on_any_failure and any(response.status_code != 202 for response in responses):
+            raise RuntimeError('Failed in deleting some of the blobs.')
+        return responses
+
+
+class MemoryBlobClient:
+    def __init__(self, service, container, blob) -> None:
+        self.service = service
+        self.container = container
+        self.blob_name = blob
+
+    def _properties(self):
+        with self.service._lock:
+            return self.service.containers[self.container].get(self.blob_name)
+
+    def _notFound(self):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        return ResourceNotFoundError('The specified blob {} does not exist.'.format(self.blob_name))
+
+    def exists(self):
+        self.service._request('get_blob_properties')
+        return self._properties() is not None
+
+    def get_blob_properties(self):
+        self.service._request('get_blob_properties')
+        properties = self._properties()
+        if properties is None:
+            raise self._notFound()
+        return properties
+
+    def upload_blob(self, data, length=None, overwrite=False, metadata=None):
+        self.service._request('upload_blob')
+        with self.service._lock:
+            container = self.service.containers[self.container]
+            if self.blob_name in container and not overwrite:
+                from azure.core.exceptions import ResourceExistsError
+
+                raise ResourceExistsError('The specified blob {} already exists.'.format(self.blob_name))
+            etag = '"0x{:x}"'.format(next(self.service._etags))
+            size = len(data) if length is None else length
+            container[self.blob_name] = MemoryBlobProperties(self.blob_name, size, etag, metadata)
+        return {'etag': etag}
+
+    def delete_blob(self):
+        self.service._request('delete_blob')
+        with self.service._lock:
+            if self.service.containers[self.container].pop(self.blob_name, None) is None:
+                raise self._notFound()
@@ -0,0 +1,265 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+from urllib.parse import urlparse, parse_qs
+
+
+# Log-scale latency buckets from 10 us to about 84 s
+LATENCY_BUCKETS = tuple(1e-5 * 2 ** exponent for exponent in range(24))
+DEFAULT_EXPORT_INTERVAL = 30
+METRICS_PREFIX = 'amlfs_hsm'
+
+
+class Histogram:
+    """Latency histogram of an operation, with call, error and item counters
+    """
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.items = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds, error=False, items=1):
+        self.calls += 1
+        self.items += items
+        self.seconds += seconds
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if error:
+            self.errors += 1
+
+    def quantile(self, q):
+        """Returns an upper bound of the quantile q of the latency, from the buckets
+
+        Args:
+            q (float): quantile between 0 and 1
+
+        Returns:
+            float: latency in seconds, inf if it falls beyond the last bucket
+        """
+        rank, cumulative = q * self.calls, 0
+        for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), self.buckets):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+
+def _finite(value):
+    return value if value != float('inf') else None
+
+
+class MetricsRegistry:
+    """Collects the latency histograms of the liblustreapi calls, the blob requests and the actions of a run,
+    grouped in families (llapi, blob, action) and keyed by operation name. Recording costs two clock reads
+    and a lock, so the registry is always enabled.
+    """
+    def __init__(self) -> None:
+        self.start = time.time()
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, family, operation, seconds, error=False, items=1):
+        """Records an operation
+
+        Args:
+            family (str): operation family, e.g. llapi, blob or action
+            operation (str): operation name
+            seconds (float): duration of the operation
+            error (bool, optional): if the operation failed. Defaults to False.
+            items (int, optional): number of files handled by the operation. Defaults to 1.
+        """
+        with self._lock:
+            histogram = self._histograms.get((family, operation))
+            if histogram is None:
+                histogram = self._histograms[(family, operation)] = Histogram()
+            histogram.observe(seconds, error, items)
+
+    def timed(self, family, operation, function, isError=None):
+        """Wraps a function so that every call is recorded
+
+        Args:
+            family (str): operation family
+            operation (str): operation name
+            function (callable): function to be wrapped
+            isError (callable, optional): tells from the result if the call failed. Exceptions are always errors.
+
+        Returns:
+            callable: the wrapped function
+        """
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                self.observe(family, operation, time.perf_counter() - start, True)
+                raise
+            self.observe(family, operation, time.perf_counter() - start, isError is not None and isError(result))
+            return result
+        return wrapper
+
+    def snapshot(self):
+        """Returns a consistent copy of the histograms
+
+        Returns:
+            dict[tuple[str, str], Histogram]: histograms by family and operation
+        """
+        with self._lock:
+            snapshot = {}
+            for key, histogram in sorted(self._histograms.items()):
+                copy = snapshot[key] = Histogram()
+                copy.calls, copy.errors, copy.items, copy.seconds = histogram.calls, histogram.errors, histogram.items, histogram.seconds
+                copy.buckets = list(histogram.buckets)
+            return snapshot
+
+    def summary(self):
+        """Formats an end of run summary of the operations
+
+        Returns:
+            str: one line per operation with calls, errors, files, mean, p50 and p99 latency and total time
+        """
+        lines = ['{:<8} {:<28} {:>10} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+            'family', 'operation', 'calls', 'errors', 'files', 'mean ms', 'p50 ms', 'p99 ms', 'total s')]
+        for (family, operation), histogram in self.snapshot().items():
+            lines.append('{:<8} {:<28} {:>10} {:>8} {:>10} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.2f}'.format(
+                family, operation, histogram.calls, histogram.errors, histogram.items,
+                1000 * histogram.seconds / histogram.calls, 1000 * histogram.quantile(0.5),
+                1000 * histogram.quantile(0.99), histogram.seconds))
+        return '\n'.join(lines)
+
+    def to_prometheus(self):
+        """Formats the histograms in the Prometheus text exposition format
+
+        Returns:
+            str: metrics text, e.g. for the node_exporter textfile collector
+        """
+        families = {}
+        for (family, operation), histogram in self.snapshot().items():
+            families.setdefault(family, []).append((operation, histogram))
+
+        lines = []
+        for family, histograms in families.items():
+            name = '{}_{}'.format(METRICS_PREFIX, family)
+            lines.append('# TYPE {}_seconds histogram'.format(name))
+            for operation, histogram in histograms:
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), histogram.buckets):
+                    cumulative += count
+                    lines.append('{}_seconds_bucket{{operation="{}",le="{}"}} {}'.format(
+                        name, operation, '+Inf' if bound == float('inf') else repr(bound), cumulative))
+                lines.append('{}_seconds_sum{{operation="{}"}} {!r}'.format(name, operation, histogram.seconds))
+                lines.append('{}_seconds_count{{operation="{}"}} {}'.format(name, operation, histogram.calls))
+            for counter, attribute in (('errors', 'errors'), ('files', 'items')):
+                lines.append('# TYPE {}_{}_total counter'.format(name, counter))
+                for operation, histogram in histograms:
+                    lines.append('{}_{}_total{{operation="{}"}} {}'.format(name, counter, operation, getattr(histogram, attribute)))
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        """Formats the counters as a single JSON line
+
+        Returns:
+            str: JSON object with the timestamp and the counters of each operation
+        """
+        return json.dumps({
+            'time': time.time(),
+            'start': self.start,
+            'operations': [{
+                'family': family, 'operation': operation, 'calls': histogram.calls, 'errors': histogram.errors,
+                'files': histogram.items, 'seconds': histogram.seconds,
+                'p50': _finite(histogram.quantile(0.5)), 'p99': _finite(histogram.quantile(0.99)),
+            } for (family, operation), histogram in self.snapshot().items()],
+        })
+
+
+metrics = MetricsRegistry()
+
+
+def blob_operation(request):
+    """Names the blob operation of an HTTP request to the storage account
+
+    Args:
+        request (HttpRequest): request sent by the Azure SDK
+
+    Returns:
+        str: operation name
+    """
+    comp = parse_qs(urlparse(request.url).query).get('comp', [''])[0]
+    if comp == 'list':
+        return 'list_blobs_page'
+    if comp == 'batch':
+        return 'delete_blobs_batch'
+    return {'HEAD': 'get_blob_properties', 'DELETE': 'delete_blob', 'PUT': 'upload_blob', 'GET': 'download_blob'}.get(
+        request.method, request.method.lower())
+
+
+def _blob_request_hook(request):
+    request.context['metrics_start'] = time.perf_counter()
+
+
+def _blob_response_hook(response):
+    start = response.context.get('metrics_start')
+    if start is None:
+        return
+    status = response.http_response.status_code
+    metrics.observe('blob', blob_operation(response.http_request), time.perf_counter() - start, status >= 400 and status != 404)
+
+
+def blob_metrics_hooks():
+    """Returns the keyword arguments adding the blob request metrics to an Azure SDK client, sync or asyncio.
+    Every attempt of a request is recorded, retries included.
+
+    Returns:
+        dict: raw_request_hook and raw_response_hook arguments
+    """
+    return {'raw_request_hook': _blob_request_hook, 'raw_response_hook': _blob_response_hook}
+
+
+class MetricsExporter:
+    """Writes the metrics of a long running job to a file every interval seconds and at stop: either a
+    Prometheus textfile, replaced atomically, or a JSON lines file with one snapshot appended per interval.
+
+    Args:
+        path (str): output file, a .prom file for the textfile collector or a .jsonl file
+        format (str, optional): prometheus or jsonl. Defaults to the file extension.
+        interval (float, optional): seconds between two exports. Defaults to 30.
+        registry (MetricsRegistry, optional): metrics to be exported. Defaults to the process ones.
+    """
+    def __init__(self, path, format=None, interval=DEFAULT_EXPORT_INTERVAL, registry=metrics) -> None:
+        self.path = path
+        self.format = format or ('jsonl' if path.endswith('.jsonl') or path.endswith('.json') else 'prometheus')
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def export(self):
+        if self.format == 'jsonl':
+            with open(self.path, 'a') as fid:
+                fid.write(self.registry.to_json() + '\n')
+        else:
+            temporaryPath = '{}.{}.tmp'.format(self.path, os.getpid())
+            with open(temporaryPath, 'w') as fid:
+                fid.write(self.registry.to_prometheus())
+            os.replace(temporaryPath, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.export()
+            except OSError as error:
+                logging.error('Failed in exporting metrics to {}: {}'.format(self.path, str(error)))
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.export()
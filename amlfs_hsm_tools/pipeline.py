@@ -0,0 +1,279 @@
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_WALK_WORKERS = 8
+DEFAULT_ACTION_WORKERS = 1
+DEFAULT_QUEUE_SIZE = 10000
+
+_END_OF_WALK = object()
+
+
+class StageCounter:
+    """Thread safe throughput counter for a pipeline stage
+    """
+    def __init__(self, name) -> None:
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def increment(self, error=False):
+        with self._lock:
+            self.count += 1
+            if error:
+                self.errors += 1
+
+    def failed(self, count=1):
+        with self._lock:
+            self.errors += count
+
+    def add(self, count, errors=0):
+        with self._lock:
+            self.count += count
+            self.errors += errors
+
+    def rate(self):
+        """Returns the stage throughput
+
+        Returns:
+            float: processed items per second since the stage started
+        """
+        elapsed = time.monotonic() - self.start
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return '{}: {} files, {} errors, {:.1f} files/s'.format(self.name, self.count, self.errors, self.rate())
+
+
+class ParallelWalker:
+    """Walks directory trees with a pool of os.scandir workers. Files are handed over through a
+    bounded queue, so memory stays flat whatever the size of the directories.
+    """
+    def __init__(self, workers=DEFAULT_WALK_WORKERS, queueSize=DEFAULT_QUEUE_SIZE) -> None:
+        self.workers = workers
+        self.queueSize = queueSize
+        self.counter = StageCounter('walk')
+
+    def _scan(self, directories, files, stop):
+        while not stop.is_set():
+            try:
+                directory = directories.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.put(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            self._put(files, entry.path, stop)
+                            self.counter.increment()
+            except OSError as error:
+                logging.error('Failed in scanning directory {}: {}'.format(directory, str(error)))
+                self.counter.failed()
+            finally:
+                directories.task_done()
+
+    @staticmethod
+    def _put(files, item, stop):
+        while not stop.is_set():
+            try:
+                files.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def walk(self, roots):
+        """Yields all the regular files below the root directories
+
+        Args:
+            roots (list[str]): directories to be walked
+
+        Yields:
+            str: file path
+        """
+        # Directories are kept in a LIFO to walk depth first, bounding the number of pending directories
+        directories = queue.LifoQueue()
+        files = queue.Queue(maxsize=self.queueSize)
+        stop = threading.Event()
+        self.counter = StageCounter('walk')
+
+        for root in roots:
+            directories.put(root)
+
+        threads = [threading.Thread(target=self._scan, args=(directories, files, stop), daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        def _wait_end():
+            directories.join()
+            self._put(files, _END_OF_WALK, stop)
+        threading.Thread(target=_wait_end, daemon=True).start()
+
+        try:
+            while True:
+                item = files.get()
+                if item is _END_OF_WALK:
+                    break
+                yield item
+        finally:
+            stop.set()
+            logging.info(str(self.counter))
+
+
+def process_stream(paths, function, workers=DEFAULT_ACTION_WORKERS, name='action', maxPending=DEFAULT_QUEUE_SIZE, onFailure=None):
+    """Runs a function on a stream of paths with a bounded pool of workers and a bounded number of pending items
+
+    Args:
+        paths (iterable[str]): stream of file paths
+        function (callable): function to be called on each path
+        workers (int, optional): number of concurrent workers. Defaults to 1.
+        name (str, optional): stage name for the throughput counter. Defaults to 'action'.
+        maxPending (int, optional): maximum number of submitted but not completed items.
+        onFailure (callable, optional): called with the list of the paths which failed
+
+    Returns:
+        (StageCounter): the stage throughput counter
+    """
+    counter = StageCounter(name)
+    pending = threading.BoundedSemaphore(maxPending)
+
+    def _run(path):
+        try:
+            function(path)
+            counter.increment()
+        except Exception as error:
+            logging.error('Failed in processing {}: {}'.format(path, str(error)))
+            counter.increment(error=True)
+            if onFailure is not None:
+                onFailure([path])
+        finally:
+            pending.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path in paths:
+            pending.acquire()
+            executor.submit(_run, path)
+
+    logging.info(str(counter))
+    return counter
+
+
+def chunked(items, size):
+    """Groups a stream of items in lists of at most size items
+
+    Args:
+        items (iterable): stream of items
+        size (int): maximum size of each chunk
+
+    Yields:
+        list: chunk of items
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def process_batches(paths, function, batchSize, workers=DEFAULT_ACTION_WORKERS, name='action', maxPending=DEFAULT_QUEUE_SIZE, onFailure=None):
+    """Runs a batch function on a stream of paths grouped in chunks of batchSize, with a bounded pool of workers.
+    The function returns the paths of the chunk that failed.
+
+    Args:
+        paths (iterable[str]): stream of file paths
+        function (callable): function to be called on each chunk of paths, returning the failed ones
+        batchSize (int): number of paths per chunk
+        workers (int, optional): number of concurrent workers. Defaults to 1.
+        name (str, optional): stage name for the throughput counter. Defaults to 'action'.
+        maxPending (int, optional): maximum number of submitted but not completed paths.
+        onFailure (callable, optional): called with the list of the paths which failed
+
+    Returns:
+        (StageCounter): the stage throughput counter
+    """
+    counter = StageCounter(name)
+    pending = threading.BoundedSemaphore(max(1, maxPending // batchSize))
+
+    def _run(chunk):
+        try:
+            try:
+                failed = function(chunk)
+            except Exception as error:
+                logging.error('Failed in processing a batch of {} files: {}'.format(len(chunk), str(error)))
+                failed = chunk
+            counter.add(len(chunk), len(failed))
+            if failed and onFailure is not None:
+                onFailure(failed)
+        finally:
+            pending.release()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunked(paths, batchSize):
+            pending.acquire()
+            executor.submit(_run, chunk)
+
+    logging.info(str(counter))
+    return counter
+
+
+def ordered_map(function, items, workers, maxPending=DEFAULT_QUEUE_SIZE):
+    """Lazily maps a function on a stream of items with a pool of workers, yielding the results
+    in the input order and keeping at most maxPending items in flight
+
+    Args:
+        function (callable): function to be called on each item
+        items (iterable): stream of items
+        workers (int): number of concurrent workers
+        maxPending (int, optional): maximum number of submitted items not yet yielded
+
+    Yields:
+        tuple: the item and the function result
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append((item, executor.submit(function, item)))
+            if len(pending) >= maxPending:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def read_paths(stream, nul=False, chunkSize=1 << 16):
+    """Lazily reads file paths from a binary stream, one per line or NUL-delimited, keeping only a
+    chunk of the input in memory
+
+    Args:
+        stream (io.BufferedIOBase): binary input stream
+        nul (bool, optional): paths are NUL-delimited instead of newline-delimited. Defaults to False.
+        chunkSize (int, optional): bytes read at a time. Defaults to 64 KiB.
+
+    Yields:
+        str: file path
+    """
+    separator = b'\0' if nul else b'\n'
+    remainder = b''
+    while True:
+        chunk = stream.read(chunkSize)
+        if not chunk:
+            break
+        *paths, remainder = (remainder + chunk).split(separator)
+        for path in paths:
+            if path:
+                yield os.fsdecode(path)
+    if remainder:
+        yield os.fsdecode(remainder)
@@ -0,0 +1,159 @@
+import logging
+import os
+
+from .pipeline import chunked, ordered_map
+from .throttle import BLOB_CONGESTION_STATUS_CODES, ServerBusyError, throttled_items
+from .utilities import get_absolute_path, get_mount_table
+
+
+DEFAULT_STAT_WORKERS = 16
+BLOB_BATCH_SIZE = 256
+
+
+class OrphanReconciler:
+    """Finds the blobs of an HSM container whose file does not exist anymore on Lustre and
+    deletes them with the Blob Batch API. Blobs are streamed from the container listing, or from an
+    inventory report, and the related paths are checked in parallel. Only the blobs whose file is reported
+    missing by the file system are orphans, paths which cannot be checked are skipped. Orphans found in the
+    report are confirmed against the container before being deleted.
+
+    Args:
+        azureManagedLustreHSM (AzureManagedLustreHSM): the engine providing the blob client
+        mountPoint (str): Lustre mount point the container is the HSM backend of
+        workers (int, optional): number of parallel path checks. Defaults to 16.
+        shard (Shard, optional): only the blobs of this shard are reconciled. Defaults to all the blobs.
+        inventory (BlobInventory, optional): inventory report read instead of listing the container
+        backend (HSMBackend, optional): backend whose container is reconciled. Defaults to the default backend.
+    """
+    def __init__(self, azureManagedLustreHSM, mountPoint, workers=DEFAULT_STAT_WORKERS, shard=None, inventory=None, backend=None) -> None:
+        self.azureManagedLustreHSM = azureManagedLustreHSM
+        self.mountPoint = mountPoint
+        self.workers = workers
+        self.shard = shard
+        self.inventory = inventory
+        self.backend = backend or azureManagedLustreHSM.backends.default
+        self.containerClient = self.backend.getContainerClient()
+
+    def isOrphan(self, blob):
+        try:
+            os.lstat(get_absolute_path(blob.name, self.mountPoint))
+        except FileNotFoundError:
+            return True
+        except OSError as error:
+            logging.error('Failed in checking the file of blob {}, skipping it: {}'.format(blob.name, str(error)))
+        return False
+
+    def checkMountPoint(self):
+        """Checks that the mount point is a mounted Lustre file system, as the blobs of all the files
+        would be orphans of a directory missing or standing in for an unmounted file system
+
+        Raises:
+            ValueError: the mount point is not a Lustre mount point
+        """
+        mountPoint = os.path.abspath(self.mountPoint)
+        if get_mount_table().find(mountPoint) != mountPoint or not os.path.isdir(mountPoint):
+            raise ValueError('{} is not a Lustre mount point.'.format(self.mountPoint))
+
+    def liveOrphan(self, blob):
+        """Checks an orphan candidate of the inventory report against the container, as it may have been
+        deleted or rewritten after the report
+
+        Args:
+            blob (InventoryBlob): blob of the inventory report
+
+        Returns:
+            (BlobProperties): the current properties of the blob if it is an orphan, None otherwise
+        """
+        if not self.isOrphan(blob):
+            return None
+        try:
+            return self.azureManagedLustreHSM.getBlobProperties(blob.name, self.backend)
+        except Exception as error:
+            logging.error('Failed in confirming orphan blob {}: {}'.format(blob.name, str(error)))
+            return None
+
+    def orphans(self, prefix=''):
+        """Streams the orphan blobs of the container
+
+        Args:
+            prefix (str, optional): blob name prefix to be listed. Defaults to the whole container.
+
+        Yields:
+            (BlobProperties): orphan blob
+        """
+        if self.inventory is not None:
+            blobs = self.inventory.blobs(prefix)
+        else:
+            blobs = throttled_items(self.containerClient.list_blobs(name_starts_with=prefix or None), self.backend.controller)
+        if self.shard is not None:
+            blobs = (blob for blob in blobs if self.shard.ownsBlob(blob.name))
+        if self.inventory is not None:
+            for _, properties in ordered_map(self.liveOrphan, blobs, self.workers):
+                if properties is not None:
+                    yield properties
+            return
+        for blob, isOrphan in ordered_map(self.isOrphan, blobs, self.workers):
+            if isOrphan:
+                yield blob
+
+    def deleteBlobs(self, blobs):
+        """Deletes up to 256 blobs with a single batch request. Blobs modified since they were listed are kept.
+
+        Args:
+            blobs (list[BlobProperties]): blobs to be deleted
+
+        Returns:
+            int: number of deleted blobs
+        """
+        from azure.core import MatchConditions
+
+        pending = [{'name': blob.name, 'etag': blob.etag, 'match_condition': MatchConditions.IfNotModified} for blob in blobs]
+        deleted = 0
+
+        # Throttled sub-requests are sent again in a smaller batch by the backend rate controller
+        def deleteBatch():
+            nonlocal pending, deleted
+            throttled = []
+            for request, response in zip(pending, self.containerClient.delete_blobs(*pending, raise_on_any_failure=False)):
+                if response.status_code in (200, 202):
+                    deleted += 1
+                elif response.status_code in BLOB_CONGESTION_STATUS_CODES:
+                    throttled.append(request)
+                elif response.status_code != 404:
+                    logging.error('Failed in deleting orphan blob {}: HTTP {}'.format(request['name'], response.status_code))
+            pending = throttled
+            if throttled:
+                raise ServerBusyError('{} blob deletions throttled.'.format(len(throttled)))
+
+        try:
+            self.backend.controller.call(deleteBatch)
+        except Exception as error:
+            logging.error('Failed in deleting {} orphan blobs: {}'.format(len(pending), str(error)))
+        return deleted
+
+    def run(self, prefix='', dryRun=False, report=None):
+        """Finds and deletes the orphan blobs
+
+        Args:
+            prefix (str, optional): blob name prefix to be listed. Defaults to the whole container.
+            dryRun (bool, optional): only report the orphan blobs. Defaults to False.
+            report (callable, optional): called with each orphan blob found
+
+        Returns:
+            tuple[int, int, int]: number of orphans, their total bytes and number of deleted blobs
+
+        Raises:
+            ValueError: the mount point is not a Lustre mount point
+        """
+        self.checkMountPoint()
+        orphans, orphanBytes, deleted = 0, 0, 0
+        for batch in chunked(self.orphans(prefix), BLOB_BATCH_SIZE):
+            for blob in batch:
+                orphans += 1
+                orphanBytes += blob.size
+                if report is not None:
+                    report(blob)
+            if not dryRun:
+                deleted += self.deleteBlobs(batch)
+        logging.info('Found {} orphan blobs ({} bytes), deleted {}.'.format(orphans, orphanBytes, deleted))
+        return orphans, orphanBytes, deleted
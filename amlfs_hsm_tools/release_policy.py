@@ -0,0 +1,121 @@
+import heapq
+import logging
+import os
+import time
+
+from .lustre_hsm_constants import HUA_RELEASE, DEFAULT_HSM_BATCH_SIZE
+from .pipeline import chunked
+
+
+DEFAULT_MAX_CANDIDATES = 100000
+SECONDS_PER_DAY = 86400
+
+
+class ReleasePolicy:
+    """Selects and releases files to free OST space. Files are filtered on size, access time and
+    modification age, then on HSM state (archived, not dirty and not released) with a single state read.
+    Candidates are ranked largest-and-coldest first in a heap bounded to maxCandidates entries.
+
+    Args:
+        azureManagedLustreHSM (AzureManagedLustreHSM): the engine used for state reads and releases
+        minSize (int, optional): minimum allocated bytes of a candidate. Defaults to 0.
+        minAtimeDays (float, optional): minimum days since the last access. Defaults to 0.
+        minAgeDays (float, optional): minimum days since the last modification. Defaults to 0.
+        maxCandidates (int, optional): maximum number of candidates kept in memory. Defaults to 100000.
+    """
+    def __init__(self, azureManagedLustreHSM, minSize=0, minAtimeDays=0, minAgeDays=0, maxCandidates=DEFAULT_MAX_CANDIDATES) -> None:
+        self.azureManagedLustreHSM = azureManagedLustreHSM
+        self.minSize = minSize
+        self.minAtimeDays = minAtimeDays
+        self.minAgeDays = minAgeDays
+        self.maxCandidates = maxCandidates
+
+    def isCandidate(self, filePath, stat, now):
+        """Checks if a file matches the policy thresholds and is in a releasable HSM state
+
+        Args:
+            filePath (str): absolute file path on the file system
+            stat (os.stat_result): stat of the file
+            now (float): reference time for the age thresholds
+
+        Returns:
+            bool: True if the file can be released by the policy
+        """
+        if stat.st_blocks * 512 < self.minSize \
+           or now - stat.st_atime < self.minAtimeDays * SECONDS_PER_DAY \
+           or now - stat.st_mtime < self.minAgeDays * SECONDS_PER_DAY:
+            return False
+        flags = self.azureManagedLustreHSM.getHSMFlags(filePath)
+        return not self.azureManagedLustreHSM.fileNeedsArchive(filePath, flags) \
+               and not self.azureManagedLustreHSM.isFileDirty(filePath, flags) \
+               and not self.azureManagedLustreHSM.isFileReleased(filePath, flags)
+
+    def select(self, filePaths):
+        """Scans the files and returns the best candidates, largest-and-coldest first
+
+        Args:
+            filePaths (iterable[str]): stream of file paths
+
+        Returns:
+            list[tuple[int, str]]: allocated bytes and absolute path of the candidates
+        """
+        now = time.time()
+        heap = []
+        for filePath in filePaths:
+            absolutePath = os.path.abspath(filePath)
+            try:
+                stat = os.stat(absolutePath)
+                if not self.isCandidate(absolutePath, stat, now):
+                    continue
+            except (IOError, OSError) as error:
+                logging.error('Failed in evaluating file {}: {}'.format(absolutePath, str(error)))
+                continue
+            allocated = stat.st_blocks * 512
+            item = (allocated * max(now - stat.st_atime, 1), allocated, absolutePath)
+            if len(heap) < self.maxCandidates:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+        return [(allocated, absolutePath) for _, allocated, absolutePath in sorted(heap, reverse=True)]
+
+    def run(self, filePaths, targetBytes, dryRun=False, batchSize=DEFAULT_HSM_BATCH_SIZE):
+        """Releases the best candidates in batches until targetBytes are freed
+
+        Args:
+            filePaths (iterable[str]): stream of file paths
+            targetBytes (int): bytes to be freed
+            dryRun (bool, optional): only compute the projected savings. Defaults to False.
+            batchSize (int, optional): number of files per release request. Defaults to 1000.
+
+        Returns:
+            tuple[int, int]: number of files and bytes released (or to be released in dry-run)
+        """
+        candidates = self.select(filePaths)
+        releasedFiles, releasedBytes = 0, 0
+        for batch in chunked(candidates, batchSize):
+            if releasedBytes >= targetBytes:
+                break
+            selected = []
+            for allocated, absolutePath in batch:
+                if releasedBytes >= targetBytes:
+                    break
+                selected.append((allocated, absolutePath))
+                releasedBytes += allocated
+
+            if dryRun:
+                releasedFiles += len(selected)
+                continue
+
+            # Blob presence is confirmed before releasing, as release does for single files
+            presence = self.azureManagedLustreHSM.areFilesOnHSM([absolutePath for _, absolutePath in selected])
+            releasable = [absolutePath for _, absolutePath in selected if presence.get(absolutePath)]
+            failed = set(self.azureManagedLustreHSM.runHSMActionBatch(HUA_RELEASE, releasable, batchSize))
+            for allocated, absolutePath in selected:
+                if absolutePath in failed or not presence.get(absolutePath):
+                    releasedBytes -= allocated
+                else:
+                    releasedFiles += 1
+
+        if releasedBytes < targetBytes:
+            logging.warning('Only {} bytes out of {} could be {}.'.format(releasedBytes, targetBytes, 'selected' if dryRun else 'released'))
+        return releasedFiles, releasedBytes
@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import time
+import zlib
+
+from .pipeline import ordered_map
+from .utilities import get_relative_path
+
+
+class Shard:
+    """Deterministic partition of the work of a run among count shards, so that several client nodes can run
+    the same command without overlap. Files are assigned by hashing their FID, which is the same on every
+    client whatever the mount point, or by hashing their path relative to the mount point, which needs no
+    MDS lookup but may assign the hard links of a file to several shards. Blobs are assigned by hashing
+    their name, so that with path assignment a file and its blob belong to the same shard.
+
+    Args:
+        index (int): index of the shard, from 0 to count - 1
+        count (int): number of shards
+        getFID (callable, optional): function returning the FID string of a file. Defaults to path2fid.
+        byPath (bool, optional): if files are assigned by path instead of FID. Defaults to False.
+    """
+    def __init__(self, index, count, getFID=None, byPath=False) -> None:
+        if count < 1 or not 0 <= index < count:
+            raise ValueError('Invalid shard {}/{}: the index must be between 0 and {}.'.format(index, count, count - 1))
+        self.index = index
+        self.count = count
+        self.byPath = byPath
+        self.getFID = getFID
+        self._path2fid = None
+        if getFID is None and not byPath:
+            from .lustreapi import path2fid, format_fid
+
+            self._path2fid = path2fid
+            self._formatFID = format_fid
+
+    @classmethod
+    def parse(cls, spec, getFID=None, byPath=False):
+        """Builds a shard from an i/N string
+
+        Args:
+            spec (str): shard index and count, e.g. 0/4
+            getFID (callable, optional): function returning the FID string of a file. Defaults to path2fid.
+            byPath (bool, optional): if files are assigned by path instead of FID. Defaults to False.
+
+        Returns:
+            (Shard): the shard
+        """
+        index, _, count = spec.partition('/')
+        return cls(int(index), int(count), getFID, byPath)
+
+    def __str__(self):
+        return '{}/{}'.format(self.index, self.count)
+
+    def _owns(self, key):
+        return zlib.crc32(key.encode('utf8')) % self.count == self.index
+
+    def _ownership(self, filePath):
+        # Returns if the shard owns the file, with the lu_fid looked up for it if any
+        if self.byPath:
+            return self._owns(get_relative_path(filePath)), None
+        lufid = None
+        try:
+            if self._path2fid is not None:
+                lufid = self._path2fid(filePath)
+                key = self._formatFID(lufid)
+            else:
+                key = self.getFID(filePath)
+        except (IOError, OSError):
+            key = os.path.abspath(filePath)
+        return self._owns(key), lufid
+
+    def ownsFile(self, filePath):
+        """Checks if a file belongs to the shard. Files whose FID cannot be read are assigned by absolute path.
+
+        Args:
+            filePath (str): file path on the file system
+
+        Returns:
+            bool: True if the shard processes the file
+        """
+        return self._ownership(filePath)[0]
+
+    def ownsBlob(self, blobName):
+        return self._owns(blobName)
+
+    def files(self, filePaths, workers=1, fidCache=None):
+        """Filters a stream of files keeping the ones of the shard. The FID lookups of the files are run in
+        parallel, in the input order, and the FIDs of the kept files are handed to the HSM requests.
+
+        Args:
+            filePaths (iterable[str]): stream of file paths
+            workers (int, optional): number of parallel FID lookups. Defaults to 1.
+            fidCache (FIDCache, optional): cache the FIDs of the kept files are put in, by absolute path
+
+        Yields:
+            str: file path of the shard
+        """
+        if workers > 1 and not self.byPath:
+            results = ordered_map(self._ownership, filePaths, workers)
+        else:
+            results = ((filePath, self._ownership(filePath)) for filePath in filePaths)
+        for filePath, (owned, lufid) in results:
+            if not owned:
+                continue
+            if fidCache is not None and lufid is not None:
+                fidCache.put(os.path.abspath(filePath), lufid)
+            yield filePath
+
+
+def write_report(path, action, shard=None, counters=None, failed=(), started=None):
+    """Writes the JSON report of a run, or of a shard of it
+
+    Args:
+        path (str): report file
+        action (str): action name
+        shard (Shard, optional): shard of the run. Defaults to the whole run.
+        counters (dict[str, int], optional): counters of the run, summed by merge
+        failed (iterable[str], optional): paths of the files or blobs which failed
+        started (float, optional): start time of the run
+    """
+    report = {
+        'action': action,
+        'shard': [shard.index, shard.count] if shard is not None else [0, 1],
+        'started': started,
+        'finished': time.time(),
+        'counters': counters or {},
+        'failed': sorted(failed),
+    }
+    with open(path, 'w') as fid:
+        json.dump(report, fid, indent=2)
+
+
+def merge_reports(reports):
+    """Combines the reports of the shards of a run: counters are summed and failures concatenated.
+    Shards missing or reported twice are logged and listed in the result.
+
+    Args:
+        reports (list[dict]): shard reports
+
+    Raises:
+        ValueError: if the reports are not of the same action and number of shards
+
+    Returns:
+        dict: the merged report
+    """
+    if not reports:
+        raise ValueError('No reports to be merged.')
+    actions = set(report['action'] for report in reports)
+    counts = set(report['shard'][1] for report in reports)
+    if len(actions) > 1 or len(counts) > 1:
+        raise ValueError('Reports of different runs cannot be merged: actions {}, shard counts {}.'.format(sorted(actions), sorted(counts)))
+
+    count = counts.pop()
+    indexes = [report['shard'][0] for report in reports]
+    missing = sorted(set(range(count)).difference(indexes))
+    duplicated = sorted(set(index for index in indexes if indexes.count(index) > 1))
+    if missing:
+        logging.error('Reports of shards {} are missing.'.format(missing))
+    if duplicated:
+        logging.error('Shards {} are reported more than once.'.format(duplicated))
+
+    counters = {}
+    for report in reports:
+        for name, value in report['counters'].items():
+            counters[name] = counters.get(name, 0) + value
+    started = [report['started'] for report in reports if report.get('started') is not None]
+    return {
+        'action': actions.pop(),
+        'shards': count,
+        'missing_shards': missing,
+        'duplicated_shards': duplicated,
+        'started': min(started) if started else None,
+        'finished': max(report['finished'] for report in reports),
+        'counters': counters,
+        'failed': sorted(failed for report in reports for failed in report['failed']),
+    }
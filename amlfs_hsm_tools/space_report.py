@@ -0,0 +1,208 @@
+import csv
+import json
+import logging
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from .hsm_query import HSMQueryEngine, DEFAULT_QUERY_WORKERS
+from .lustre_hsm_constants import HSM_STATE_FLAGS, HSM_ARCHIVED_STATE, HSM_DIRTY_STATE, HSM_RELEASED_STATE
+from .pipeline import ParallelWalker, chunked, DEFAULT_WALK_WORKERS
+
+
+# resident: archived and in sync, with the data on Lustre, released: data only on the HSM backend,
+# dirty: archived but modified since, unarchived: never archived
+SPACE_STATES = ('resident', 'released', 'dirty', 'unarchived')
+SPACE_COUNTERS = ('files', 'bytes', 'allocated')
+DEFAULT_REPORT_DEPTH = 1
+REPORT_CHUNK_SIZE = 4096
+
+ARCHIVED = HSM_STATE_FLAGS[HSM_ARCHIVED_STATE]
+DIRTY = HSM_STATE_FLAGS[HSM_DIRTY_STATE]
+RELEASED = HSM_STATE_FLAGS[HSM_RELEASED_STATE]
+
+
+def space_state(flags):
+    """Classifies a file by its HSM state bitmask
+
+    Args:
+        flags (int): HSM state bitmask
+
+    Returns:
+        int: index of the state in SPACE_STATES
+    """
+    if flags & RELEASED:
+        return 1
+    if not flags & ARCHIVED:
+        return 3
+    if flags & DIRTY:
+        return 2
+    return 0
+
+
+def _scan_chunk(root, depth, workers, filePaths):
+    report = SpaceReport([root], depth, workers)
+    linked = []
+    report.scan(root, filePaths, linked)
+    return report.rollups, report.errors, linked
+
+
+class SpaceReport:
+    """Accounts the files, apparent bytes and allocated bytes of directory trees by HSM state, in a single
+    walk. Each file is opened once to read its HSM state and stat. Counters are rolled up into every
+    directory down to depth levels below the roots, so memory depends on the number of reported
+    directories and not on the number of files. With more than one process, the walked files are
+    handed in chunks to a process pool, each process querying its chunk with a pool of threads.
+    A file with several hard links is accounted once, in the directories of the first link found.
+
+    Args:
+        roots (list[str]): directories to be reported
+        depth (int, optional): levels of subdirectories reported below each root. Defaults to 1.
+        workers (int, optional): number of parallel file queries in each process. Defaults to 16.
+        processes (int, optional): number of processes querying the files. Defaults to 1.
+        walkWorkers (int, optional): number of parallel directory scanners. Defaults to 8.
+    """
+    def __init__(self, roots, depth=DEFAULT_REPORT_DEPTH, workers=DEFAULT_QUERY_WORKERS, processes=1,
+                 walkWorkers=DEFAULT_WALK_WORKERS) -> None:
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.depth = depth
+        self.workers = workers
+        self.processes = processes
+        self.walkWorkers = walkWorkers
+        self.rollups = {}
+        self.errors = 0
+        self.inodes = set()
+
+    def directories(self, root, filePath):
+        """Returns the reported directories a file is accounted in
+
+        Args:
+            root (str): root directory the file was found under
+            filePath (str): absolute file path
+
+        Returns:
+            list[str]: the root and its subdirectories containing the file, down to the report depth
+        """
+        directories = [root]
+        relative = os.path.relpath(os.path.dirname(filePath), root)
+        if relative != os.curdir:
+            for part in relative.split(os.sep)[:self.depth]:
+                directories.append(os.path.join(directories[-1], part))
+        return directories
+
+    def add(self, root, filePath, flags, stat):
+        if stat.st_nlink > 1:
+            inode = (stat.st_dev, stat.st_ino)
+            if inode in self.inodes:
+                return
+            self.inodes.add(inode)
+        offset = space_state(flags) * len(SPACE_COUNTERS)
+        for directory in self.directories(root, filePath):
+            counters = self.rollups.get(directory)
+            if counters is None:
+                counters = self.rollups[directory] = [0] * (len(SPACE_STATES) * len(SPACE_COUNTERS))
+            counters[offset] += 1
+            counters[offset + 1] += stat.st_size
+            counters[offset + 2] += stat.st_blocks * 512
+
+    def scan(self, root, filePaths, linked=None):
+        """Queries and accounts a stream of files of a root
+
+        Args:
+            root (str): root directory the files were found under
+            filePaths (iterable[str]): stream of absolute file paths
+            linked (list, optional): if given, the files with several hard links are appended to it as
+                (root, path, flags, stat) instead of being accounted. Defaults to None.
+        """
+        for result in HSMQueryEngine(self.workers, withStat=True).queryMany(filePaths):
+            if result.error is not None:
+                self.errors += 1
+            elif linked is not None and result.stat.st_nlink > 1:
+                linked.append((root, result.path, result.flags, result.stat))
+            else:
+                self.add(root, result.path, result.flags, result.stat)
+
+    def merge(self, rollups, errors, linked=()):
+        """Adds the counters of a partial report
+
+        Args:
+            rollups (dict[str, list[int]]): counters by directory
+            errors (int): number of files which could not be queried
+            linked (list, optional): files with several hard links left out of the counters, accounted here
+                once across all the partial reports
+        """
+        self.errors += errors
+        for directory, counters in rollups.items():
+            current = self.rollups.get(directory)
+            if current is None:
+                self.rollups[directory] = counters
+            else:
+                self.rollups[directory] = [a + b for a, b in zip(current, counters)]
+        for root, filePath, flags, stat in linked:
+            self.add(root, filePath, flags, stat)
+
+    def run(self):
+        """Walks the roots and accounts all their files
+
+        Returns:
+            (SpaceReport): the report itself
+        """
+        walker = ParallelWalker(self.walkWorkers)
+        if self.processes <= 1:
+            for root in self.roots:
+                self.scan(root, walker.walk([root]))
+            return self
+
+        with ProcessPoolExecutor(self.processes) as executor:
+            # Worker processes are started before the walker threads, so that none is forked while they run
+            wait([executor.submit(os.getpid) for _ in range(self.processes)])
+            for root in self.roots:
+                pending = set()
+                for chunk in chunked(walker.walk([root]), REPORT_CHUNK_SIZE):
+                    pending.add(executor.submit(_scan_chunk, root, self.depth, self.workers, chunk))
+                    if len(pending) >= 2 * self.processes:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self.merge(*future.result())
+                for future in wait(pending).done:
+                    self.merge(*future.result())
+        return self
+
+    def rows(self):
+        """Returns the report as flat rows, one per directory sorted by path
+
+        Returns:
+            list[dict]: directory path, totals and counters of every state
+        """
+        rows = []
+        for directory in sorted(self.rollups):
+            counters = self.rollups[directory]
+            row = {'path': directory}
+            for index, counter in enumerate(SPACE_COUNTERS):
+                row[counter] = sum(counters[index::len(SPACE_COUNTERS)])
+            for stateIndex, state in enumerate(SPACE_STATES):
+                for index, counter in enumerate(SPACE_COUNTERS):
+                    row['{}_{}'.format(state, counter)] = counters[stateIndex * len(SPACE_COUNTERS) + index]
+            rows.append(row)
+        return rows
+
+    def write(self, fid, outputFormat='json'):
+        """Writes the report
+
+        Args:
+            fid (file): text file the report is written to
+            outputFormat (str, optional): json or csv. Defaults to json.
+        """
+        rows = self.rows()
+        if outputFormat == 'csv':
+            writer = csv.DictWriter(fid, ['path'] + list(SPACE_COUNTERS) + ['{}_{}'.format(state, counter)
+                                                                            for state in SPACE_STATES for counter in SPACE_COUNTERS])
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump({'generated': time.time(), 'roots': self.roots, 'depth': self.depth, 'errors': self.errors,
+                       'directories': rows}, fid, indent=2)
+            fid.write('\n')
+        if self.errors:
+            logging.error('{} files could not be queried and are not accounted.'.format(self.errors))
@@ -0,0 +1,121 @@
+import logging
+import os
+import threading
+import time
+
+from .lustre_hsm_constants import HUA_RESTORE, DEFAULT_HSM_BATCH_SIZE
+from .hsm_state_cache import fid_key
+from .pipeline import DEFAULT_ACTION_WORKERS
+
+
+ORDER_SIZE = 'size'
+ORDER_MANIFEST = 'manifest'
+STAGE_ORDERS = (ORDER_SIZE, ORDER_MANIFEST)
+DEFAULT_PROGRESS_INTERVAL = 5.0
+
+
+class Stager:
+    """Brings back online the released files of a job input set before the job starts. Every file is
+    opened once to read its FID, HSM state and size, files already resident are skipped and hard links are
+    restored once per FID. Restores are submitted in multi-file HSM requests, largest files first or
+    in the order of the manifest, and the whole set is waited for in a single completion loop.
+
+    Args:
+        azureManagedLustreHSM (AzureManagedLustreHSM): the engine used for state reads and restores
+        order (str, optional): size (largest first) or manifest (input order). Defaults to size.
+        workers (int, optional): number of parallel file queries. Defaults to 1.
+    """
+    def __init__(self, azureManagedLustreHSM, order=ORDER_SIZE, workers=DEFAULT_ACTION_WORKERS) -> None:
+        if order not in STAGE_ORDERS:
+            raise ValueError('Invalid stage order {}: must be one of {}.'.format(order, ', '.join(STAGE_ORDERS)))
+        # The query engine loads liblustreapi, the stage orders are read by the command line parser
+        from .hsm_query import HSMQueryEngine
+
+        self.azureManagedLustreHSM = azureManagedLustreHSM
+        self.order = order
+        self.queryEngine = HSMQueryEngine(workers, withStat=True)
+
+    def select(self, filePaths):
+        """Scans the files and returns the released ones, once per FID, in restore order
+
+        Args:
+            filePaths (iterable[str]): stream of file paths, in manifest order
+
+        Returns:
+            tuple[list[tuple[int, str, lu_fid]], list[str]]: size, absolute path and FID of the files to
+            be restored, and the paths of the files which could not be read
+        """
+        selected, unreadable = [], []
+        seen = set()
+        resident = duplicated = 0
+        absolutePaths = (os.path.abspath(filePath) for filePath in filePaths)
+        for result in self.queryEngine.queryMany(absolutePaths):
+            if result.error is not None:
+                unreadable.append(result.path)
+                continue
+            if not self.azureManagedLustreHSM.isFileReleased(result.path, result.flags):
+                resident += 1
+                continue
+            key = fid_key(result.fid)
+            if key in seen:
+                duplicated += 1
+                continue
+            seen.add(key)
+            selected.append((result.stat.st_size, result.path, result.fid))
+
+        if self.order == ORDER_SIZE:
+            selected.sort(key=lambda item: item[0], reverse=True)
+        logging.info('{} files to be restored, {} already online, {} duplicated FIDs skipped.'.format(len(selected), resident, duplicated))
+        return selected, unreadable
+
+    def run(self, filePaths, batchSize=DEFAULT_HSM_BATCH_SIZE, timeout=None, progress=None, progressInterval=DEFAULT_PROGRESS_INTERVAL):
+        """Restores the released files and waits until all of them are online
+
+        Args:
+            filePaths (iterable[str]): stream of file paths, in manifest order
+            batchSize (int, optional): number of files per restore request. Defaults to 1000.
+            timeout (float, optional): maximum seconds to wait for the restores. Defaults to no timeout.
+            progress (callable, optional): called with the restored files, the files to be restored, the restored
+                bytes and the bytes to be restored, at most every progressInterval seconds and at the end
+            progressInterval (float, optional): minimum seconds between two progress calls. Defaults to 5.
+
+        Returns:
+            tuple[int, int, list[str]]: number of files and bytes restored, and the paths of the files which failed
+        """
+        selected, failed = self.select(filePaths)
+        totalFiles, totalBytes = len(selected), sum(size for size, _, _ in selected)
+        sizes = {absolutePath: size for size, absolutePath, _ in selected}
+        submitFailed = set(self.azureManagedLustreHSM.runHSMActionBatch(HUA_RESTORE, [absolutePath for _, absolutePath, _ in selected],
+                                                                        batchSize, [lufid for _, _, lufid in selected]))
+        failed.extend(submitFailed)
+
+        lock = threading.Lock()
+        state = {'files': 0, 'bytes': 0, 'reported': 0.0}
+
+        def _report(final=False):
+            now = time.monotonic()
+            if progress is not None and (final or now - state['reported'] >= progressInterval):
+                state['reported'] = now
+                progress(state['files'], totalFiles, state['bytes'], totalBytes)
+
+        def _done(absolutePath, future):
+            if future.exception() is not None:
+                logging.error('Failed in restoring file {}: {}'.format(absolutePath, str(future.exception())))
+                with lock:
+                    failed.append(absolutePath)
+                return
+            with lock:
+                state['files'] += 1
+                state['bytes'] += sizes[absolutePath]
+                _report()
+
+        tracker = self.azureManagedLustreHSM.completionTracker()
+        for _, absolutePath, _ in selected:
+            if absolutePath in submitFailed:
+                continue
+            future = tracker.watchAction(absolutePath, HUA_RESTORE)
+            future.add_done_callback(lambda future, absolutePath=absolutePath: _done(absolutePath, future))
+        _report()
+        tracker.wait(timeout)
+        _report(final=True)
+        return state['files'], state['bytes'], failed
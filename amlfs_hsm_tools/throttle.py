@@ -0,0 +1,150 @@
+import errno
+import logging
+import random
+import threading
+import time
+
+from .metrics import metrics
+
+
+HSM_CONGESTION_ERRNOS = (errno.EAGAIN, errno.EBUSY)
+# ServerBusy, OperationTimedOut and TooManyRequests are the throttling answers of the storage account
+BLOB_CONGESTION_STATUS_CODES = (429, 500, 503)
+
+DEFAULT_MAX_RETRIES = 8
+MIN_BACKOFF = 0.05
+MAX_BACKOFF = 30.0
+
+
+def hsm_congested(error):
+    """Checks if an HSM request failed because the coordinator is overloaded
+
+    Args:
+        error (Exception): error raised by the request
+
+    Returns:
+        bool: True for EAGAIN and EBUSY
+    """
+    return isinstance(error, EnvironmentError) and error.errno in HSM_CONGESTION_ERRNOS
+
+
+def blob_congested(error):
+    """Checks if a blob request failed because the storage account is throttling
+
+    Args:
+        error (Exception): error raised by the request
+
+    Returns:
+        bool: True for HTTP 429, 500 and 503
+    """
+    return getattr(error, 'status_code', None) in BLOB_CONGESTION_STATUS_CODES
+
+
+def throttled_items(paged, controller):
+    """Iterates over the items of a paged listing, fetching each page through a rate controller, so that
+    a throttled page is requested again with backoff instead of aborting the whole listing
+
+    Args:
+        paged (ItemPaged): paged listing, e.g. returned by list_blobs
+        controller (RateController): rate controller of the backend
+
+    Yields:
+        the items of the listing
+    """
+    pages = paged.by_page()
+    while True:
+        # A failed page request leaves the continuation token unchanged, the same page is requested again
+        page = controller.call(lambda: next(pages, None))
+        if page is None:
+            return
+        yield from page
+
+
+class ServerBusyError(Exception):
+    """Raised when some sub-requests of a blob batch were throttled
+    """
+    status_code = 503
+
+
+class RateController:
+    """Limits the operations in flight with AIMD feedback: the limit grows by one every limit successful
+    operations and is halved when an operation is rejected as congested, at most once per round of operations
+    in flight. Congested operations are retried after a jittered exponential backoff.
+
+    Args:
+        name (str): name of the controlled operations, for logs and metrics
+        isCongested (callable): tells from an exception if the operation was rejected by congestion
+        maxLimit (int): maximum number of operations in flight
+        initialLimit (int, optional): starting number of operations in flight. Defaults to maxLimit.
+        maxRetries (int, optional): retries of a congested operation. Defaults to 8.
+    """
+    def __init__(self, name, isCongested, maxLimit, initialLimit=None, maxRetries=DEFAULT_MAX_RETRIES,
+                 minBackoff=MIN_BACKOFF, maxBackoff=MAX_BACKOFF) -> None:
+        self.name = name
+        self.isCongested = isCongested
+        self.maxLimit = maxLimit
+        self.limit = float(initialLimit or maxLimit)
+        self.maxRetries = maxRetries
+        self.minBackoff = minBackoff
+        self.maxBackoff = maxBackoff
+        self.inFlight = 0
+        self._epoch = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Waits for a free slot
+
+        Returns:
+            int: the decrease epoch the operation started in, to be passed to release
+        """
+        with self._condition:
+            while self.inFlight >= int(self.limit):
+                self._condition.wait()
+            self.inFlight += 1
+            return self._epoch
+
+    def release(self, epoch, congested=False):
+        """Frees a slot and updates the limit
+
+        Args:
+            epoch (int): value returned by acquire
+            congested (bool, optional): if the operation was rejected by congestion. Defaults to False.
+        """
+        with self._condition:
+            self.inFlight -= 1
+            if not congested:
+                self.limit = min(self.maxLimit, self.limit + 1 / self.limit)
+            elif epoch == self._epoch:
+                # Operations started before the last decrease do not decrease the limit again
+                self.limit = max(1.0, self.limit / 2)
+                self._epoch += 1
+                logging.debug('{} congested, limit lowered to {} in flight.'.format(self.name, int(self.limit)))
+            self._condition.notify_all()
+
+    def call(self, function):
+        """Runs an operation within the limit, retrying it with backoff while it is rejected by congestion
+
+        Args:
+            function (callable): operation without arguments
+
+        Raises:
+            Exception: the error of the operation, if not congestion or once the retries are exhausted
+
+        Returns:
+            the result of the operation
+        """
+        for attempt in range(self.maxRetries + 1):
+            epoch = self.acquire()
+            try:
+                result = function()
+            except Exception as error:
+                congested = self.isCongested(error)
+                self.release(epoch, congested)
+                if not congested or attempt == self.maxRetries:
+                    raise
+                delay = min(self.maxBackoff, self.minBackoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+                metrics.observe('throttle', self.name, delay)
+                time.sleep(delay)
+                continue
+            self.release(epoch)
+            return result
@@ -1,5 +1,12 @@
+import hashlib
 import json
 import os
+import re
+
+
+DEFAULT_CONFIGURATION_FILE = '/etc/amlfs_hsm_tools.json'
+MOUNTINFO_FILE = '/proc/self/mountinfo'
+LUSTRE_FSTYPES = ('lustre',)
 
 
 def loadConfiguration(file):
@@ -7,14 +14,155 @@ def loadConfiguration(file):
         configuration = json.load(fid)
     return configuration
 
-def get_relative_path(path):
-    mountPath = os.path.abspath(path)
+
+def file_md5(path, chunkSize=1 << 20):
+    """Computes the MD5 digest of a file, reading it in chunks
+
+    Args:
+        path (str): file path
+        chunkSize (int, optional): bytes read at a time. Defaults to 1 MiB.
+
+    Returns:
+        bytes: the MD5 digest
+    """
+    digest = hashlib.md5()
+    with open(path, 'rb') as fid:
+        for chunk in iter(lambda: fid.read(chunkSize), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+SIZE_SUFFIXES = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40, 'P': 1 << 50}
+
+
+def parse_size(size):
+    """Parses a size in bytes, accepting binary suffixes (e.g. 10G, 1.5T)
+
+    Args:
+        size (str): size with an optional K, M, G, T or P suffix
+
+    Returns:
+        int: size in bytes
+    """
+    size = size.strip().upper().rstrip('B')
+    if size and size[-1] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+class MountTable:
+    """Lustre mount points parsed once from /proc/self/mountinfo, sorted for longest-prefix matching
+    """
+    def __init__(self, mountPoints) -> None:
+        self.mountPoints = sorted((mountPoint.rstrip('/') for mountPoint in mountPoints), key=len, reverse=True)
+
+    @staticmethod
+    def _unescape(field):
+        return re.sub(r'\\([0-7]{3})', lambda match: chr(int(match.group(1), 8)), field)
+
+    @classmethod
+    def from_mountinfo(cls, mountinfo, fstypes=LUSTRE_FSTYPES):
+        """Builds the table from the content of a mountinfo file
+
+        Args:
+            mountinfo (str): content in /proc/self/mountinfo format
+            fstypes (tuple[str], optional): file system types to be kept. Defaults to lustre.
+
+        Returns:
+            (MountTable): the mount table
+        """
+        mountPoints = []
+        for line in mountinfo.splitlines():
+            fields, _, optional = line.partition(' - ')
+            fields, optional = fields.split(), optional.split()
+            if len(fields) > 4 and optional and optional[0] in fstypes:
+                mountPoints.append(cls._unescape(fields[4]))
+        return cls(mountPoints)
+
+    @classmethod
+    def from_file(cls, file=MOUNTINFO_FILE, fstypes=LUSTRE_FSTYPES):
+        with open(file, 'r') as fid:
+            return cls.from_mountinfo(fid.read(), fstypes)
+
+    def find(self, path):
+        """Returns the mount point containing an absolute path
+
+        Args:
+            path (str): absolute path
+
+        Returns:
+            str: the longest mount point containing the path, None if no mount point contains it
+        """
+        for mountPoint in self.mountPoints:
+            if path == mountPoint or path.startswith(mountPoint + '/') or mountPoint == '':
+                return mountPoint or '/'
+        return None
+
+
+_mountTable = None
+
+
+def get_mount_table():
+    """Returns the Lustre mount table of the process, parsed on first use
+
+    Returns:
+        (MountTable): the mount table
+    """
+    global _mountTable
+    if _mountTable is None:
+        try:
+            _mountTable = MountTable.from_file()
+        except OSError:
+            _mountTable = MountTable([])
+    return _mountTable
+
+
+def set_mount_table(mountTable):
+    """Replaces the Lustre mount table of the process, e.g. to run on directories standing in for a mount
+
+    Args:
+        mountTable (MountTable): the mount table
+    """
+    global _mountTable
+    _mountTable = mountTable
+
+
+def _find_mount_point(path):
+    mountPath = path
     while not os.path.ismount(mountPath):
         mountPath = os.path.dirname(mountPath)
+    return mountPath
+
+
+def get_relative_path(path, mountTable=None):
+    """Returns the blob name of a file, i.e. its path relative to the Lustre mount point.
+    The mount point is looked up in the mount table, without file system calls; paths outside
+    of any Lustre mount fall back to walking up the tree with os.path.ismount.
+
+    Args:
+        path (str): file path on the file system
+        mountTable (MountTable, optional): mount table to be used. Defaults to the process one.
+
+    Returns:
+        str: the path relative to the mount point
+    """
+    absolutePath = os.path.abspath(path)
+    mountPath = (mountTable or get_mount_table()).find(absolutePath)
+    if mountPath is None:
+        mountPath = _find_mount_point(absolutePath)
+
+    return absolutePath[len(mountPath):].lstrip('/')
+
+
+def get_absolute_path(blobName, mountPoint):
+    """Returns the path under a Lustre mount point of a blob in the HSM container,
+    reversing get_relative_path
 
-    relativePath = os.path.abspath(path).replace(mountPath, '')    
+    Args:
+        blobName (str): blob name in the HSM container
+        mountPoint (str): Lustre mount point
 
-    if relativePath[0] == '/':
-        relativePath = relativePath[1:]
-    
-    return relativePath
\ No newline at end of file
+    Returns:
+        str: absolute file path on the file system
+    """
+    return os.path.join(os.path.abspath(mountPoint), blobName.lstrip('/'))
@@ -0,0 +1,48 @@
+'''
+Measures the per-file setup cost of the blob backend client: building a new client
+(configuration read, credential and token fetch) for every file against reusing a single one.
+
+Run it on an AMLFS client with the managed identity configured:
+
+    python benchmarks/engine_setup.py --files 100
+'''
+import argparse
+import time
+
+from azure.identity import DefaultAzureCredential
+
+from amlfs_hsm_tools.lfs_blob_client import LFSBlobClient, DEFAULT_CONFIGURATION_FILE
+
+STORAGE_SCOPE = 'https://storage.azure.com/.default'
+
+
+def setup_per_file(files, configurationFile):
+    for _ in range(files):
+        credential = DefaultAzureCredential(exclude_workload_identity_credential=True, exclude_environment_credential=True)
+        client = LFSBlobClient(configurationFile, credential=credential)
+        client.credential.get_token(STORAGE_SCOPE)
+        client.get_blob_client(container=client.containerName, blob='benchmark')
+
+
+def setup_once(files, configurationFile):
+    client = LFSBlobClient(configurationFile)
+    for _ in range(files):
+        client.credential.get_token(STORAGE_SCOPE)
+        client.get_blob_client(container=client.containerName, blob='benchmark')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Blob client setup cost per file.')
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--configuration', default=DEFAULT_CONFIGURATION_FILE)
+    args = parser.parse_args()
+
+    for name, function in (('client per file', setup_per_file), ('shared client', setup_once)):
+        start = time.perf_counter()
+        function(args.files, args.configuration)
+        elapsed = time.perf_counter() - start
+        print('{:<16} {:>10.3f} ms/file'.format(name, 1000 * elapsed / args.files))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+'''
+Measures the startup import cost of each action with python -X importtime and checks it against
+a budget: Lustre-only actions against --budget-ms, and fail the check if any Azure SDK module gets
+imported, actions using the blob client against --blob-budget-ms. Actions which do not touch
+Lustre (merge and the runs forwarded to the daemon) fail the check if liblustreapi gets loaded.
+
+Run it on an AMLFS client where liblustreapi is available:
+
+    python benchmarks/import_time.py --budget-ms 150 --blob-budget-ms 1000
+'''
+import argparse
+import subprocess
+import sys
+
+
+CLIENT = 'import amlfs_hsm_tools.main'
+ENGINE = CLIENT + '; from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM'
+BLOBS = ENGINE + '; from amlfs_hsm_tools.lfs_blob_client import LFSBlobClient'
+
+LUSTREAPI_MODULE = 'amlfs_hsm_tools.lustreapi'
+
+# Import set of each action, if the action is expected to run without the Azure SDK and if it needs liblustreapi
+ACTIONS = (
+    ('merge', CLIENT, True, False),
+    ('forward', CLIENT, True, False),
+    ('archive', ENGINE, True, True),
+    ('restore', ENGINE, True, True),
+    ('release-policy', ENGINE, True, True),
+    ('release', BLOBS, False, True),
+    ('check', BLOBS, False, True),
+    ('remove', BLOBS, False, True),
+)
+
+
+def import_times(statement):
+    '''Runs the statement in a new interpreter and returns the cumulative import time in
+    microseconds of each top-level import, nested imports being reported with 0
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        # Nested imports are indented, their time is already in the cumulative of their parent
+        times[module.strip()] = int(cumulative) if not module.startswith('  ') else 0
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup import cost per action.')
+    parser.add_argument('--budget-ms', type=float, default=150, help='budget of the Lustre-only actions')
+    parser.add_argument('--blob-budget-ms', type=float, default=1000, help='budget of the actions importing the Azure SDK')
+    args = parser.parse_args()
+
+    baseline = set(import_times('pass'))
+    failed = False
+    for action, statement, lustreOnly, needsLustreAPI in ACTIONS:
+        try:
+            times = import_times(statement)
+        except RuntimeError as error:
+            print('{:<16} failed: {}'.format(action, str(error)))
+            failed = True
+            continue
+        elapsed = sum(times[module] for module in times if module not in baseline) / 1000
+        azureModules = [module for module in times if module.startswith('azure')]
+        problems = []
+        if elapsed > (args.budget_ms if lustreOnly else args.blob_budget_ms):
+            problems.append('over budget')
+        if lustreOnly and azureModules:
+            problems.append('imports {}'.format(azureModules[0]))
+        if not needsLustreAPI and LUSTREAPI_MODULE in times:
+            problems.append('loads liblustreapi')
+        failed = failed or bool(problems)
+        print('{:<16} {:>8.1f} ms {:>4} azure modules  {}'.format(action, elapsed, len(azureModules), ', '.join(problems) or 'ok'))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
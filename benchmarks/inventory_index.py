@@ -0,0 +1,94 @@
+'''
+Compares the blob index built from a live listing of the HSM container with the one built from a
+Blob Inventory report, on the fake liblustreapi and in-memory blob backends. A CSV report (and a
+Parquet one if pyarrow is installed) is written from the archived tree, a share of the files is
+modified after the report, then both indexes are loaded and used by check. Reports the load time,
+the blob requests of the load and of the check, and the index size.
+
+    python benchmarks/inventory_index.py --files 100000 --blob-latency-ms 50 --changed 0.01
+'''
+import argparse
+import base64
+import csv
+import json
+import os
+import tempfile
+import time
+
+os.environ['AMLFS_HSM_LUSTREAPI'] = 'fake'
+
+from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM
+from amlfs_hsm_tools.inventory import INVENTORY_FIELDS
+from amlfs_hsm_tools.memory_blob_client import MemoryBlobServiceClient
+from amlfs_hsm_tools.utilities import MountTable, set_mount_table
+
+from offline_suite import attach_copytool, create_tree
+
+
+def write_inventory(backend, directory):
+    container = backend.containers[backend.containerName]
+    rows = [{'Name': '{}/{}'.format(backend.containerName, blob.name), 'Content-Length': blob.size,
+             'Last-Modified': blob.last_modified.isoformat(), 'Etag': blob.etag,
+             'Content-MD5': base64.b64encode(blob.content_settings.content_md5).decode() if blob.content_settings.content_md5 else ''}
+            for blob in container.values()]
+    reports = [os.path.join(directory, 'inventory.csv')]
+    with open(reports[0], 'w', newline='') as fid:
+        writer = csv.DictWriter(fid, INVENTORY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return reports
+    reports.append(os.path.join(directory, 'inventory.parquet'))
+    pyarrow.parquet.write_table(pyarrow.Table.from_pylist(rows), reports[1])
+    return reports
+
+
+def measure(name, engine, backend, load, paths):
+    requests = backend.rpcs()
+    start = time.perf_counter()
+    index = load()
+    elapsed = time.perf_counter() - start
+    loadRequests = backend.rpcs() - requests
+    failed = engine.checkFiles(paths)
+    print('{:<10} {:>10.2f} {:>10} {:>10} {:>10} {:>7}'.format(name, elapsed, loadRequests, backend.rpcs() - requests - loadRequests,
+                                                               len(index), len(failed)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Blob index from a live listing or from an inventory report.')
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--blob-latency-ms', type=float, default=50)
+    parser.add_argument('--changed', type=float, default=0.01, help='share of the files modified after the report')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        paths = create_tree(os.path.join(root, 'lustre'), args.files)
+        set_mount_table(MountTable([os.path.join(root, 'lustre')]))
+        configurationFile = os.path.join(root, 'configuration.json')
+        with open(configurationFile, 'w') as fid:
+            json.dump({'accountURL': 'memory://', 'containerName': 'hsm'}, fid)
+
+        backend = MemoryBlobServiceClient()
+        attach_copytool(backend)
+        engine = AzureManagedLustreHSM(configurationFile, client=backend)
+        engine.archiveFiles(paths)
+        reports = write_inventory(backend, root)
+        reportTime = time.time()
+
+        time.sleep(0.01)
+        for path in paths[:int(len(paths) * args.changed)]:
+            os.utime(path)
+        backend.latency = args.blob_latency_ms / 1000
+
+        print('{:<10} {:>10} {:>10} {:>10} {:>10} {:>7}'.format('index', 'load s', 'load req', 'check req', 'blobs', 'failed'))
+        measure('listing', engine, backend, lambda: engine.loadBlobIndex()[engine.backends.default.archiveId], paths)
+        for report in reports:
+            measure(os.path.splitext(report)[1][1:], engine, backend, lambda: engine.loadBlobInventory(report, reportTime=reportTime), paths)
+        engine.close()
+
+
+if __name__ == '__main__':
+    main()
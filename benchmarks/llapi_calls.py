@@ -0,0 +1,127 @@
+'''
+Measures the cost of fetching the FID and HSM state of many files through ctypes, against a stand-in
+liblustreapi compiled on the fly (a C compiler is required). The stand-in opens the file as the real
+path-based calls do and sleeps --mds-latency-us in every call, without holding the GIL, to stand in for
+the MDS round trip. Compares the former per-call code (new structures, no restype or errcheck, two
+path-based calls), the current path-based calls, the fd-based query and the thread-pool query engine.
+
+    python benchmarks/llapi_calls.py --files 20000 --mds-latency-us 0 200 --workers 16
+'''
+import argparse
+import ctypes
+import os
+import subprocess
+import tempfile
+import time
+
+STAND_IN_SOURCE = r'''
+#include <fcntl.h>
+#include <string.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+struct lu_fid { unsigned long long f_seq; unsigned int f_oid; unsigned int f_ver; };
+struct hsm_extent { unsigned long long offset; unsigned long long length; };
+struct hsm_user_state { unsigned int hus_states; unsigned int hus_archive_id; unsigned int hus_in_progress_state;
+                        unsigned int hus_in_progress_action; struct hsm_extent hus_in_progress_location; char hus_extended_info; };
+
+static int latency_us = 0;
+
+void stand_in_set_latency(int us) { latency_us = us; }
+
+static int from_fd(int fd, struct lu_fid *fid, struct hsm_user_state *state) {
+    struct stat st;
+    if (fstat(fd, &st) < 0) return -1;
+    if (latency_us) usleep(latency_us);
+    if (fid) { fid->f_seq = st.st_dev; fid->f_oid = st.st_ino; fid->f_ver = 0; }
+    if (state) { memset(state, 0, sizeof(*state)); state->hus_states = st.st_ino & 0xf; }
+    return 0;
+}
+
+static int from_path(const char *path, struct lu_fid *fid, struct hsm_user_state *state) {
+    int fd = open(path, O_RDONLY | O_NONBLOCK);
+    if (fd < 0) return -2;
+    int rc = from_fd(fd, fid, state);
+    close(fd);
+    return rc;
+}
+
+int llapi_path2fid(const char *path, struct lu_fid *fid) { return from_path(path, fid, 0); }
+int llapi_fd2fid(int fd, struct lu_fid *fid) { return from_fd(fd, fid, 0); }
+int llapi_hsm_state_get(const char *path, struct hsm_user_state *state) { return from_path(path, 0, state); }
+int llapi_hsm_state_get_fd(int fd, struct hsm_user_state *state) { return from_fd(fd, 0, state); }
+int llapi_hsm_state_set(const char *path, unsigned long long set, unsigned long long clear, unsigned int id) { return -38; }
+int llapi_hsm_current_action(const char *path, void *action) { return -38; }
+int llapi_hsm_request(const char *path, void *request) { return -38; }
+int llapi_fid2path(const char *device, const char *fid, char *path, int len, long long *recno, int *linkno) { return -38; }
+void *llapi_hsm_user_request_alloc(int count, int len) { return 0; }
+'''
+
+
+def build_stand_in(directory):
+    source = os.path.join(directory, 'stand_in.c')
+    library = os.path.join(directory, 'liblustreapi_stand_in.so')
+    with open(source, 'w') as fid:
+        fid.write(STAND_IN_SOURCE)
+    subprocess.run([os.environ.get('CC', 'cc'), '-O2', '-shared', '-fPIC', '-o', library, source], check=True)
+    return library
+
+
+def legacy_query(library, paths):
+    from amlfs_hsm_tools.lustreapi_classes import lu_fid
+    from amlfs_hsm_tools.lustre_hsm_classes import hsm_state
+
+    path2fid = library.llapi_path2fid
+    state_get = library.llapi_hsm_state_get
+    state_get.argtypes = [ctypes.c_char_p, ctypes.POINTER(hsm_state)]
+    for path in paths:
+        lufid = lu_fid()
+        err = path2fid(path.encode('utf8'), ctypes.byref(lufid))
+        if err < 0:
+            raise IOError(-err, os.strerror(-err))
+        state = hsm_state()
+        err = state_get(path.encode(), ctypes.byref(state))
+        if err < 0:
+            raise IOError(-err, os.strerror(-err))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FID and HSM state query overhead against a stand-in liblustreapi.')
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--mds-latency-us', type=int, nargs='+', default=[0, 200])
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        library = build_stand_in(root)
+        os.environ['AMLFS_HSM_LUSTREAPI'] = library
+
+        from amlfs_hsm_tools.hsm_query import HSMQueryEngine
+        from amlfs_hsm_tools.lustreapi import lustre, path2fid
+        from amlfs_hsm_tools.lustreapi_hsm import get_hsm_flags, get_fid_and_hsm_flags
+
+        # A separate handle, so that the symbols keep the former declarations
+        legacy = ctypes.CDLL(library)
+        paths = []
+        for index in range(args.files):
+            paths.append(os.path.join(root, 'file{}'.format(index)))
+            open(paths[-1], 'w').close()
+
+        modes = (
+            ('former', lambda: legacy_query(legacy, paths)),
+            ('path', lambda: [(path2fid(path), get_hsm_flags(path)) for path in paths]),
+            ('fd', lambda: [get_fid_and_hsm_flags(path) for path in paths]),
+            ('fd x{}'.format(args.workers), lambda: list(HSMQueryEngine(args.workers).queryMany(paths))),
+        )
+        print('{:>12} {:<10} {:>12} {:>12}'.format('latency us', 'mode', 'files/s', 'us/file'))
+        for latency in args.mds_latency_us:
+            lustre.stand_in_set_latency(latency)
+            for name, run in modes:
+                start = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - start
+                print('{:>12} {:<10} {:>12.0f} {:>12.1f}'.format(latency, name, args.files / elapsed, elapsed / args.files * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+'''
+Runs archive, check, release, restore and remove on synthetic file trees without a Lustre mount
+or a storage account: liblustreapi is replaced by the in-process fake and the HSM container by the
+in-memory blob backend. Reports files/s and RPCs per file (liblustreapi calls and blob requests)
+of each action. The copytool completing the HSM requests is not counted.
+
+    python benchmarks/offline_suite.py --files 1000 10000 100000 1000000 --lustre-latency-ms 0.05 --blob-latency-ms 2
+'''
+import argparse
+import json
+import os
+import tempfile
+import time
+
+os.environ['AMLFS_HSM_LUSTREAPI'] = 'fake'
+
+from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM
+from amlfs_hsm_tools.lustre_hsm_constants import HUA_ARCHIVE, HUA_REMOVE
+from amlfs_hsm_tools.lustreapi import lustre
+from amlfs_hsm_tools.memory_blob_client import MemoryBlobServiceClient, MemoryBlobProperties
+from amlfs_hsm_tools.utilities import MountTable, get_relative_path, set_mount_table
+
+FILES_PER_DIRECTORY = 1000
+
+
+def create_tree(root, files):
+    paths = []
+    for index in range(files):
+        directory = os.path.join(root, 'dir{}'.format(index // FILES_PER_DIRECTORY))
+        if index % FILES_PER_DIRECTORY == 0:
+            os.makedirs(directory)
+        path = os.path.join(directory, 'file{}'.format(index))
+        open(path, 'w').close()
+        paths.append(path)
+    return paths
+
+
+def attach_copytool(backend, routes=None):
+    # Archive IDs missing from routes are served by backend
+    routes = routes or {}
+
+    # Writes the container directly, so that the copytool requests are not counted
+    def copytool(action, filePath, archiveId):
+        target = routes.get(archiveId, backend)
+        container = target.containers[target.containerName]
+        blobName = get_relative_path(filePath)
+        if action == HUA_ARCHIVE:
+            stat = os.stat(filePath)
+            container[blobName] = MemoryBlobProperties(blobName, stat.st_size, '"{:x}"'.format(stat.st_mtime_ns))
+        elif action == HUA_REMOVE:
+            container.pop(blobName, None)
+
+    lustre.copytool = copytool
+
+
+def remove_files(engine, paths):
+    for path in paths:
+        engine.remove(path)
+    return []
+
+
+def run_suite(files, lustreLatency, blobLatency):
+    results = []
+    with tempfile.TemporaryDirectory() as root:
+        paths = create_tree(root, files)
+        set_mount_table(MountTable([root]))
+        configurationFile = os.path.join(root, 'configuration.json')
+        with open(configurationFile, 'w') as fid:
+            json.dump({'accountURL': 'memory://', 'containerName': 'hsm'}, fid)
+
+        backend = MemoryBlobServiceClient(latency=blobLatency)
+        attach_copytool(backend)
+        lustre.latency = lustreLatency
+        engine = AzureManagedLustreHSM(configurationFile, client=backend)
+
+        for action, function in (('archive', engine.archiveFiles), ('check', engine.checkFiles),
+                                 ('release', engine.releaseFiles), ('restore', engine.restoreFiles),
+                                 ('remove', lambda paths: remove_files(engine, paths))):
+            lustreCalls, blobRequests = lustre.rpcs(), backend.rpcs()
+            start = time.perf_counter()
+            failed = function(paths)
+            elapsed = time.perf_counter() - start
+            results.append({
+                'files': files,
+                'action': action,
+                'files_per_second': files / elapsed,
+                'lustre_calls_per_file': (lustre.rpcs() - lustreCalls) / files,
+                'blob_requests_per_file': (backend.rpcs() - blobRequests) / files,
+                'failed': len(failed),
+            })
+        engine.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline action throughput on fake Lustre and blob backends.')
+    parser.add_argument('--files', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--lustre-latency-ms', type=float, default=0)
+    parser.add_argument('--blob-latency-ms', type=float, default=0)
+    parser.add_argument('--output', help='JSON lines file the results are appended to')
+    args = parser.parse_args()
+
+    print('{:>8} {:<8} {:>12} {:>14} {:>14} {:>7}'.format('files', 'action', 'files/s', 'lustre/file', 'blob/file', 'failed'))
+    for files in args.files:
+        for result in run_suite(files, args.lustre_latency_ms / 1000, args.blob_latency_ms / 1000):
+            print('{files:>8} {action:<8} {files_per_second:>12.0f} {lustre_calls_per_file:>14.2f} '
+                  '{blob_requests_per_file:>14.2f} {failed:>7}'.format(**result))
+            if args.output:
+                with open(args.output, 'a') as fid:
+                    fid.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+'''
+Compares the blob name resolution of deep paths walking up the tree with os.path.ismount
+against the mount table longest-prefix lookup.
+
+    python benchmarks/relative_path.py --depth 32 --files 20000
+'''
+import argparse
+import os
+import tempfile
+import time
+
+from amlfs_hsm_tools.utilities import MountTable, get_relative_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='get_relative_path cost on deep paths.')
+    parser.add_argument('--depth', type=int, default=32)
+    parser.add_argument('--files', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        directory = os.path.join(root, *('level{}'.format(level) for level in range(args.depth)))
+        os.makedirs(directory)
+        paths = [os.path.join(directory, 'file{}'.format(index)) for index in range(args.files)]
+
+        # An empty table forces the ismount walk, the other one resolves the synthetic mount point from memory
+        for name, mountTable in (('ismount walk', MountTable([])), ('mount table', MountTable([root]))):
+            start = time.perf_counter()
+            for path in paths:
+                get_relative_path(path, mountTable)
+            elapsed = time.perf_counter() - start
+            print('{:<14} {:>10.2f} us/file'.format(name, 1e6 * elapsed / args.files))
+
+
+if __name__ == '__main__':
+    main()
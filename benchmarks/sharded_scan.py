@@ -0,0 +1,85 @@
+'''
+Runs a sharded archive of a synthetic file tree as N local processes on the fake liblustreapi and
+in-memory blob backends, merges the shard reports and checks that every file was processed exactly once.
+Reports the shard balance, the aggregated throughput and the FID lookups per file of all the shards.
+
+    python benchmarks/sharded_scan.py --files 100000 --shards 4 --shard-by fid --workers 16
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+os.environ['AMLFS_HSM_LUSTREAPI'] = 'fake'
+
+from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM
+from amlfs_hsm_tools.lustreapi import lustre
+from amlfs_hsm_tools.memory_blob_client import MemoryBlobServiceClient
+from amlfs_hsm_tools.shard import Shard, merge_reports, write_report
+from amlfs_hsm_tools.utilities import MountTable, set_mount_table
+
+from offline_suite import attach_copytool, create_tree
+
+
+def run_shard(root, index, count, reportFile, byPath, workers):
+    set_mount_table(MountTable([root]))
+    backend = MemoryBlobServiceClient()
+    attach_copytool(backend)
+    engine = AzureManagedLustreHSM(os.path.join(root, 'configuration.json'), client=backend)
+    shard = Shard(index, count, byPath=byPath)
+
+    started = time.time()
+    files = list(shard.files((os.path.join(directory, name) for directory, _, names in os.walk(root)
+                              for name in names if name != 'configuration.json'), workers, engine.fidCache))
+    failed = engine.archiveFiles(files)
+    write_report(reportFile, 'archive', shard, {'files': len(files), 'errors': len(failed),
+                                                'path2fid': lustre.calls['llapi_path2fid']}, failed, started)
+    # Processed files are listed next to the report, to check the shards do not overlap
+    with open(reportFile + '.files', 'w') as fid:
+        fid.write('\n'.join(files))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sharded archive run as local processes.')
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--shard-by', default='fid', choices=['fid', 'path'])
+    parser.add_argument('--workers', type=int, default=1, help='parallel FID lookups of each shard')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        create_tree(root, args.files)
+        with open(os.path.join(root, 'configuration.json'), 'w') as fid:
+            json.dump({'accountURL': 'memory://', 'containerName': 'hsm'}, fid)
+
+        reportFiles = [os.path.join(root, 'shard{}.json'.format(index)) for index in range(args.shards)]
+        processes = [multiprocessing.Process(target=run_shard, args=(root, index, args.shards, reportFile, args.shard_by == 'path', args.workers))
+                     for index, reportFile in enumerate(reportFiles)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        reports, processed = [], []
+        for reportFile in reportFiles:
+            with open(reportFile) as fid:
+                reports.append(json.load(fid))
+            with open(reportFile + '.files') as fid:
+                processed.extend(fid.read().split())
+        merged = merge_reports(reports)
+
+    for report in reports:
+        print('shard {}/{}: {} files'.format(report['shard'][0], report['shard'][1], report['counters']['files']))
+    print('merged: {} files, {} errors, {} missing shards, {:.0f} files/s'.format(
+        merged['counters']['files'], merged['counters']['errors'], len(merged['missing_shards']), args.files / elapsed))
+    print('FID lookups: {:.2f} per file'.format(merged['counters']['path2fid'] / args.files))
+    overlap = len(processed) - len(set(processed))
+    print('coverage: {} of {} files, {} processed more than once'.format(len(set(processed)), args.files, overlap))
+
+
+if __name__ == '__main__':
+    main()
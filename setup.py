@@ -14,7 +14,8 @@ setup(name='amlfs_hsm_tools',
       author_email='',
       packages=['amlfs_hsm_tools'],
       provides=['amlfs_hsm_tools'],
-      install_requires=['azure-storage-blob', 'azure-identity'],
+      install_requires=['azure-storage-blob', 'azure-identity', 'requests'],
+      extras_require={'async': ['aiohttp'], 'inventory': ['pyarrow']},
       cmdclass={'build_py': build_py},
       entry_points={'console_scripts': ['amlfs_hsm_tools = amlfs_hsm_tools.main:main']},
       classifiers=[
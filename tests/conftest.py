@@ -0,0 +1,4 @@
+import os
+
+# The tests run on the in-process liblustreapi stand-in, without a Lustre client
+os.environ['AMLFS_HSM_LUSTREAPI'] = 'fake'
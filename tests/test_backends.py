@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from amlfs_hsm_tools import utilities
+from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM
+from amlfs_hsm_tools.lustre_hsm_constants import HUA_ARCHIVE
+from amlfs_hsm_tools.lustreapi import lustre
+from amlfs_hsm_tools.lustreapi_hsm import get_hsm_flags_and_archive_id
+from amlfs_hsm_tools.memory_blob_client import MemoryBlobProperties, MemoryBlobServiceClient
+from amlfs_hsm_tools.utilities import MountTable
+
+
+@pytest.fixture
+def lustreRoot(tmp_path, monkeypatch):
+    root = tmp_path / 'lustre'
+    for name in ('project/a', 'project/b', 'scratch/c'):
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text('data')
+    monkeypatch.setattr(utilities, '_mountTable', MountTable([str(root)]))
+    return root
+
+
+@pytest.fixture
+def clients():
+    return {1: MemoryBlobServiceClient('hsm'), 2: MemoryBlobServiceClient('hsm2')}
+
+
+@pytest.fixture
+def engine(tmp_path, lustreRoot, clients, monkeypatch):
+    configurationFile = tmp_path / 'configuration.json'
+    configurationFile.write_text(json.dumps({
+        'accountURL': 'memory://', 'containerName': 'hsm',
+        'backends': [{'archiveId': 2, 'containerName': 'hsm2', 'prefixes': ['project']}],
+    }))
+
+    # Copytool writing the blob of each archived file to the container of its archive ID
+    def copytool(action, filePath, archiveId):
+        if action == HUA_ARCHIVE:
+            client = clients[archiveId]
+            blobName = utilities.get_relative_path(filePath)
+            client.containers[client.containerName][blobName] = MemoryBlobProperties(blobName, 4, '0x1')
+
+    monkeypatch.setattr(lustre, 'copytool', copytool)
+    hsm = AzureManagedLustreHSM(str(configurationFile), client=clients[1], clients={2: clients[2]})
+    yield hsm
+    hsm.close()
+
+
+def test_files_are_archived_to_the_backend_of_their_prefix(engine, clients, lustreRoot):
+    paths = [str(lustreRoot / name) for name in ('project/a', 'project/b', 'scratch/c')]
+    assert engine.archiveFiles(paths) == []
+    assert [get_hsm_flags_and_archive_id(path)[1] for path in paths] == [2, 2, 1]
+    assert sorted(clients[2].containers['hsm2']) == ['project/a', 'project/b']
+    assert sorted(clients[1].containers['hsm']) == ['scratch/c']
+
+
+def test_archived_files_are_routed_by_archive_id(engine, lustreRoot):
+    path = str(lustreRoot / 'scratch/c')
+    assert engine.archiveFiles([path]) == []
+    # A prefix added later does not move the files already archived
+    engine.backends.get(2).prefixes.append('scratch/')
+    assert engine.getHSMBackend(path).archiveId == 1
+
+
+def test_check_reads_the_hsm_state_once(engine, clients, lustreRoot):
+    path = str(lustreRoot / 'project/a')
+    assert engine.archiveFiles([path]) == []
+    del clients[2].containers['hsm2']['project/a']
+
+    stateReads = lustre.calls['llapi_hsm_state_get']
+    assert not engine.check(path)
+    assert lustre.calls['llapi_hsm_state_get'] - stateReads == 1
+    assert engine.isFileLost(path) and engine.isFileDirty(path)
+    # The file is marked in its own archive
+    assert get_hsm_flags_and_archive_id(path)[1] == 2
+
+
+def test_bulk_check_looks_up_each_backend(engine, clients, lustreRoot):
+    paths = [str(lustreRoot / name) for name in ('project/a', 'project/b', 'scratch/c')]
+    assert engine.archiveFiles(paths) == []
+    del clients[1].containers['hsm']['scratch/c']
+    assert engine.checkFiles(paths) == [paths[2]]
+    # One existence check per file, in the container of its backend
+    assert (clients[1].rpcs(), clients[2].rpcs()) == (1, 2)
@@ -0,0 +1,37 @@
+import json
+
+from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM
+from amlfs_hsm_tools.memory_blob_client import LIST_PAGE_SIZE, MemoryBlobProperties, MemoryBlobServiceClient
+
+
+def engine(tmp_path, client):
+    configurationFile = tmp_path / 'configuration.json'
+    configurationFile.write_text(json.dumps({'accountURL': 'memory://', 'containerName': 'hsm'}))
+    return AzureManagedLustreHSM(str(configurationFile), client=client)
+
+
+def test_throttled_listing_pages_are_requested_again(tmp_path):
+    client = MemoryBlobServiceClient()
+    names = ['dir/file{:05d}'.format(index) for index in range(LIST_PAGE_SIZE + 10)]
+    for name in names:
+        client.containers['hsm'][name] = MemoryBlobProperties(name, 1, '0x1')
+    client.throttled['list_blobs_page'] = 2
+
+    hsm = engine(tmp_path, client)
+    blobIndex = hsm.loadBlobIndex()[hsm.backends.default.archiveId]
+    assert len(blobIndex) == len(names)
+    assert all(name in blobIndex for name in names)
+    # Two pages and the two throttled requests
+    assert client.calls['list_blobs_page'] == 4
+    hsm.close()
+
+
+def test_listing_records_keep_the_blob_properties(tmp_path):
+    client = MemoryBlobServiceClient()
+    client.containers['hsm']['file'] = MemoryBlobProperties('file', 4, '0x1', {'modtime': '100'})
+
+    hsm = engine(tmp_path, client)
+    blobIndex = hsm.loadBlobIndex(records=True)[hsm.backends.default.archiveId]
+    record = blobIndex.record('file')
+    assert (record.size, record.mtime) == (4, 100.0)
+    hsm.close()
@@ -0,0 +1,95 @@
+import errno
+import json
+
+import pytest
+
+from amlfs_hsm_tools.lustreapi_changelog import ChangelogRecord, ChangelogTracker, CL_CLOSE, CL_CREATE, CL_HSM, CL_UNLINK, \
+                                                CLF_UNLINK_LAST
+
+FID_A = '[0x200000401:0x1:0x0]'
+FID_B = '[0x200000401:0x2:0x0]'
+FID_C = '[0x200000401:0x3:0x0]'
+
+
+def resolver(paths):
+    def resolve(mountPoint, fid):
+        if fid not in paths:
+            raise IOError(errno.ENOENT, 'No such file or directory')
+        return paths[fid]
+    return resolve
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    return ChangelogTracker('lustrefs-MDT0000', 'cl1', str(tmp_path / 'state.json'))
+
+
+def test_collect_keeps_changed_and_drops_unlinked_fids(tracker):
+    changes = tracker.collect([
+        ChangelogRecord(10, CL_CREATE, FID_A),
+        ChangelogRecord(11, CL_CLOSE, FID_B),
+        ChangelogRecord(12, CL_HSM, FID_C),
+        ChangelogRecord(13, CL_UNLINK, FID_C, CLF_UNLINK_LAST),
+        # An unlink of one of several hard links keeps the file
+        ChangelogRecord(14, CL_UNLINK, FID_B),
+    ])
+    assert changes.changed == {FID_A, FID_B}
+    assert changes.unlinked == {FID_C}
+    assert changes.endRecord == 14
+
+
+def test_paths_skip_fids_which_cannot_be_resolved(tracker):
+    changes = tracker.collect([ChangelogRecord(1, CL_CREATE, FID_A), ChangelogRecord(2, CL_CREATE, FID_B)])
+    paths = list(changes.paths('/lustre', resolver({FID_A: 'project/a'})))
+    assert paths == ['/lustre/project/a']
+    assert changes.fids == {'/lustre/project/a': FID_A}
+
+
+def test_commit_stores_the_last_record(tracker):
+    changes = tracker.collect([ChangelogRecord(5, CL_CREATE, FID_A), ChangelogRecord(6, CL_CLOSE, FID_A)])
+    list(changes.paths('/lustre', resolver({FID_A: 'a'})))
+    tracker.commit(changes, clear=False)
+    assert tracker.lastRecord() == 6
+    assert tracker.pendingFids() == []
+
+
+def test_failed_files_are_collected_again_by_the_next_run(tracker):
+    changes = tracker.collect([ChangelogRecord(1, CL_CREATE, FID_A), ChangelogRecord(2, CL_CREATE, FID_B)])
+    list(changes.paths('/lustre', resolver({FID_A: 'a', FID_B: 'b'})))
+    tracker.commit(changes, clear=False, failed=['/lustre/b'])
+    assert tracker.lastRecord() == 2
+    assert tracker.pendingFids() == [FID_B]
+
+    changes = tracker.collect([ChangelogRecord(3, CL_CREATE, FID_C)])
+    assert changes.changed == {FID_B, FID_C}
+    list(changes.paths('/lustre', resolver({FID_B: 'b', FID_C: 'c'})))
+    tracker.commit(changes, clear=False)
+    assert tracker.lastRecord() == 3
+    assert tracker.pendingFids() == []
+
+
+def test_pending_fids_unlinked_meanwhile_are_dropped(tracker):
+    changes = tracker.collect([ChangelogRecord(1, CL_CREATE, FID_A)])
+    list(changes.paths('/lustre', resolver({FID_A: 'a'})))
+    tracker.commit(changes, clear=False, failed=['/lustre/a'])
+
+    changes = tracker.collect([ChangelogRecord(2, CL_UNLINK, FID_A, CLF_UNLINK_LAST)])
+    assert changes.changed == set()
+    tracker.commit(changes, clear=False)
+    assert tracker.pendingFids() == []
+
+
+def test_failed_clear_does_not_advance_the_record(tracker):
+    changes = tracker.collect([ChangelogRecord(7, CL_CREATE, FID_A)])
+    # The fake liblustreapi has no changelog, llapi_changelog_clear fails with ENOSYS
+    with pytest.raises(IOError) as error:
+        tracker.commit(changes)
+    assert error.value.errno == errno.ENOSYS
+    assert tracker.lastRecord() == 0
+
+
+def test_state_files_with_the_last_record_only_are_read(tracker):
+    with open(tracker.stateFile, 'w') as fid:
+        json.dump({'lustrefs-MDT0000': 42}, fid)
+    assert tracker.lastRecord() == 42
+    assert tracker.pendingFids() == []
@@ -0,0 +1,67 @@
+import errno
+
+import pytest
+
+from amlfs_hsm_tools.hsm_completion import CompletionTracker
+from amlfs_hsm_tools.lustre_hsm_constants import HSM_STATE_FLAGS, HSM_ARCHIVED_STATE, HSM_EXISTS_STATE, HUA_ARCHIVE, \
+                                                HUA_NONE, HPS_NONE, HPS_RUNNING, HPS_DONE
+from amlfs_hsm_tools.lustreapi import lustre
+from amlfs_hsm_tools.lustreapi_hsm import set_hsm_state
+
+
+ARCHIVED = HSM_STATE_FLAGS[HSM_EXISTS_STATE] | HSM_STATE_FLAGS[HSM_ARCHIVED_STATE]
+
+
+def stubTracker(flags, actions):
+    def getProgress(filePath):
+        value = flags[filePath]
+        if isinstance(value, Exception):
+            raise value
+        return (value,) + actions.get(filePath, (HPS_NONE, HUA_NONE))
+
+    return CompletionTracker(minInterval=0, maxInterval=0, getProgress=getProgress)
+
+
+def test_completed_files_are_not_counted():
+    tracker = stubTracker({'/lustre/a': ARCHIVED}, {'/lustre/a': (HPS_DONE, HUA_ARCHIVE)})
+    future = tracker.watchAction('/lustre/a', HUA_ARCHIVE)
+    assert tracker.wait() == 0
+    assert future.result() == '/lustre/a'
+
+
+def test_files_whose_check_fails_are_counted():
+    tracker = stubTracker({'/lustre/a': ARCHIVED, '/lustre/b': IOError(errno.EIO, 'Input/output error')}, {})
+    futures = [tracker.watchAction(filePath, HUA_ARCHIVE) for filePath in ('/lustre/a', '/lustre/b')]
+    assert tracker.wait() == 1
+    assert futures[0].result() == '/lustre/a'
+    with pytest.raises(IOError):
+        futures[1].result()
+
+
+def test_files_with_no_action_running_and_the_target_not_reached_are_counted():
+    tracker = stubTracker({'/lustre/a': HSM_STATE_FLAGS[HSM_EXISTS_STATE]}, {})
+    future = tracker.watchAction('/lustre/a', HUA_ARCHIVE)
+    assert tracker.wait(timeout=5) == 1
+    with pytest.raises(RuntimeError):
+        future.result()
+
+
+def test_files_still_running_at_the_timeout_are_counted():
+    tracker = stubTracker({'/lustre/a': 0}, {'/lustre/a': (HPS_RUNNING, HUA_ARCHIVE)})
+    future = tracker.watchAction('/lustre/a', HUA_ARCHIVE)
+    assert tracker.wait(timeout=0.05) == 1
+    with pytest.raises(TimeoutError):
+        future.result()
+
+
+def test_each_check_reads_the_state_once(tmp_path):
+    filePath = tmp_path / 'a'
+    filePath.write_bytes(b'data')
+    set_hsm_state(str(filePath), [HSM_EXISTS_STATE, HSM_ARCHIVED_STATE], [], 1)
+    before = dict(lustre.calls)
+    tracker = CompletionTracker(minInterval=0, maxInterval=0)
+    future = tracker.watchAction(str(filePath), HUA_ARCHIVE)
+    assert tracker.wait() == 0
+    assert future.result() == str(filePath)
+    assert lustre.calls['llapi_hsm_state_get'] - before.get('llapi_hsm_state_get', 0) == 1
+    assert lustre.calls['llapi_hsm_current_action'] == before.get('llapi_hsm_current_action', 0)
@@ -0,0 +1,54 @@
+import json
+import threading
+
+import pytest
+
+from amlfs_hsm_tools import utilities
+from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM
+from amlfs_hsm_tools.daemon import HSMDaemon, forward
+from amlfs_hsm_tools.lustre_hsm_constants import HUA_ARCHIVE
+from amlfs_hsm_tools.lustreapi import lustre
+from amlfs_hsm_tools.memory_blob_client import MemoryBlobProperties, MemoryBlobServiceClient
+from amlfs_hsm_tools.utilities import MountTable
+
+
+@pytest.fixture
+def hsm(tmp_path, monkeypatch):
+    root = tmp_path / 'lustre'
+    root.mkdir()
+    monkeypatch.setattr(utilities, '_mountTable', MountTable([str(root)]))
+    client = MemoryBlobServiceClient()
+
+    def copytool(action, filePath, archiveId):
+        if action == HUA_ARCHIVE:
+            blobName = utilities.get_relative_path(filePath)
+            client.containers['hsm'][blobName] = MemoryBlobProperties(blobName, 4, '0x1')
+
+    monkeypatch.setattr(lustre, 'copytool', copytool)
+    configurationFile = tmp_path / 'configuration.json'
+    configurationFile.write_text(json.dumps({'accountURL': 'memory://', 'containerName': 'hsm'}))
+    hsm = AzureManagedLustreHSM(str(configurationFile), client=client, stateCacheTTL=0)
+    yield hsm
+    hsm.close()
+
+
+@pytest.fixture
+def daemon(tmp_path, hsm):
+    daemon = HSMDaemon(hsm, str(tmp_path / 'daemon.sock'))
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    yield daemon
+    daemon.shutdown()
+    daemon.server_close()
+    thread.join()
+
+
+def test_single_file_actions_returning_false_are_reported_failed(tmp_path, hsm, daemon):
+    archived, notArchived = tmp_path / 'lustre' / 'archived', tmp_path / 'lustre' / 'not-archived'
+    for filePath in (archived, notArchived):
+        filePath.write_text('data')
+    assert hsm.archiveFiles([str(archived)]) == []
+    # remove has no batched form, so the daemon runs it file by file
+    failed = forward('remove', [str(archived), str(notArchived)], socketPath=daemon.socketPath)
+    assert failed == [str(notArchived)]
+    assert hsm.isFileLost(str(archived))
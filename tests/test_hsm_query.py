@@ -0,0 +1,24 @@
+import errno
+
+from amlfs_hsm_tools.hsm_query import HSMQueryEngine
+from amlfs_hsm_tools.lustre_hsm_constants import HSM_ARCHIVED_STATE, HSM_EXISTS_STATE, HSM_STATE_FLAGS
+from amlfs_hsm_tools.lustreapi import format_fid, lustre, path2fid
+from amlfs_hsm_tools.lustreapi_hsm import set_hsm_state
+
+
+def test_files_are_queried_in_order_with_one_open_each(tmp_path):
+    paths = []
+    for index in range(50):
+        (tmp_path / 'file{:02}'.format(index)).write_bytes(b'x' * index)
+        paths.append(str(tmp_path / 'file{:02}'.format(index)))
+    set_hsm_state(paths[7], [HSM_EXISTS_STATE, HSM_ARCHIVED_STATE], [], 1)
+    (tmp_path / 'file13').unlink()
+
+    before = lustre.calls['llapi_hsm_state_get_fd']
+    results = list(HSMQueryEngine(workers=4, withStat=True, chunkSize=3).queryMany(paths))
+    assert [result.path for result in results] == paths
+    assert results[7].flags == HSM_STATE_FLAGS[HSM_EXISTS_STATE] | HSM_STATE_FLAGS[HSM_ARCHIVED_STATE]
+    assert format_fid(results[8].fid) == format_fid(path2fid(paths[8]))
+    assert results[8].stat.st_size == 8
+    assert results[13].error.errno == errno.ENOENT and results[13].fid is None
+    assert lustre.calls['llapi_hsm_state_get_fd'] - before == len(paths) - 1
@@ -0,0 +1,23 @@
+import errno
+
+from amlfs_hsm_tools.lustre_hsm_constants import HSM_ARCHIVED_STATE, HSM_STATE_FLAGS, HUA_ARCHIVE
+from amlfs_hsm_tools.lustreapi import lustre, path2fid
+from amlfs_hsm_tools.lustreapi_hsm import get_hsm_flags, hsm_request_fids
+
+
+def test_rejected_batches_are_split_down_to_the_unlinked_file(tmp_path):
+    paths = []
+    for index in range(8):
+        (tmp_path / 'file{}'.format(index)).write_text('data')
+        paths.append(str(tmp_path / 'file{}'.format(index)))
+    items = [(filePath, path2fid(filePath)) for filePath in paths]
+    # The file is unlinked after its FID was looked up, so the coordinator rejects any request holding it
+    (tmp_path / 'file5').unlink()
+
+    before = lustre.calls['llapi_hsm_request']
+    failures = hsm_request_fids(items, HUA_ARCHIVE, batchSize=8)
+    assert list(failures) == [paths[5]]
+    assert failures[paths[5]].errno == errno.ENOENT
+    assert all(get_hsm_flags(filePath) & HSM_STATE_FLAGS[HSM_ARCHIVED_STATE] for filePath in paths if filePath != paths[5])
+    # 8 -> 4 + 4 -> 2 + 2 -> 1 + 1: one request per halving level on the side of the unlinked file
+    assert lustre.calls['llapi_hsm_request'] - before == 7
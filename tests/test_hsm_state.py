@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from amlfs_hsm_tools import utilities
+from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM
+from amlfs_hsm_tools.lustre_hsm_constants import HUA_ARCHIVE, HUA_REMOVE
+from amlfs_hsm_tools.lustreapi import lustre
+from amlfs_hsm_tools.memory_blob_client import MemoryBlobProperties, MemoryBlobServiceClient
+from amlfs_hsm_tools.utilities import MountTable
+
+
+@pytest.fixture
+def client():
+    return MemoryBlobServiceClient()
+
+
+@pytest.fixture
+def paths(tmp_path, client, monkeypatch):
+    root = tmp_path / 'lustre'
+    root.mkdir()
+    monkeypatch.setattr(utilities, '_mountTable', MountTable([str(root)]))
+    container = client.containers['hsm']
+
+    def copytool(action, filePath, archiveId):
+        blobName = utilities.get_relative_path(filePath)
+        if action == HUA_ARCHIVE:
+            container[blobName] = MemoryBlobProperties(blobName, 4, '0x1')
+        elif action == HUA_REMOVE:
+            container.pop(blobName, None)
+
+    monkeypatch.setattr(lustre, 'copytool', copytool)
+    paths = []
+    for index in range(4):
+        (root / 'file{}'.format(index)).write_text('data')
+        paths.append(str(root / 'file{}'.format(index)))
+    return paths
+
+
+def engine(tmp_path, client, stateCacheTTL=0):
+    configurationFile = tmp_path / 'configuration.json'
+    configurationFile.write_text(json.dumps({'accountURL': 'memory://', 'containerName': 'hsm'}))
+    return AzureManagedLustreHSM(str(configurationFile), client=client, stateCacheTTL=stateCacheTTL)
+
+
+def lustreCalls():
+    return dict(lustre.calls)
+
+
+def callsSince(before):
+    return {name: count - before.get(name, 0) for name, count in lustre.calls.items() if count != before.get(name, 0)}
+
+
+def test_release_reads_the_state_once_per_file(tmp_path, client, paths):
+    hsm = engine(tmp_path, client)
+    assert hsm.archiveFiles(paths) == []
+    before = lustreCalls()
+    assert hsm.releaseFiles(paths) == []
+    assert callsSince(before)['llapi_hsm_state_get'] == len(paths)
+    assert all(hsm.isFileReleased(path) for path in paths)
+    hsm.close()
+
+
+def test_remove_reads_the_state_once_and_marks_it_in_one_call(tmp_path, client, paths):
+    hsm = engine(tmp_path, client)
+    assert hsm.archiveFiles(paths[:1]) == []
+    before = lustreCalls()
+    hsm.remove(paths[0])
+    calls = callsSince(before)
+    assert (calls['llapi_hsm_state_get'], calls['llapi_hsm_state_set'], calls['llapi_hsm_request']) == (1, 1, 1)
+    assert hsm.isFileDirty(paths[0]) and hsm.isFileLost(paths[0])
+    assert 'file0' not in client.containers['hsm']
+    hsm.close()
+
+
+def test_state_cache_reuses_the_state_of_the_same_fid(tmp_path, client, paths):
+    hsm = engine(tmp_path, client, stateCacheTTL=60)
+    before = lustreCalls()
+    flags = [hsm.getHSMFlags(paths[0]) for _ in range(3)]
+    assert len(set(flags)) == 1
+    assert callsSince(before)['llapi_hsm_state_get'] == 1
+    # HSM requests invalidate the cached state
+    assert hsm.archiveFiles(paths[:1]) == []
+    assert hsm.isFileArchived(paths[0])
+    hsm.close()
+
+
+def test_verify_marks_the_files_not_matching_their_blob_dirty_and_lost(tmp_path, client, paths):
+    hsm = engine(tmp_path, client)
+    hsm.verifySample = 1.0
+    assert hsm.archiveFiles(paths) == []
+    container = client.containers['hsm']
+    container['file1'].size = 5
+    del container['file2']
+    container['file3'] = MemoryBlobProperties('file3', 4, '0x1', contentMD5=b'\0' * 16)
+    assert hsm.verifyFiles(paths) == paths[1:]
+    assert not hsm.isFileDirty(paths[0])
+    assert all(hsm.isFileDirty(path) and hsm.isFileLost(path) for path in paths[1:])
+    hsm.close()
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+
+def test_the_command_line_does_not_load_liblustreapi():
+    # Without the fake, loading liblustreapi fails on hosts without Lustre
+    env = {name: value for name, value in os.environ.items() if name != 'AMLFS_HSM_LUSTREAPI'}
+    statement = 'import sys, amlfs_hsm_tools.main; sys.exit("amlfs_hsm_tools.lustreapi" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', statement], env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+ARCHIVE_WITHOUT_SDK = '''
+import json, os, sys, tempfile
+from amlfs_hsm_tools import utilities
+from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM
+root = tempfile.mkdtemp()
+utilities.set_mount_table(utilities.MountTable([root]))
+configurationFile = os.path.join(root, 'configuration.json')
+with open(configurationFile, 'w') as fid:
+    json.dump({'accountURL': 'https://account.blob.core.windows.net', 'containerName': 'hsm'}, fid)
+hsm = AzureManagedLustreHSM(configurationFile)
+assert hsm.archiveFiles([configurationFile]) == []
+sys.exit(any(name == 'azure' or name.startswith('azure.') for name in sys.modules))
+'''
+
+
+def test_archive_does_not_load_the_azure_sdk():
+    result = subprocess.run([sys.executable, '-c', ARCHIVE_WITHOUT_SDK], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,83 @@
+import csv
+import datetime
+import json
+import os
+import time
+
+import pytest
+
+from amlfs_hsm_tools import utilities
+from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM
+from amlfs_hsm_tools.inventory import BlobInventory, INVENTORY_FIELDS, parse_time
+from amlfs_hsm_tools.memory_blob_client import MemoryBlobProperties, MemoryBlobServiceClient
+from amlfs_hsm_tools.utilities import MountTable
+
+LAST_MODIFIED = ('2026-09-30T10:00:00Z', '2026-09-30T12:00:00Z')
+
+
+def isoformat(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat()
+
+
+def write_report(directory, names, reportTime=None):
+    # The manifest of a run is written with its start and completion times if reportTime is given
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'hsm-rule.csv'), 'w', newline='') as fid:
+        writer = csv.DictWriter(fid, INVENTORY_FIELDS)
+        writer.writeheader()
+        for name, lastModified in zip(names, LAST_MODIFIED):
+            writer.writerow({'Name': 'hsm/' + name, 'Content-Length': 4, 'Last-Modified': lastModified, 'Etag': '0x1', 'Content-MD5': ''})
+    if reportTime is not None:
+        with open(os.path.join(directory, 'hsm-rule-manifest.json'), 'w') as fid:
+            json.dump({'inventoryCompletionTime': isoformat(reportTime + 3600), 'inventoryStartTime': isoformat(reportTime)}, fid)
+    return str(directory)
+
+
+def configuration(root):
+    configurationFile = os.path.join(root, 'configuration.json')
+    with open(configurationFile, 'w') as fid:
+        json.dump({'accountURL': 'memory://', 'containerName': 'hsm'}, fid)
+    return configurationFile
+
+
+@pytest.fixture
+def lustre(tmp_path, monkeypatch):
+    root = tmp_path / 'lustre'
+    root.mkdir()
+    monkeypatch.setattr(utilities, '_mountTable', MountTable([str(root)]))
+    return root
+
+
+def test_report_time_is_the_manifest_start_time(tmp_path):
+    reportTime = parse_time('2026-10-01T00:00:00Z')
+    inventory = BlobInventory(write_report(tmp_path / 'report', ['a', 'b'], reportTime), 'hsm')
+    assert inventory.reportTime == reportTime
+    assert [blob.name for blob in inventory.blobs()] == ['a', 'b']
+
+
+def test_report_time_falls_back_to_the_last_modification(tmp_path):
+    engine = AzureManagedLustreHSM(configuration(tmp_path), client=MemoryBlobServiceClient())
+    index = engine.loadBlobInventory(write_report(tmp_path / 'report', ['a', 'b']))
+    assert index.asOf == parse_time(LAST_MODIFIED[-1])
+    engine.close()
+
+
+def test_changed_and_missing_files_are_looked_up_live(tmp_path, lustre):
+    backend = MemoryBlobServiceClient()
+    for name in ('unchanged', 'changed', 'missing'):
+        (lustre / name).write_text('data')
+        backend.containers['hsm'][name] = MemoryBlobProperties(name, 4, '0x1')
+    # The change time of the files cannot be set, the report is as of after their creation
+    reportTime = time.time() + 60
+    # Modified after the report, its blob may have been rewritten or removed since
+    os.utime(lustre / 'changed', (reportTime + 3600, reportTime + 3600))
+
+    engine = AzureManagedLustreHSM(configuration(tmp_path), client=backend)
+    engine.loadBlobInventory(write_report(tmp_path / 'report', ['unchanged', 'changed'], reportTime))
+    lookups = {}
+    for name in ('unchanged', 'changed', 'missing'):
+        requests = backend.rpcs()
+        assert engine.isFileOnHSM(str(lustre / name))
+        lookups[name] = backend.rpcs() - requests
+    assert lookups == {'unchanged': 0, 'changed': 1, 'missing': 1}
+    engine.close()
@@ -0,0 +1,42 @@
+import os
+
+from amlfs_hsm_tools.journal import ScanJournal
+
+
+def test_a_reopened_journal_resumes_after_the_processed_files(tmp_path):
+    paths = [str(tmp_path / 'file{}'.format(index)) for index in range(3)]
+    for filePath in paths:
+        open(filePath, 'w').write('data')
+    journal = ScanJournal(str(tmp_path / 'journal.db'), batchSize=2)
+    for filePath in paths[:2]:
+        journal.recordProcessed(filePath, 'archive')
+    journal.close()
+
+    journal = ScanJournal(str(tmp_path / 'journal.db'))
+    assert list(journal.filter(paths, 'archive', resume=True)) == paths[2:]
+    assert list(journal.filter(paths, 'release', resume=True)) == paths
+    journal.close()
+
+
+def test_unknown_fields_are_left_untouched(tmp_path):
+    journal = ScanJournal(str(tmp_path / 'journal.db'))
+    journal.record('/lustre/a', fid='[0x200000401:0x1:0x0]', blob_present=1)
+    journal.record('/lustre/a', action='check')
+    journal.flush()
+    record = journal.get('/lustre/a')
+    assert (record['fid'], record['blob_present'], record['action']) == ('[0x200000401:0x1:0x0]', 1, 'check')
+    journal.close()
+
+
+def test_incremental_skips_only_unchanged_files_found_on_the_backend(tmp_path):
+    unchanged, modified, missing = (str(tmp_path / name) for name in ('unchanged', 'modified', 'missing'))
+    journal = ScanJournal(str(tmp_path / 'journal.db'))
+    for filePath in (unchanged, modified, missing):
+        open(filePath, 'w').write('data')
+        journal.recordProcessed(filePath, 'check')
+    journal.record(missing, blob_present=0)
+    open(modified, 'a').write('more data')
+    os.utime(modified, (0, 0))
+    journal.flush()
+    assert list(journal.filter([unchanged, modified, missing], 'check', incremental=True)) == [modified, missing]
+    journal.close()
@@ -0,0 +1,24 @@
+import argparse
+import io
+import sys
+
+import pytest
+
+from amlfs_hsm_tools import main
+
+
+@pytest.mark.parametrize('arguments', [[], ['--target', '0'], ['--target', 'lots']])
+def test_release_policy_requires_a_positive_target(tmp_path, monkeypatch, capsys, arguments):
+    monkeypatch.setattr(sys, 'argv', ['amlfs_hsm_tools', 'release-policy', '--dry-run', str(tmp_path)] + arguments)
+    with pytest.raises(SystemExit) as exit:
+        main.main()
+    assert exit.value.code == 2
+    assert '--target' in capsys.readouterr().err
+
+
+def test_input_paths_chain_the_arguments_the_list_file_and_stdin(tmp_path, monkeypatch):
+    listFile = tmp_path / 'files.lst'
+    listFile.write_bytes(b'/lustre/b\0/lustre/c\0')
+    monkeypatch.setattr(sys, 'stdin', io.TextIOWrapper(io.BytesIO(b'/lustre/d\0')))
+    args = argparse.Namespace(filenames=['/lustre/a'], from_file=str(listFile), stdin=True, null=True)
+    assert list(main.input_paths(args)) == ['/lustre/a', '/lustre/b', '/lustre/c', '/lustre/d']
@@ -0,0 +1,13 @@
+import io
+
+from amlfs_hsm_tools.pipeline import read_paths
+
+
+def test_paths_split_across_chunks_are_read_whole():
+    stream = io.BytesIO(b'/lustre/a\n/lustre/bb\n\n/lustre/ccc')
+    assert list(read_paths(stream, chunkSize=4)) == ['/lustre/a', '/lustre/bb', '/lustre/ccc']
+
+
+def test_nul_delimited_paths_may_hold_newlines():
+    stream = io.BytesIO(b'/lustre/a\nb\0/lustre/\xff\0')
+    assert list(read_paths(stream, nul=True, chunkSize=3)) == ['/lustre/a\nb', '/lustre/\udcff']
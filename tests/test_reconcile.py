@@ -0,0 +1,44 @@
+import pytest
+
+from amlfs_hsm_tools import reconcile
+from amlfs_hsm_tools.backends import HSMBackend
+from amlfs_hsm_tools.memory_blob_client import MemoryBlobProperties, MemoryBlobServiceClient
+from amlfs_hsm_tools.reconcile import OrphanReconciler
+from amlfs_hsm_tools.utilities import MountTable
+
+
+@pytest.fixture
+def lustre(tmp_path, monkeypatch):
+    (tmp_path / 'kept').write_text('data')
+    monkeypatch.setattr(reconcile, 'get_mount_table', lambda: MountTable([str(tmp_path)]))
+    return tmp_path
+
+
+def reconciler(mountPoint, blobNames, throttledPages=0):
+    client = MemoryBlobServiceClient()
+    for name in blobNames:
+        client.containers['hsm'][name] = MemoryBlobProperties(name, 1, '0x1')
+    client.throttled['list_blobs_page'] = throttledPages
+    backend = HSMBackend(1, {'accountURL': 'memory://', 'containerName': 'hsm'}, client)
+    return OrphanReconciler(None, str(mountPoint), workers=2, backend=backend)
+
+
+def test_only_missing_files_are_orphans(lustre):
+    # A path under a regular file fails with ENOTDIR and cannot be told missing
+    orphans = reconciler(lustre, ['kept', 'deleted', 'kept/child']).orphans()
+    assert [blob.name for blob in orphans] == ['deleted']
+
+
+def test_unmounted_file_systems_are_not_reconciled(lustre):
+    with pytest.raises(ValueError):
+        reconciler(lustre / 'kept', ['deleted']).run(dryRun=True)
+    with pytest.raises(ValueError):
+        reconciler(lustre.parent, ['deleted']).run(dryRun=True)
+
+
+def test_dry_run_reports_the_orphans(lustre):
+    assert reconciler(lustre, ['kept', 'deleted']).run(dryRun=True) == (1, 1, 0)
+
+
+def test_throttled_listing_pages_are_retried(lustre):
+    assert reconciler(lustre, ['kept', 'deleted'], throttledPages=2).run(dryRun=True) == (1, 1, 0)
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from amlfs_hsm_tools import utilities
+from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM
+from amlfs_hsm_tools.hsm_state_cache import FIDCache
+from amlfs_hsm_tools.lustreapi import lustre, format_fid, path2fid
+from amlfs_hsm_tools.memory_blob_client import MemoryBlobServiceClient
+from amlfs_hsm_tools.shard import Shard
+from amlfs_hsm_tools.utilities import MountTable
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.setattr(utilities, '_mountTable', MountTable([str(tmp_path)]))
+    paths = []
+    for index in range(64):
+        path = tmp_path / 'dir{}'.format(index % 4) / 'file{}'.format(index)
+        path.parent.mkdir(exist_ok=True)
+        path.write_text('data')
+        paths.append(str(path))
+    return paths
+
+
+@pytest.mark.parametrize('byPath', [False, True])
+def test_shards_cover_every_file_once(files, byPath):
+    owned = [list(Shard(index, 4, byPath=byPath).files(files, workers=4)) for index in range(4)]
+    assert sorted(path for shardFiles in owned for path in shardFiles) == sorted(files)
+    # The input order is kept
+    assert all(shardFiles == [path for path in files if path in shardFiles] for shardFiles in owned)
+
+
+def test_fids_of_the_kept_files_are_handed_over(files):
+    fidCache = FIDCache()
+    kept = list(Shard(1, 4).files(files, workers=4, fidCache=fidCache))
+    assert len(fidCache) == len(kept)
+    for path in kept:
+        assert format_fid(fidCache.pop(os.path.abspath(path))) == format_fid(path2fid(path))
+    assert len(fidCache) == 0
+
+
+def test_path_assignment_does_not_look_fids_up(files):
+    lookups = lustre.calls['llapi_path2fid']
+    kept = list(Shard(0, 4, byPath=True).files(files, fidCache=FIDCache()))
+    assert kept and lustre.calls['llapi_path2fid'] == lookups
+    # Files and their blobs are assigned to the same shard
+    assert all(Shard(0, 4).ownsBlob(utilities.get_relative_path(path)) for path in kept)
+
+
+def test_archive_reuses_the_fids_of_the_shard(files, tmp_path):
+    configurationFile = tmp_path / 'configuration.json'
+    configurationFile.write_text('{"accountURL": "memory://", "containerName": "hsm"}')
+    engine = AzureManagedLustreHSM(str(configurationFile), client=MemoryBlobServiceClient())
+    lookups = lustre.calls['llapi_path2fid']
+    kept = list(Shard(2, 4).files(files, fidCache=engine.fidCache))
+    assert engine.archiveFiles(kept) == []
+    assert lustre.calls['llapi_path2fid'] - lookups == len(files)
+    engine.close()
@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+from amlfs_hsm_tools.space_report import SpaceReport
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_hard_links_are_accounted_once(tmp_path, processes):
+    root = tmp_path / 'lustre'
+    (root / 'a').mkdir(parents=True)
+    (root / 'b').mkdir()
+    (root / 'a' / 'data').write_bytes(b'x' * 100)
+    os.link(root / 'a' / 'data', root / 'a' / 'data.link')
+    os.link(root / 'a' / 'data', root / 'b' / 'data.link')
+    (root / 'b' / 'other').write_bytes(b'x' * 10)
+
+    rows = {row['path']: row for row in SpaceReport([str(root)], processes=processes).run().rows()}
+    assert (rows[str(root)]['files'], rows[str(root)]['bytes']) == (2, 110)
+    assert rows[str(root)]['unarchived_bytes'] == 110
+    # Each linked inode is accounted in a single directory
+    assert rows[str(root / 'a')]['bytes'] + rows[str(root / 'b')]['bytes'] == 110
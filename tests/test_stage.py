@@ -0,0 +1,42 @@
+import json
+import os
+
+from amlfs_hsm_tools import utilities
+from amlfs_hsm_tools.amlfs_hsm import AzureManagedLustreHSM
+from amlfs_hsm_tools.lustre_hsm_constants import HSM_ARCHIVED_STATE, HSM_EXISTS_STATE, HSM_RELEASED_STATE
+from amlfs_hsm_tools.lustreapi import lustre
+from amlfs_hsm_tools.lustreapi_hsm import set_hsm_state
+from amlfs_hsm_tools.memory_blob_client import MemoryBlobServiceClient
+from amlfs_hsm_tools.stage import Stager, ORDER_SIZE
+from amlfs_hsm_tools.utilities import MountTable
+
+
+def test_released_files_are_restored_once_per_fid_largest_first(tmp_path, monkeypatch):
+    root = tmp_path / 'lustre'
+    root.mkdir()
+    monkeypatch.setattr(utilities, '_mountTable', MountTable([str(root)]))
+    configurationFile = tmp_path / 'configuration.json'
+    configurationFile.write_text(json.dumps({'accountURL': 'memory://', 'containerName': 'hsm'}))
+    hsm = AzureManagedLustreHSM(str(configurationFile), client=MemoryBlobServiceClient(), stateCacheTTL=0)
+
+    sizes = {'small': 10, 'large': 100, 'resident': 1000}
+    for name, size in sizes.items():
+        (root / name).write_bytes(b'x' * size)
+        released = [HSM_RELEASED_STATE] if name != 'resident' else []
+        set_hsm_state(str(root / name), [HSM_EXISTS_STATE, HSM_ARCHIVED_STATE] + released, [], 1)
+    os.link(root / 'large', root / 'large.link')
+    manifest = [str(root / name) for name in ('small', 'large', 'large.link', 'resident', 'missing')]
+
+    stager = Stager(hsm, ORDER_SIZE)
+    selected, unreadable = stager.select(manifest)
+    assert [absolutePath for _, absolutePath, _ in selected] == [str(root / 'large'), str(root / 'small')]
+    assert unreadable == [str(root / 'missing')]
+
+    before = lustre.calls['llapi_hsm_request']
+    progress = []
+    files, restoredBytes, failed = stager.run(manifest, timeout=10, progress=lambda *counters: progress.append(counters))
+    assert (files, restoredBytes, failed) == (2, 110, [str(root / 'missing')])
+    assert lustre.calls['llapi_hsm_request'] - before == 1
+    assert progress[-1] == (2, 2, 110, 110)
+    assert not any(hsm.isFileReleased(str(root / name)) for name in sizes)
+    hsm.close()
@@ -0,0 +1,28 @@
+from amlfs_hsm_tools.utilities import MountTable, get_absolute_path, get_relative_path
+
+
+MOUNTINFO = '''22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw
+35 22 0:33 / /lustre rw,relatime shared:20 - lustre 10.0.0.4@tcp:/lustrefs rw,flock,lazystatfs
+36 35 0:34 / /lustre/nested\\040fs rw,relatime shared:21 - lustre 10.0.0.5@tcp:/nested rw,flock
+37 22 0:35 / /lustre2 rw,relatime shared:22 - nfs4 server:/export rw
+'''
+
+
+def test_only_lustre_mounts_are_kept_and_unescaped():
+    mountTable = MountTable.from_mountinfo(MOUNTINFO)
+    assert sorted(mountTable.mountPoints) == ['/lustre', '/lustre/nested fs']
+
+
+def test_the_longest_mount_point_containing_a_path_is_found():
+    mountTable = MountTable.from_mountinfo(MOUNTINFO)
+    assert mountTable.find('/lustre/nested fs/a') == '/lustre/nested fs'
+    assert mountTable.find('/lustre/nested') == '/lustre'
+    assert mountTable.find('/lustre') == '/lustre'
+    assert mountTable.find('/lustre2/a') is None
+
+
+def test_blob_names_are_relative_to_the_mount_point():
+    mountTable = MountTable.from_mountinfo(MOUNTINFO)
+    assert get_relative_path('/lustre/project/a', mountTable) == 'project/a'
+    assert get_relative_path('/lustre/nested fs/b', mountTable) == 'b'
+    assert get_absolute_path('project/a', '/lustre') == '/lustre/project/a'